@@ -0,0 +1,215 @@
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import shlex
+import subprocess
+import sys
+import time
+import gymnasium as gym
+import numpy as np
+import gymnasium_env.envs  # ensure the custom environment is registered
+from gymnasium_env.server_pool import ServerPool
+
+STANDIN_COMMAND = f"{shlex.quote(sys.executable)} -m gymnasium_env.standin_server"
+# parts of a step timed separately by the env (profile=True, see PerfTimers): the backend call (for the http backend: the request,
+# server included, and the body decoding), the observation encoding, the reward, the info and the action masks, "other" is the rest
+# of the step (action log, occupancy grid)
+COMPONENTS = ("backend", "http", "decode", "observation", "reward", "info", "action_masks")
+
+# counts the bytes of the responses of the http backend, returns the counter
+def count_response_bytes(env: gym.Env) -> dict:
+    counter = {"response_bytes": 0}
+    transport = getattr(env.unwrapped.backend, "transport", None)
+    if transport is not None:
+        request = transport.request
+        def counted_request(*args, **kwargs):
+            response = request(*args, **kwargs)
+            counter["response_bytes"] += len(response.content)
+            return response
+        transport.request = counted_request
+    return counter
+
+# plays steps with a greedy builder: with probability build_probability (and enough money) a random tower type on its free cell
+# covering the most path cells (see rank_placements), NOOP otherwise, so that the games last and towers and enemies pile up like in training
+def run_worker(rank, backend, url, steps, warmup, frame_skip, observation_mode, state_updates, build_probability, start_states, barrier, results):
+    env = gym.make("gymnasium_env/TowerDefenseWorld-v0", backend=backend, url=url, action_mode="flat", frame_skip=frame_skip, observation_mode=observation_mode, state_updates=state_updates, profile=True)
+    rng = np.random.default_rng(rank)
+    unwrapped = env.unwrapped
+    noop_action = unwrapped.other_action_indices.index(unwrapped.noop_action_index)
+    build_actions_start = len(unwrapped.other_action_indices)
+    cells = unwrapped.map_horizontal_cells * unwrapped.map_vertical_cells
+    counter = count_response_bytes(env)
+
+    def reset():
+        options = {"start_state": start_states[rng.integers(len(start_states))]} if start_states else None
+        env.reset(options=options)
+
+    step_nanoseconds = np.empty(steps, dtype=np.int64)
+    component_nanoseconds = np.empty((steps, len(COMPONENTS) + 1), dtype=np.int64) # and the response bytes
+    entity_counts = np.empty((steps, 2), dtype=np.int64)
+    episodes = 0
+    reset()
+    for i in range(-warmup, steps):
+        if i == 0:
+            barrier.wait() # all the envs are built, measure them together
+            start = time.perf_counter()
+        unwrapped.get_perf_stats() # drops the sections timed since the last step (e.g. a reset)
+        response_bytes = counter["response_bytes"]
+        step_start = time.perf_counter_ns()
+        mask = unwrapped.action_masks() # like MaskablePPO, once per step
+        tower_types = np.flatnonzero(mask[build_actions_start:].reshape(-1, cells).any(axis=1))
+        action = noop_action
+        if len(tower_types) > 0 and rng.random() < build_probability:
+            tower_index = int(rng.choice(tower_types))
+            x, y, _ = unwrapped.rank_placements(tower_index, 1)[0]
+            action = build_actions_start + tower_index * cells + x * unwrapped.map_vertical_cells + y
+        _, _, terminated, truncated, _ = env.step(action)
+        if i >= 0:
+            step_nanoseconds[i] = time.perf_counter_ns() - step_start
+            sections = unwrapped.get_perf_stats()
+            component_nanoseconds[i, :-1] = [sections[key]["total_ns"] if key in sections else 0 for key in COMPONENTS]
+            component_nanoseconds[i, -1] = counter["response_bytes"] - response_bytes
+            entity_counts[i] = (len(unwrapped.game_state["towers"]), len(unwrapped.game_state["enemies"]))
+        if terminated or truncated:
+            episodes += 1
+            reset()
+    seconds = time.perf_counter() - start
+    env.close()
+    results.put({"rank": rank, "seconds": seconds, "episodes": episodes, "step_nanoseconds": step_nanoseconds, "component_nanoseconds": component_nanoseconds, "entity_counts": entity_counts})
+
+def distribution(values: np.ndarray, unit: float) -> dict:
+    return {"mean": float(values.mean() / unit), "p50": float(np.percentile(values, 50) / unit), "p99": float(np.percentile(values, 99) / unit)}
+
+# every env runs in its own process (like SubprocVecEnv) with its own backend, the throughput counts the steps of all of them
+def measure(num_envs, backend, urls, steps, warmup, frame_skip, observation_mode, state_updates, build_probability, start_states) -> dict:
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(num_envs)
+    results = context.Queue()
+    workers = [context.Process(target=run_worker, args=(rank, backend, urls[rank], steps, warmup, frame_skip, observation_mode, state_updates, build_probability, start_states, barrier, results)) for rank in range(num_envs)]
+    for worker in workers:
+        worker.start()
+    worker_results = []
+    while len(worker_results) < num_envs:
+        try:
+            worker_results.append(results.get(timeout=1))
+        except queue.Empty:
+            if any(worker.exitcode not in (None, 0) for worker in workers):
+                for worker in workers:
+                    worker.terminate()
+                raise RuntimeError("A benchmark worker failed (see its traceback above)")
+    for worker in workers:
+        worker.join()
+
+    step_nanoseconds = np.concatenate([r["step_nanoseconds"] for r in worker_results])
+    component_nanoseconds = np.concatenate([r["component_nanoseconds"] for r in worker_results])
+    entity_counts = np.concatenate([r["entity_counts"] for r in worker_results])
+    seconds = max(r["seconds"] for r in worker_results)
+    components = {}
+    for index, key in enumerate(COMPONENTS):
+        if key in ("http", "decode") and backend != "http":
+            continue
+        components[key] = distribution(component_nanoseconds[:, index], 1e3)
+    timed_outside_backend = component_nanoseconds[:, [COMPONENTS.index(key) for key in ("backend", "observation", "reward", "info", "action_masks")]].sum(axis=1)
+    components["other"] = distribution(step_nanoseconds - timed_outside_backend, 1e3)
+    return {
+        "envs": num_envs,
+        "steps": len(step_nanoseconds),
+        "episodes": sum(r["episodes"] for r in worker_results),
+        "seconds": seconds,
+        "steps_per_second": len(step_nanoseconds) / seconds,
+        "step_latency_ms": distribution(step_nanoseconds, 1e6),
+        "components_us": components,
+        "response_bytes_mean": float(component_nanoseconds[:, -1].mean()) if backend == "http" else None,
+        "towers_mean": float(entity_counts[:, 0].mean()),
+        "enemies_mean": float(entity_counts[:, 1].mean()),
+    }
+
+def report(result: dict, baseline: dict | None) -> None:
+    latency = result["step_latency_ms"]
+    line = f"{result['envs']:>3} env(s)  {result['steps_per_second']:>9,.0f} steps/s  p50 {latency['p50']:.3f} ms  p99 {latency['p99']:.3f} ms"
+    if baseline is not None:
+        line += f"  ({result['steps_per_second'] / baseline['steps_per_second'] - 1:+.1%} steps/s vs baseline)"
+    print(line)
+    print("          " + "  ".join(f"{key} {value['mean']:.0f}/{value['p99']:.0f} us" for key, value in result["components_us"].items()) + "  (mean/p99)")
+    entities = f"          towers {result['towers_mean']:.1f}  enemies {result['enemies_mean']:.1f}"
+    if result["response_bytes_mean"] is not None:
+        entities += f"  response {result['response_bytes_mean']:,.0f} B/step"
+    print(entities)
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(envs, backend, steps, warmup, frame_skip, observation_mode, state_updates, build_probability, start_states_path, server_command, server_dir, base_port, output, baseline_path):
+    """
+    Steps per second and step latency (with its breakdown) of 1 to N envs stepping in parallel, saved as json to compare commits.
+    """
+    start_states = None
+    if start_states_path:
+        with open(start_states_path, "r") as f:
+            start_states = json.load(f) # game snapshots (see capture_start_states.py), for late game entity counts
+
+    baseline = None
+    if baseline_path:
+        with open(baseline_path, "r") as f:
+            baseline = {result["envs"]: result for result in json.load(f)["results"]}
+
+    server_pool = None
+    urls = [None] * max(envs)
+    if backend == "http":
+        server_pool = ServerPool(shlex.split(server_command), max(envs), base_port=base_port, cwd=server_dir)
+        urls = server_pool.start()
+
+    results = []
+    try:
+        for num_envs in envs:
+            result = measure(num_envs, backend, urls, steps, warmup, frame_skip, observation_mode, state_updates, build_probability, start_states)
+            report(result, baseline.get(num_envs) if baseline else None)
+            results.append(result)
+    finally:
+        if server_pool:
+            server_pool.close()
+
+    commit = git_commit()
+    run = {
+        "benchmark": "env_throughput",
+        "commit": commit,
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpu_count": os.cpu_count()},
+        "config": {"backend": backend, "server_command": server_command if backend == "http" else None, "steps": steps, "warmup": warmup, "frame_skip": frame_skip, "observation_mode": observation_mode, "state_updates": state_updates, "build_probability": build_probability, "start_states": start_states_path},
+        "results": results,
+    }
+    if output is None:
+        output = os.path.join("benchmarks", "results", f"env_throughput_{backend}_{(commit or 'unknown')[:8]}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"Results saved to {output}")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Measure the env throughput and where the time of a step goes, against stand-in game servers or the local simulator.")
+    parser.add_argument("--envs", type=int, nargs="+", default=[1, 2, 4], help="Optional. Numbers of envs stepping in parallel (one process and one server each).")
+    parser.add_argument("--backend", choices=["http", "local"], default="http", help="Optional. Game backend of the envs.")
+    parser.add_argument("--steps", type=int, default=2000, help="Optional. Steps measured per env.")
+    parser.add_argument("--warmup", type=int, default=100, help="Optional. Steps played per env before measuring.")
+    parser.add_argument("--frame-skip", type=int, default=1, help="Optional. Game ticks advanced by each step.")
+    parser.add_argument("--observation-mode", choices=["flat", "entities", "grid"], default="flat", help="Optional. Observation mode of the envs.")
+    parser.add_argument("--state-updates", choices=["full", "delta"], default="full", help="Optional. Whole game states or deltas patched into a mirror (see state_delta.py).")
+    parser.add_argument("--build-probability", type=float, default=0.05, help="Optional. Probability of building a random legal tower at each step.")
+    parser.add_argument("--start-states", help="Optional. JSON file of game snapshots (see capture_start_states.py) the episodes start from, for late game entity counts.")
+    parser.add_argument("--server-command", default=STANDIN_COMMAND, help="Optional. Command starting one game server (port given by the PORT variable or '{port}'), the stand-in server by default.")
+    parser.add_argument("--server-dir", help="Optional. Working directory of the game server command.")
+    parser.add_argument("--base-port", type=int, default=3900, help="Optional. Port of the first game server.")
+    parser.add_argument("--output", help="Optional. Path of the results JSON file (default: benchmarks/results/env_throughput_<backend>_<commit>.json).")
+    parser.add_argument("--baseline", help="Optional. Results JSON file of a previous run to compare with.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args.envs, args.backend, args.steps, args.warmup, args.frame_skip, args.observation_mode, args.state_updates, args.build_probability, args.start_states, args.server_command, args.server_dir, args.base_port, args.output, args.baseline)
@@ -0,0 +1,95 @@
+import argparse
+import time
+import numpy as np
+from gymnasium_env.envs.local_game import default_game_info
+from gymnasium_env.envs.observation import ObservationEncoder
+
+# the per-entity loop encoder ObservationEncoder replaced, kept as the reference for the output
+def legacy_encode(game_info: dict, encoder: ObservationEncoder, game_state: dict) -> np.ndarray:
+    tower_types = game_info["towers"]
+    tower_type_to_index = {tower["type"]: idx for idx, tower in enumerate(tower_types)}
+    enemy_type_to_index = {enemy_type: idx for idx, enemy_type in enumerate(game_info["waves"]["enemy_types"])}
+    max_tower_dps = max(tower["dps"] for tower in tower_types)
+    observation = np.zeros(encoder.size, dtype=np.float32)
+
+    observation[0] = game_state["gameTime"] / game_info["max_global_info"]["gameTime"]
+    observation[1] = game_state["waveNumber"] / game_info["max_global_info"]["waveNumber"]
+    observation[2] = game_state["money"] / game_info["max_global_info"]["money"]
+    observation[3] = game_state["lives"] / game_info["max_global_info"]["lives"]
+    observation[4] = game_state["gameOver"]
+    observation[5:5+len(encoder.path_cells)] = encoder.path_cells
+
+    for idx, tower in enumerate(game_state["towers"]):
+        offset = encoder.global_feature_count + idx * encoder.features_per_tower
+        observation[offset] = 1
+        observation[offset+1] = tower["position"]["x"] / game_info["map"]["width"]
+        observation[offset+2] = tower["position"]["y"] / game_info["map"]["height"]
+        observation[offset+3] = tower["attackCooldown"] / game_info["slower_tower_sample"]["attackCooldown"]
+        observation[offset+4] = tower_types[tower_type_to_index[tower["type"]]]["dps"] / max_tower_dps
+        observation[offset+5+tower_type_to_index[tower["type"]]] = 1
+
+    for idx, enemy in enumerate(game_state["enemies"]):
+        offset = encoder.global_feature_count + encoder.tower_feature_count + idx * encoder.features_per_enemy
+        observation[offset] = 1
+        observation[offset+1] = enemy["position"]["x"] / game_info["map"]["width"]
+        observation[offset+2] = enemy["position"]["y"] / game_info["map"]["height"]
+        observation[offset+3] = enemy["currentHealth"] / enemy["fullHealth"]
+        observation[offset+4] = enemy["pathProgress"]
+        observation[offset+5+enemy_type_to_index[enemy["type"]]] = 1
+
+    return observation
+
+def random_state(game_info: dict, rng: np.random.Generator, tower_count: int, enemy_count: int) -> dict:
+    cell_size = game_info["map"]["cell_size"]
+    cells_x = game_info["map"]["width"] // cell_size
+    cells_y = game_info["map"]["height"] // cell_size
+    tower_types = [tower["type"] for tower in game_info["towers"]]
+    enemy_types = game_info["waves"]["enemy_types"]
+    return {
+        "gameTime": float(rng.uniform(0, 600)),
+        "waveNumber": int(rng.integers(0, 30)),
+        "money": int(rng.integers(0, 1000)),
+        "lives": int(rng.integers(0, 20)),
+        "gameOver": bool(rng.random() < 0.01),
+        "towers": [
+            {"type": str(rng.choice(tower_types)), "position": {"x": cell_size/2 + cell_size*int(rng.integers(cells_x)), "y": cell_size/2 + cell_size*int(rng.integers(cells_y))}, "attackCooldown": float(rng.uniform(0, 2))}
+            for _ in range(tower_count)
+        ],
+        "enemies": [
+            {"type": str(rng.choice(enemy_types)), "position": {"x": float(rng.uniform(0, 900)), "y": float(rng.uniform(0, 600))}, "currentHealth": float(rng.uniform(1, 300)), "fullHealth": 300, "pathProgress": float(rng.random())}
+            for _ in range(enemy_count)
+        ],
+    }
+
+def main(states, towers, enemies):
+    """
+    Checks that ObservationEncoder matches the loop encoder bit for bit and compares their throughput.
+    """
+    game_info = default_game_info()
+    encoder = ObservationEncoder(game_info, [0.5] * 100, max_towers=200, max_enemies=100)
+    rng = np.random.default_rng(0)
+    # entity counts vary between consecutive states so that slot clearing is exercised too
+    game_states = [random_state(game_info, rng, int(rng.integers(0, towers + 1)), int(rng.integers(0, enemies + 1))) for _ in range(states)]
+
+    for game_state in game_states:
+        if encoder.encode(game_state).tobytes() != legacy_encode(game_info, encoder, game_state).tobytes():
+            raise AssertionError("ObservationEncoder output differs from the loop encoder")
+    print(f"Bit-identical on {states} states (up to {towers} towers, {enemies} enemies).")
+
+    for name, encode in (("loop encoder", lambda s: legacy_encode(game_info, encoder, s)), ("ObservationEncoder", encoder.encode)):
+        start = time.perf_counter()
+        for game_state in game_states:
+            encode(game_state)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<20} {states/elapsed:,.0f} observations/s ({elapsed/states*1e6:.1f} us each)")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark the observation encoder against the per-entity loop version.")
+    parser.add_argument("--states", type=int, default=5000, help="Optional. Number of random game states.")
+    parser.add_argument("--towers", type=int, default=150, help="Optional. Maximum towers per state.")
+    parser.add_argument("--enemies", type=int, default=80, help="Optional. Maximum enemies per state.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args.states, args.towers, args.enemies)
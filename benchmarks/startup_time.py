@@ -0,0 +1,94 @@
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+import gymnasium as gym
+import gymnasium_env.envs  # ensure the custom environment is registered
+from gymnasium_env.envs.info_cache import info_cache_options
+from gymnasium_env.envs.local_game import DEFAULT_MAP_WAYPOINTS
+from gymnasium_env.envs.transport import HttpTransport
+from gymnasium_env.server_pool import ServerPool
+
+MODULES = ("gymnasium_env.envs", "gymnasium_env.envs.tower_defense_world", "replay_actions", "evaluate", "train")
+
+# seconds to import module in a new interpreter, less the time of an interpreter importing nothing (best of repeats)
+def import_time(module: str, repeats: int) -> float:
+    def run(code: str) -> float:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True)
+        return time.perf_counter() - start
+    return min(run(f"import {module}") for _ in range(repeats)) - min(run("pass") for _ in range(repeats))
+
+# counts the http requests of the backends (every request goes through HttpTransport.request)
+def count_requests() -> dict:
+    counter = {"requests": 0}
+    request = HttpTransport.request
+    def counted_request(self, *args, **kwargs):
+        counter["requests"] += 1
+        return request(self, *args, **kwargs)
+    HttpTransport.request = counted_request
+    return counter
+
+# builds an env with the maps registered, returns it with the seconds and the requests it took
+def build_env(url: str, map_list: list[dict], backend_options: dict | None, counter: dict):
+    requests_before = counter["requests"]
+    start = time.perf_counter()
+    env = gym.make("gymnasium_env/TowerDefenseWorld-v0", url=url, backend_options=backend_options)
+    if map_list:
+        env.unwrapped.register_maps(map_list)
+    return env, time.perf_counter() - start, counter["requests"] - requests_before
+
+def main(maps_path, repeats, port):
+    """
+    Measures the startup of the scripts and envs: the import time of the entry points in a new interpreter, and the time and
+    requests to build an http env and register the maps of maps_path on a stand-in server, without the info cache, with an
+    empty cache (filled by the env) and with the cache filled (only the request setting the first map on the server).
+    """
+    for module in MODULES:
+        try:
+            print(f"import {module:<40} {import_time(module, repeats) * 1000:7.1f} ms")
+        except subprocess.CalledProcessError:
+            print(f"import {module:<40} failed (missing dependency?)")
+
+    map_list = []
+    if maps_path:
+        with open(maps_path, "r") as f:
+            map_list = json.load(f)
+    counter = count_requests()
+    with ServerPool([sys.executable, "-m", "gymnasium_env.standin_server"], 1, base_port=port) as urls, tempfile.TemporaryDirectory() as cache_dir:
+        url = urls[0]
+        gym.make("gymnasium_env/TowerDefenseWorldLocal-v0").close() # imports the env modules before the measures
+        reference = None
+        runs = [
+            ("no cache", lambda: None),
+            ("empty cache", lambda: {"info_cache": tempfile.mkdtemp(dir=cache_dir)}),
+            ("filled cache", lambda: info_cache_options(cache_dir, url)),
+        ]
+        for name, backend_options in runs:
+            times, requests = [], []
+            for repeat in range(repeats + 1): # the first build is not measured (it fills the cache of the filled cache run)
+                options = backend_options() # the version asked by info_cache_options is asked once per run, not counted
+                env, seconds, request_count = build_env(url, map_list, options, counter)
+                if repeat > 0:
+                    times.append(seconds)
+                    requests.append(request_count)
+                if reference is None:
+                    reference = (env.unwrapped.game_info, env.observation_space)
+                elif (env.unwrapped.game_info, env.observation_space) != reference:
+                    raise AssertionError(f"The env built with {name} differs from the one built without cache")
+                env.unwrapped.backend.set_map(DEFAULT_MAP_WAYPOINTS) # the next env finds the server on the default map
+                env.close()
+            print(f"env + {len(map_list)} maps, {name:<14} {min(times) * 1000:7.1f} ms (best of {repeats})  {max(requests)} requests")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Measure the import time of the entry points and the env startup with and without the info cache.")
+    parser.add_argument("--maps", default="custom-maps.json", help="Optional. Maps registered by the envs ('' for none).")
+    parser.add_argument("--repeats", type=int, default=5, help="Optional. Measures per import and env setting.")
+    parser.add_argument("--port", type=int, default=3900, help="Optional. Port of the stand-in server.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args.maps, args.repeats, args.port)
@@ -0,0 +1,76 @@
+import argparse
+import json
+import time
+import numpy as np
+from benchmarks.observation_encoding import random_state
+from gymnasium_env.envs.backends import tick_summary
+from gymnasium_env.envs.game_state import GameStateDecoder, msgspec, orjson, msgpack
+from gymnasium_env.envs.local_game import default_game_info
+from gymnasium_env.envs.observation import ObservationEncoder
+
+# the dict path the env used before GameState: parse the body into dicts, encode the observation from them and read the
+# tower counts and the tick summary of the reward from the dicts
+def dict_step(body: bytes, is_msgpack: bool, encoder: ObservationEncoder, tower_names: list[str]) -> np.ndarray:
+    game_state = msgpack.unpackb(body) if is_msgpack else json.loads(body)
+    observation = encoder.encode(game_state)
+    tower_counts = {name: 0 for name in tower_names}
+    for tower in game_state["towers"]:
+        tower_counts[tower["type"]] += 1
+    tick_summary(game_state)
+    return observation
+
+# the same with the typed decoder (see game_state.py)
+def typed_step(body: bytes, is_msgpack: bool, encoder: ObservationEncoder, decoder: GameStateDecoder) -> np.ndarray:
+    game_state = decoder.decode(body, is_msgpack)
+    observation = encoder.encode_state(game_state)
+    game_state.towers.type_counts()
+    game_state.summary()
+    return observation
+
+def main(states, towers, enemies):
+    """
+    Checks that the GameState path gives the observations of the dict path bit for bit and compares the time to decode
+    a game state body and encode its observation, for json and msgpack bodies and each installed parser.
+    """
+    game_info = default_game_info()
+    tower_names = [tower["type"] for tower in game_info["towers"]]
+    dict_encoder = ObservationEncoder(game_info, [0.5] * 100, max_towers=200, max_enemies=100)
+    typed_encoder = ObservationEncoder(game_info, [0.5] * 100, max_towers=200, max_enemies=100)
+    rng = np.random.default_rng(0)
+    game_states = [random_state(game_info, rng, int(rng.integers(0, towers + 1)), int(rng.integers(0, enemies + 1))) for _ in range(states)]
+
+    encodings = {"json": [json.dumps(game_state).encode() for game_state in game_states]}
+    if msgpack is not None:
+        encodings["msgpack"] = [msgpack.packb(game_state) for game_state in game_states]
+    parsers = [parser for parser, module in (("msgspec", msgspec), ("orjson", orjson), ("json", True)) if module is not None]
+    print(f"{states} states (up to {towers} towers, {enemies} enemies), mean body {np.mean([len(body) for body in encodings['json']]) / 1024:.1f} kB (json)")
+
+    for encoding, bodies in encodings.items():
+        is_msgpack = encoding == "msgpack"
+        # without msgspec the msgpack bodies are parsed by the msgpack package whatever the json parser
+        decoders = {parser if not is_msgpack or parser == "msgspec" else "msgpack": GameStateDecoder(game_info, parser) for parser in parsers}
+        for name, decoder in decoders.items():
+            for body in bodies:
+                if typed_step(body, is_msgpack, typed_encoder, decoder).tobytes() != dict_step(body, is_msgpack, dict_encoder, tower_names).tobytes():
+                    raise AssertionError(f"GameState observation ({encoding}, {name}) differs from the dict path")
+
+        runs = [("dicts", lambda body: dict_step(body, is_msgpack, dict_encoder, tower_names))]
+        runs += [(f"GameState ({name})", lambda body, decoder=decoder: typed_step(body, is_msgpack, typed_encoder, decoder)) for name, decoder in decoders.items()]
+        for name, step in runs:
+            start = time.perf_counter()
+            for body in bodies:
+                step(body)
+            elapsed = time.perf_counter() - start
+            print(f"{encoding:<8} {name:<22} {elapsed/states*1e6:7.1f} us per state (decode + observation)")
+    print("Bit-identical observations.")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark the typed game state decoder against the dict path (decode + observation).")
+    parser.add_argument("--states", type=int, default=3000, help="Optional. Number of random game states.")
+    parser.add_argument("--towers", type=int, default=100, help="Optional. Maximum towers per state.")
+    parser.add_argument("--enemies", type=int, default=60, help="Optional. Maximum enemies per state.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args.states, args.towers, args.enemies)
@@ -0,0 +1,50 @@
+import argparse
+import sys
+import time
+import numpy as np
+import requests
+from gymnasium_env.envs.transport import HttpTransport, msgpack
+from gymnasium_env.server_pool import ServerPool
+
+NOOP = {"type": "NOOP"}
+
+def measure(step, steps: int) -> np.ndarray:
+    latencies = np.empty(steps)
+    for i in range(steps):
+        start = time.perf_counter()
+        step()
+        latencies[i] = time.perf_counter() - start
+    return latencies * 1000
+
+def report(name: str, latencies: np.ndarray) -> None:
+    print(f"{name:<28} mean {latencies.mean():.3f} ms  p50 {np.percentile(latencies, 50):.3f} ms  p99 {np.percentile(latencies, 99):.3f} ms")
+
+def main(steps, port):
+    """
+    Per-step latency of a NOOP /step on a stand-in server: bare requests calls vs the keep-alive transport.
+    """
+    with ServerPool([sys.executable, "-m", "gymnasium_env.standin_server"], 1, base_port=port) as urls:
+        url = urls[0]
+
+        def bare_step():
+            response = requests.post(url + "step", json=NOOP)
+            return response.json()
+        requests.post(url + "reset")
+        report("requests.post (new conn.)", measure(bare_step, steps))
+
+        encodings = ["json", "msgpack"] if msgpack is not None else ["json"]
+        for encoding in encodings:
+            transport = HttpTransport(url, encoding=encoding)
+            transport.post("reset")
+            report(f"HttpTransport ({encoding})", measure(lambda: transport.decode(transport.post("step", NOOP)), steps))
+            transport.close()
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Compare the per-step latency of the HTTP transports against a stand-in game server.")
+    parser.add_argument("--steps", type=int, default=2000, help="Optional. Steps measured per transport.")
+    parser.add_argument("--port", type=int, default=3900, help="Optional. Port of the stand-in server.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args.steps, args.port)
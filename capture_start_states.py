@@ -0,0 +1,43 @@
+import argparse
+import json
+from gymnasium_env.envs.action_log import load_episode_actions
+from gymnasium_env.envs.backends import HttpBackend, LocalBackend
+from gymnasium_env.envs.local_game import DEFAULT_MAP_WAYPOINTS
+
+def main(actions_file, output, min_wave, local):
+    """
+    Replays a recorded episode and saves a game snapshot at the start of each wave from min_wave, as start states for training.
+    """
+    data = load_episode_actions(actions_file)
+    backend = LocalBackend() if local else HttpBackend()
+    backend.set_map(DEFAULT_MAP_WAYPOINTS)
+    game_state = backend.reset()
+
+    start_states = []
+    wave_number = game_state["waveNumber"]
+    for action in data["actions"]:
+        new_game_state = backend.step(action)
+        if new_game_state is None: # illegal action, skipped by the game too
+            continue
+        if new_game_state["gameOver"]:
+            break
+        if new_game_state["waveNumber"] > wave_number and new_game_state["waveNumber"] >= min_wave:
+            start_states.append(backend.snapshot())
+        wave_number = new_game_state["waveNumber"]
+    backend.close()
+
+    with open(output, "w") as f:
+        json.dump(start_states, f)
+    print(f"Saved {len(start_states)} start states (waves {min_wave} to {wave_number}) to {output}")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Capture game snapshots from a recorded episode, to start training episodes from them.")
+    parser.add_argument("--actions-file", required=True, help="Path to the JSON or NPZ actions file (e.g. best_episode_actions.json).")
+    parser.add_argument("--output", default="start_states.json", help="Optional. Path of the start states JSON file.")
+    parser.add_argument("--min-wave", type=int, default=5, help="Optional. First wave captured.")
+    parser.add_argument("--local", action="store_true", help="Optional. Replay on the in-process game simulator (estimated rules, not checked against the game server) instead of the game server.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args.actions_file, args.output, args.min_wave, args.local)
\ No newline at end of file
@@ -0,0 +1,100 @@
+import argparse
+import gzip
+import json
+import math
+import sys
+from gymnasium_env.envs.action_log import load_episode_actions
+from gymnasium_env.envs.backends import HttpBackend, LocalBackend
+from gymnasium_env.envs.local_game import DEFAULT_MAP_WAYPOINTS
+
+TOLERANCE = 1e-3 # floats (positions, health, progress, cooldowns) are compared with this absolute tolerance
+
+def compare_values(path: str, server_value, local_value, mismatches: list[str]) -> None:
+    if isinstance(server_value, dict) and isinstance(local_value, dict):
+        for key in server_value:
+            if key not in local_value:
+                mismatches.append(f"{path}.{key}: missing in local state")
+                continue
+            compare_values(f"{path}.{key}", server_value[key], local_value[key], mismatches)
+    elif isinstance(server_value, list) and isinstance(local_value, list):
+        if len(server_value) != len(local_value):
+            mismatches.append(f"{path}: length {len(server_value)} (server) != {len(local_value)} (local)")
+        for i, (s, l) in enumerate(zip(server_value, local_value)):
+            compare_values(f"{path}[{i}]", s, l, mismatches)
+    elif isinstance(server_value, (int, float)) and isinstance(local_value, (int, float)) and not isinstance(server_value, bool):
+        if not math.isclose(server_value, local_value, abs_tol=TOLERANCE):
+            mismatches.append(f"{path}: {server_value} (server) != {local_value} (local)")
+    elif server_value != local_value:
+        mismatches.append(f"{path}: {server_value} (server) != {local_value} (local)")
+
+# game states of the server along a list of actions (None for the actions it refused), to replay on the local game later
+# {"source": url, "game_info", "waypoints", "reset": state, "steps": [{"action", "state"}]}
+def record_trajectory(server: HttpBackend, actions: list[dict], waypoints: list[dict] = DEFAULT_MAP_WAYPOINTS) -> dict:
+    server.set_map(waypoints)
+    trajectory = {"source": server.url, "game_info": server.info(), "waypoints": waypoints, "reset": server.reset(), "steps": []}
+    for action in actions:
+        trajectory["steps"].append({"action": action, "state": server.step(action)})
+    return trajectory
+
+# plays the actions of a trajectory on the local game (with the info of the server it was recorded on), returns where the states differ
+def replay_trajectory(trajectory: dict, rules: dict | str | None = None) -> list[str]:
+    local = LocalBackend(trajectory["game_info"], rules=rules)
+    local.set_map(trajectory["waypoints"])
+    mismatches = []
+    compare_values("reset", trajectory["reset"], local.reset(), mismatches)
+    for i, step in enumerate(trajectory["steps"]):
+        server_state = step["state"]
+        local_state = local.step(step["action"])
+        if (server_state is None) != (local_state is None):
+            mismatches.append(f"step {i}: action {step['action']} accepted by only one backend (server: {server_state is not None}, local: {local_state is not None})")
+        elif server_state is not None:
+            compare_values(f"step {i}", server_state, local_state, mismatches)
+    return mismatches
+
+# trajectory files are json, gzip compressed when the path ends with .gz
+def save_trajectory(path: str, trajectory: dict) -> None:
+    with (gzip.open(path, "wt") if path.endswith(".gz") else open(path, "w")) as f:
+        json.dump(trajectory, f)
+
+def load_trajectory(path: str) -> dict:
+    with (gzip.open(path, "rt") if path.endswith(".gz") else open(path, "r")) as f:
+        return json.load(f)
+
+def main(actions_file, trajectory_file, save_path, rules, max_reported):
+    """
+    Replays a recorded action log on the game server, then on the local simulator (with the towers, waves and limits of the
+    server and the rules of the rules file, the estimates of local_game.py otherwise) and reports where the game states differ.
+    The server states can be saved as a trajectory file (e.g. in tests/trajectories, which the tests replay) and compared again
+    later without the server.
+    """
+    if trajectory_file:
+        trajectory = load_trajectory(trajectory_file)
+    else:
+        server = HttpBackend()
+        try:
+            trajectory = record_trajectory(server, load_episode_actions(actions_file)["actions"])
+        finally:
+            server.close()
+    if save_path:
+        save_trajectory(save_path, trajectory)
+        print(f"Trajectory saved to {save_path}")
+
+    mismatches = replay_trajectory(trajectory, rules)
+    for mismatch in mismatches[:max_reported]:
+        print(mismatch)
+    print(f"Replayed {len(trajectory['steps'])} actions, {len(mismatches)} mismatches.")
+    return 1 if mismatches else 0
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Check that the local simulator matches the game server on a recorded episode.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--actions-file", help="Path to the JSON or NPZ actions file (e.g. best_episode_actions.json), replayed on the server.")
+    source.add_argument("--trajectory", help="Path to a trajectory file saved by --save-trajectory, compared without the server.")
+    parser.add_argument("--save-trajectory", help="Optional. Path to save the server states to (.json or .json.gz).")
+    parser.add_argument("--rules", help="Optional. JSON file with the game rules /info does not give (see local_game.py, estimates by default).")
+    parser.add_argument("--max-reported", type=int, default=50, help="Optional. Maximum number of mismatches printed.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    sys.exit(main(args.actions_file, args.trajectory, args.save_trajectory, args.rules, args.max_reported))
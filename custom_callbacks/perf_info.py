@@ -0,0 +1,49 @@
+import time
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.vec_env import SubprocVecEnv
+from gymnasium_env.envs.perf import merge_perf_stats, histogram_quantile
+
+PERF_QUANTILES = (0.5, 0.99)
+
+# logs the timers of the envs (TowerDefenseWorldEnv(profile=True), see perf.py) under perf/*, merged over every env once per rollout,
+# with the share of the wall time spent in the env steps and in the learner update since the previous rollout
+class PerfInfoCallback(BaseCallback):
+    def __init__(self, verbose=0):
+        super().__init__(verbose)
+        self.rollout_start = None
+        self.previous_rollout_end = None
+        self.learner_seconds = 0.0 # update between the previous rollout and the current one
+
+    def _on_rollout_start(self) -> None:
+        self.rollout_start = time.perf_counter()
+        if self.previous_rollout_end is not None:
+            self.learner_seconds = self.rollout_start - self.previous_rollout_end
+
+    def _on_step(self) -> bool:
+        return True
+
+    def _on_rollout_end(self) -> None:
+        now = time.perf_counter()
+        rollout_seconds = now - self.rollout_start
+        wall_seconds = now - (self.previous_rollout_end if self.previous_rollout_end is not None else self.rollout_start)
+        self.previous_rollout_end = now
+        self.logger.record("perf/rollout_seconds", rollout_seconds)
+        self.logger.record("perf/learner_seconds", self.learner_seconds)
+        self.logger.record("perf/learner_wall_fraction", self.learner_seconds / wall_seconds)
+
+        all_stats = [stats for stats in self.training_env.env_method("get_perf_stats") if stats is not None]
+        if not all_stats: # envs built without profile=True
+            return
+        stats = merge_perf_stats(all_stats)
+        for name, section in stats.items():
+            if section["count"] == 0:
+                continue
+            self.logger.record(f"perf/{name}_mean_us", section["total_ns"] / section["count"] / 1e3)
+            for p in PERF_QUANTILES:
+                self.logger.record(f"perf/{name}_p{round(p*100)}_us", histogram_quantile(section["histogram"], p) / 1e3)
+        if "step" in stats:
+            # subprocess envs step at the same time, the others one after the other
+            env_seconds = stats["step"]["total_ns"] / 1e9
+            if isinstance(self.training_env.unwrapped, SubprocVecEnv):
+                env_seconds /= len(all_stats)
+            self.logger.record("perf/env_wall_fraction", env_seconds / wall_seconds)
@@ -0,0 +1,78 @@
+import math
+from bisect import bisect_right, insort
+
+# streaming quantile estimate in constant memory (P² algorithm, Jain & Chlamtac 1985): five markers track
+# the minimum, p/2, p, (1+p)/2 quantiles and the maximum, their heights are adjusted with a parabolic interpolation
+class P2Quantile:
+    def __init__(self, p: float):
+        self.p = p
+        self.count = 0
+        self.heights = [] # the first 5 values (sorted), then the marker heights
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired_positions = [1, 1 + 2*p, 1 + 4*p, 3 + 2*p, 5]
+        self.increments = [0, p/2, p, (1 + p)/2, 1]
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if self.count <= 5:
+            insort(self.heights, value)
+            return
+
+        q = self.heights
+        n = self.positions
+        if value < q[0]:
+            q[0] = value
+            k = 0
+        elif value >= q[4]:
+            q[4] = value
+            k = 3
+        else:
+            k = bisect_right(q, value) - 1 # q[k] <= value < q[k+1]
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired_positions[i] += self.increments[i]
+
+        for i in range(1, 4):
+            d = self.desired_positions[i] - n[i]
+            if (d >= 1 and n[i+1] - n[i] > 1) or (d <= -1 and n[i-1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = q[i] + d / (n[i+1] - n[i-1]) * ((n[i] - n[i-1] + d) * (q[i+1] - q[i]) / (n[i+1] - n[i]) + (n[i+1] - n[i] - d) * (q[i] - q[i-1]) / (n[i] - n[i-1]))
+                if not q[i-1] < height < q[i+1]: # parabolic estimate out of order, linear one instead
+                    height = q[i] + d * (q[i+d] - q[i]) / (n[i+d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def value(self) -> float:
+        if self.count == 0:
+            return math.nan
+        if self.count <= 5: # exact, interpolated between the sorted values
+            position = self.p * (self.count - 1)
+            lower = math.floor(position)
+            upper = min(lower + 1, self.count - 1)
+            return self.heights[lower] + (position - lower) * (self.heights[upper] - self.heights[lower])
+        return self.heights[2]
+
+# count, mean, min, max and a few quantiles of a stream of values, in constant memory
+class RunningStats:
+    def __init__(self, quantiles: tuple[float, ...] = ()):
+        self.quantile_levels = quantiles
+        self.reset()
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.mean += (value - self.mean) / self.count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        for quantile in self.quantiles.values():
+            quantile.add(value)
+
+    def quantile(self, p: float) -> float:
+        return self.quantiles[p].value()
+
+    def reset(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.quantiles = {p: P2Quantile(p) for p in self.quantile_levels}
@@ -1,29 +1,45 @@
 from stable_baselines3.common.callbacks import BaseCallback
-from copy import deepcopy
+import heapq
+import itertools
+import numpy as np
 
+# keeps the top_k episodes (most waves reached, the earliest first on ties) of each map, from every env
 class SaveAgentActionsCallback(BaseCallback):
-    def __init__(self, verbose=0):
+    def __init__(self, top_k=1, verbose=0):
         super().__init__(verbose)
-        self.best_agent_performance = {
-            "game_time": -1,
-            "wave_number": -1,
-            "actions": []
-        }
+        self.top_k = top_k
+        self.top_episodes = {} # map name -> min-heap of (wave number, -episode order, performance)
+        self.episode_order = itertools.count()
 
     def _on_step(self) -> bool:
-        if self.locals["dones"][0]: # only at the end of an episode
-            info = self.locals["infos"][0]
+        infos = self.locals["infos"]
+        for env_index in np.flatnonzero(self.locals["dones"]): # only at the end of an episode
+            info = infos[env_index]
             if "game_time" in info and "wave_number" in info and "episode_actions" in info:
-                game_time = info["game_time"]
                 wave_number = info["wave_number"]
-                episode_actions = info["episode_actions"]
-                # check if this episode is better
-                if wave_number > self.best_agent_performance["wave_number"]:
-                    self.best_agent_performance["game_time"] = game_time
-                    self.best_agent_performance["wave_number"] = wave_number
-                    self.best_agent_performance["actions"] = deepcopy(episode_actions)
+                top = self.top_episodes.setdefault(info.get("map_name", "default"), [])
+                # check if this episode is better than the worst kept one
+                if len(top) < self.top_k or wave_number > top[0][0]:
+                    performance = {
+                        "game_time": info["game_time"],
+                        "wave_number": wave_number,
+                        "actions": info["episode_actions"] # read-only, the env logs the next episode in a new array
+                    }
+                    entry = (wave_number, -next(self.episode_order), performance)
+                    if len(top) < self.top_k:
+                        heapq.heappush(top, entry)
+                    else:
+                        heapq.heapreplace(top, entry)
 
         return True
 
-    def get_best_agent_performance(self):
-        return self.best_agent_performance
\ No newline at end of file
+    # map name -> best episodes on the map, the best first
+    def get_top_agent_performances(self) -> dict[str, list[dict]]:
+        return {map_name: [performance for _, _, performance in sorted(top, reverse=True)] for map_name, top in self.top_episodes.items()}
+
+    # best episode over all maps ("actions" are raw action log rows, see TowerDefenseWorldEnv.decode_actions)
+    def get_best_agent_performance(self) -> dict:
+        best = max((entry for top in self.top_episodes.values() for entry in top), default=None, key=lambda entry: entry[:2])
+        if best is None:
+            return {"game_time": -1, "wave_number": -1, "actions": np.zeros((0, 4), dtype=np.int16)}
+        return best[2]
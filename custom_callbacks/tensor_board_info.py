@@ -1,33 +1,51 @@
 from stable_baselines3.common.callbacks import BaseCallback
 import numpy as np
+from custom_callbacks.running_stats import RunningStats
 
+WAVE_NUMBER_QUANTILES = (0.5, 0.9)
+
+# logs the wave number and tower counts of the episodes finished by any env, aggregated in constant memory over each rollout
 class TensorboardInfoCallback(BaseCallback):
     def __init__(self, verbose=0):
         super().__init__(verbose)
-        self.episode_wave_numbers = []
+        self.episode_wave_numbers = RunningStats(WAVE_NUMBER_QUANTILES)
         self.episode_tower_counts = {}
+        self.video_frames = 0
+        self.video_dropped_frames = 0
+        self.video_capture_seconds = 0.0
 
     def _on_step(self) -> bool:
-        if self.locals["dones"][0]: # only at the end of an episode
-            info = self.locals["infos"][0]
-            if "wave_number" in info:
-                self.episode_wave_numbers.append(info["wave_number"])
-            if "tower_counts" in info:
+        infos = self.locals["infos"]
+        for env_index in np.flatnonzero(self.locals["dones"]): # only at the end of an episode
+            info = infos[env_index]
+            if "wave_number" in info and not info.get("start_state"): # episodes started from a snapshot are not comparable
+                self.episode_wave_numbers.add(info["wave_number"])
+            if "tower_counts" in info and not info.get("start_state"):
                 for tower_type, count in info["tower_counts"].items():
                     if tower_type not in self.episode_tower_counts:
-                        self.episode_tower_counts[tower_type] = [] # initialize list if not present
-                    self.episode_tower_counts[tower_type].append(count)
+                        self.episode_tower_counts[tower_type] = RunningStats() # initialize stats if not present
+                    self.episode_tower_counts[tower_type].add(count)
+            if "video_recording" in info: # recorded episode (see AsyncRecordVideo)
+                self.video_frames += info["video_recording"]["frames"]
+                self.video_dropped_frames += info["video_recording"]["dropped_frames"]
+                self.video_capture_seconds += info["video_recording"]["capture_seconds"]
         return True
     
     def _on_rollout_end(self) -> None: # default rollout is 2048 steps, so ~205 seconds in game time
-        # log the mean wave number if we have data
-        if len(self.episode_wave_numbers) > 0:
-            mean_wave_number = np.mean(self.episode_wave_numbers)
-            self.logger.record("rollout/custom/ep_wave_number_mean", mean_wave_number)
-            self.episode_wave_numbers.clear()
+        # log the wave number stats if we have data
+        if self.episode_wave_numbers.count > 0:
+            self.logger.record("rollout/custom/ep_wave_number_mean", self.episode_wave_numbers.mean)
+            self.logger.record("rollout/custom/ep_wave_number_max", self.episode_wave_numbers.max)
+            for p in WAVE_NUMBER_QUANTILES:
+                self.logger.record(f"rollout/custom/ep_wave_number_p{round(p*100)}", self.episode_wave_numbers.quantile(p))
+            self.episode_wave_numbers.reset()
         # log the mean tower counts for each type
         for tower_type, counts in self.episode_tower_counts.items():
-            if len(counts) > 0:
-                mean_count = np.mean(counts)
-                self.logger.record(f"rollout/custom/ep_{tower_type}_count_mean", mean_count)
-                counts.clear()
\ No newline at end of file
+            if counts.count > 0:
+                self.logger.record(f"rollout/custom/ep_{tower_type}_count_mean", counts.mean)
+                counts.reset()
+        # time the training loop spent capturing the frames of the recorded episodes
+        if self.video_frames + self.video_dropped_frames > 0:
+            self.logger.record("rollout/custom/video_capture_ms_per_frame", 1000 * self.video_capture_seconds / (self.video_frames + self.video_dropped_frames))
+            self.logger.record("rollout/custom/video_dropped_frames", self.video_dropped_frames)
+            self.video_frames, self.video_dropped_frames, self.video_capture_seconds = 0, 0, 0.0
@@ -0,0 +1,65 @@
+import os
+import time
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+from custom_callbacks.running_stats import RunningStats
+
+# stops the training after a wall-clock budget and schedules the checkpoints and videos from the measured throughput:
+# - checkpoints at even fractions of the budget (the last one at the deadline)
+# - videos: env 0 records its first episode (see wrap_env), then an episode is requested (AsyncRecordVideo.request_recording)
+#   at even times over the budget minus the expected episode duration, so that the last video ends before the deadline
+#   (episode duration = mean episode length of all the envs / measured steps per second per env, expected_episode_steps until the first episodes end)
+class TimeBudgetCallback(BaseCallback):
+    def __init__(self, hours: float, save_path: str, name_prefix: str = "rl_model", checkpoints: int = 3, videos: int = 10, expected_episode_steps: int = 2500, verbose=0):
+        super().__init__(verbose)
+        self.budget_seconds = hours * 3600
+        self.save_path = save_path
+        self.name_prefix = name_prefix
+        self.checkpoints = checkpoints
+        self.videos = videos
+        self.expected_episode_steps = expected_episode_steps
+        self.episode_lengths = RunningStats()
+
+    def _on_training_start(self) -> None:
+        self.start_time = time.monotonic()
+        self.start_timesteps = self.num_timesteps
+        self.saved_checkpoints = 0
+        self.requested_videos = 1 # the first episode is recorded by its trigger
+
+    def _on_step(self) -> bool:
+        for env_index in np.flatnonzero(self.locals["dones"]):
+            episode = self.locals["infos"][env_index].get("episode") # Monitor stats
+            if episode is not None:
+                self.episode_lengths.add(episode["l"])
+
+        elapsed = time.monotonic() - self.start_time
+        if self.saved_checkpoints < self.checkpoints and elapsed >= self.budget_seconds * (self.saved_checkpoints + 1) / self.checkpoints:
+            self.saved_checkpoints += 1
+            self.model.save(os.path.join(self.save_path, f"{self.name_prefix}_{self.num_timesteps}_steps"))
+        if self.requested_videos < self.videos and elapsed >= self.__video_time(self.requested_videos):
+            self.requested_videos += 1
+            self.training_env.env_method("request_recording", indices=[0])
+        return elapsed < self.budget_seconds
+
+    def _on_rollout_end(self) -> None:
+        elapsed = time.monotonic() - self.start_time
+        self.logger.record("time/budget_remaining_hours", max(self.budget_seconds - elapsed, 0) / 3600)
+        self.logger.record("time/measured_fps", self.__steps_per_second())
+        self.logger.record("time/projected_total_timesteps", round(self.num_timesteps + self.__steps_per_second() * max(self.budget_seconds - elapsed, 0)))
+        self.logger.record("time/expected_episode_seconds", self.__episode_seconds())
+
+    # steps per second over all the envs since the start of the training
+    def __steps_per_second(self) -> float:
+        elapsed = time.monotonic() - self.start_time
+        return (self.num_timesteps - self.start_timesteps) / elapsed if elapsed > 0 else 0.0
+
+    def __episode_seconds(self) -> float:
+        steps_per_second_per_env = self.__steps_per_second() / self.training_env.num_envs
+        if steps_per_second_per_env == 0:
+            return 0.0
+        episode_steps = self.episode_lengths.mean if self.episode_lengths.count > 0 else self.expected_episode_steps
+        return episode_steps / steps_per_second_per_env
+
+    # start time of the k-th video (k = 1 .. videos-1, the 0-th is the first episode)
+    def __video_time(self, k: int) -> float:
+        return k * max(self.budget_seconds - self.__episode_seconds(), 0) / max(self.videos - 1, 1)
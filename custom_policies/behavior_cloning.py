@@ -0,0 +1,53 @@
+import gymnasium as gym
+import numpy as np
+import torch as th
+from gymnasium_env.transition_store import TransitionDataset, BOX_KEY
+
+# behavior cloning warm start of a MaskablePPO model from recorded transitions (see gymnasium_env/transition_store.py): the policy
+# is trained to take the recorded actions (negative log likelihood under the masked action distribution, as the agent samples
+# them) and the value function to predict the discounted returns of the recorded episodes (weighted by the model vf_coef)
+# the batches are read from the memory mapped shards, only the sampled transitions are decoded
+# returns the mean policy and value losses of each epoch
+def pretrain_policy(model, dataset: TransitionDataset, epochs: int = 5, batch_size: int = 256, learning_rate: float = 3e-4, seed: int = 0) -> list[tuple[float, float]]:
+    check_spaces(model, dataset)
+    policy = model.policy
+    optimizer = th.optim.Adam(policy.parameters(), lr=learning_rate) # its own optimizer, the PPO one starts fresh after
+    returns = dataset.returns(model.gamma)
+    rng = np.random.default_rng(seed)
+    policy.set_training_mode(True)
+    losses = []
+    for _ in range(epochs):
+        order = rng.permutation(len(dataset))
+        policy_losses, value_losses = [], []
+        for start in range(0, len(dataset), batch_size):
+            indices = np.sort(order[start:start + batch_size]) # in shard order, fewer pages of the shards touched
+            batch = dataset.batch(indices)
+            observations, _ = policy.obs_to_tensor(batch["observations"])
+            actions = th.as_tensor(batch["actions"], device=policy.device).long()
+            if isinstance(model.action_space, gym.spaces.Discrete):
+                actions = actions.flatten()
+            values, log_prob, _ = policy.evaluate_actions(observations, actions, action_masks=batch["masks"])
+            policy_loss = -log_prob.mean()
+            value_loss = th.nn.functional.mse_loss(values.flatten(), th.as_tensor(returns[indices], device=policy.device))
+            loss = policy_loss + model.vf_coef * value_loss
+
+            optimizer.zero_grad()
+            loss.backward()
+            th.nn.utils.clip_grad_norm_(policy.parameters(), model.max_grad_norm)
+            optimizer.step()
+            policy_losses.append(policy_loss.item())
+            value_losses.append(value_loss.item())
+        losses.append((float(np.mean(policy_losses)), float(np.mean(value_losses))))
+    policy.set_training_mode(False)
+    return losses
+
+# the recorded observations and actions must have the shapes of the model spaces (same observation mode, maps and action mode)
+def check_spaces(model, dataset: TransitionDataset) -> None:
+    observation_space = model.observation_space
+    spaces = observation_space.spaces if isinstance(observation_space, gym.spaces.Dict) else {BOX_KEY: observation_space}
+    observation_shapes = {key: list(space.shape) for key, space in spaces.items()}
+    if observation_shapes != {key: spec["shape"] for key, spec in dataset.observation_specs.items()}:
+        raise ValueError(f"The recorded observations {dataset.observation_specs} do not match the model observation space {observation_space}, "
+                         "record with the observation mode and the maps file (--random-maps) of the model")
+    if list(model.action_space.shape) != dataset.action_spec["shape"]:
+        raise ValueError(f"The recorded actions (shape {dataset.action_spec['shape']}) do not match the model action space {model.action_space}")
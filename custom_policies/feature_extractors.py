@@ -0,0 +1,46 @@
+import gymnasium as gym
+import torch as th
+from torch import nn
+from stable_baselines3.common.torch_layers import BaseFeaturesExtractor
+
+# features extractor of the "entities" observation mode: the towers and the enemies go through a shared per-entity mlp
+# (one for each kind), the rows of each set are pooled (masked mean and max over the active rows) and concatenated with the global features
+class EntitySetExtractor(BaseFeaturesExtractor):
+    def __init__(self, observation_space: gym.spaces.Dict, entity_dim: int = 32, features_dim: int = 128):
+        super().__init__(observation_space, features_dim)
+        tower_features = observation_space["towers"].shape[-1]
+        enemy_features = observation_space["enemies"].shape[-1]
+        global_features = observation_space["globals"].shape[0]
+        self.tower_encoder = nn.Sequential(nn.Linear(tower_features, entity_dim), nn.ReLU(inplace=True), nn.Linear(entity_dim, entity_dim), nn.ReLU(inplace=True))
+        self.enemy_encoder = nn.Sequential(nn.Linear(enemy_features, entity_dim), nn.ReLU(inplace=True), nn.Linear(entity_dim, entity_dim), nn.ReLU(inplace=True))
+        self.head = nn.Sequential(nn.Linear(global_features + 4 * entity_dim, features_dim), nn.ReLU())
+
+    def forward(self, observations: dict[str, th.Tensor]) -> th.Tensor:
+        towers = self.__pool(self.tower_encoder(observations["towers"]), observations["towers"][..., 0])
+        enemies = self.__pool(self.enemy_encoder(observations["enemies"]), observations["enemies"][..., 0])
+        return self.head(th.cat([observations["globals"], towers, enemies], dim=1))
+
+    # mean and max over the active rows (the first feature of a row is its active flag), zeros for an empty set
+    def __pool(self, encoded: th.Tensor, active: th.Tensor) -> th.Tensor:
+        mask = active.unsqueeze(-1)
+        masked = encoded * mask # the encodings are non-negative (relu), masked rows can't win the max
+        mean = masked.sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        return th.cat([mean, masked.amax(dim=1)], dim=1)
+
+# features extractor of the "grid" observation mode: a small cnn over the (channels, x, y) grid, concatenated with the global features
+# (the uint8 grid is an image space for sb3, the policy scales it to [0, 1] before the extractor)
+class GridExtractor(BaseFeaturesExtractor):
+    def __init__(self, observation_space: gym.spaces.Dict, features_dim: int = 128):
+        super().__init__(observation_space, features_dim)
+        channels = observation_space["grid"].shape[0]
+        self.cnn = nn.Sequential(
+            nn.Conv2d(channels, 16, kernel_size=3, padding=1), nn.ReLU(),
+            nn.Conv2d(16, 32, kernel_size=3, stride=2, padding=1), nn.ReLU(),
+            nn.Flatten(),
+        )
+        with th.no_grad():
+            cnn_features = self.cnn(th.zeros((1,) + observation_space["grid"].shape)).shape[1]
+        self.head = nn.Sequential(nn.Linear(cnn_features + observation_space["globals"].shape[0], features_dim), nn.ReLU())
+
+    def forward(self, observations: dict[str, th.Tensor]) -> th.Tensor:
+        return self.head(th.cat([self.cnn(observations["grid"]), observations["globals"]], dim=1))
\ No newline at end of file
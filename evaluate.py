@@ -0,0 +1,221 @@
+import argparse
+import csv
+import json
+import os
+import shlex
+import time
+import gymnasium_env.envs  # ensure the custom environment is registered
+import gymnasium as gym
+import numpy as np
+from gymnasium_env.envs.info_cache import info_cache_options
+from gymnasium_env.server_pool import ServerPool
+
+env_name = "gymnasium_env/TowerDefenseWorld-v0"
+
+# env settings the model was trained with, read from its spaces
+def env_options_of(model: "MaskablePPO") -> dict:
+    options = {"action_mode": "flat" if isinstance(model.action_space, gym.spaces.Discrete) else "multi_discrete"}
+    if isinstance(model.observation_space, gym.spaces.Dict):
+        if "grid" in model.observation_space.spaces:
+            options["observation_mode"] = "grid"
+        else:
+            options["observation_mode"] = "entities"
+            options["entity_slots"] = model.observation_space["towers"].shape[0]
+    return options
+
+# ends the episode (truncated, info["stuck"]) when the game time has not advanced for max_stuck_steps steps: a deterministic policy
+# can repeat an illegal build forever (in multi_discrete mode the masks can't disable the occupied cells), which does not advance the game
+class StuckEpisodeLimit(gym.Wrapper):
+    def __init__(self, env, max_stuck_steps: int):
+        super().__init__(env)
+        self.max_stuck_steps = max_stuck_steps
+        self.stuck_steps = 0
+
+    def reset(self, seed=None, options=None):
+        self.stuck_steps = 0
+        return self.env.reset(seed=seed, options=options)
+
+    def step(self, action):
+        game_time = self.env.unwrapped.game_state["gameTime"]
+        observation, reward, terminated, truncated, info = self.env.step(action)
+        game_state = self.env.unwrapped.game_state
+        self.stuck_steps = self.stuck_steps + 1 if game_state["gameTime"] == game_time else 0
+        if self.stuck_steps >= self.max_stuck_steps and not terminated:
+            truncated = True
+            info["stuck"] = True
+            info["lives"] = game_state["lives"]
+        return observation, reward, terminated, truncated, info
+
+# switches the env to the map set by set_next_map at its next reset: the auto-reset of the vec env when the episode ends starts
+# the next episode on its map, without another reset
+class NextMapOnReset(gym.Wrapper):
+    def __init__(self, env):
+        super().__init__(env)
+        self.next_map = None
+
+    def set_next_map(self, index: int) -> None:
+        self.next_map = index
+
+    def reset(self, seed=None, options=None):
+        if self.next_map is not None:
+            self.env.unwrapped.select_map(self.next_map)
+            self.next_map = None
+        return self.env.reset(seed=seed, options=options)
+
+# returns a function building the rank-th env with every map registered (the observation is sized as in training with these maps),
+# with default_map the map the backend starts on comes first, its waypoints read from the backend info
+def make_env(url, local, map_list, default_map, frame_skip, max_stuck_steps, env_options, backend_options=None):
+    def _init():
+        env = gym.make(env_name, backend="local" if local else "http", url=url, backend_options=backend_options, frame_skip=frame_skip, **env_options)
+        default_maps = [{"name": "default", "waypoints": env.unwrapped.game_info["map"]["waypoints"]}] if default_map else []
+        env.unwrapped.register_maps(default_maps + map_list)
+        return NextMapOnReset(StuckEpisodeLimit(env, max_stuck_steps))
+    return _init
+
+# takes the next pending job for an env and sets its map for the env's next auto-reset, returns the job (None if there is none left)
+def queue_next_job(env, env_index: int, pending: list):
+    if not pending:
+        return None
+    job = pending.pop()
+    env.env_method("set_next_map", job[0], indices=[env_index])
+    return job
+
+def summarize(episodes: list[dict], tower_types: list[str]) -> dict:
+    summary = {}
+    for map_name in dict.fromkeys(episode["map"] for episode in episodes):
+        map_episodes = [episode for episode in episodes if episode["map"] == map_name]
+        waves = np.array([episode["wave_number"] for episode in map_episodes])
+        summary[map_name] = {
+            "episodes": len(map_episodes),
+            "wave_number_mean": float(waves.mean()),
+            "wave_number_min": int(waves.min()),
+            "wave_number_max": int(waves.max()),
+            "game_time_mean": float(np.mean([episode["game_time"] for episode in map_episodes])),
+            "lives_lost_mean": float(np.mean([episode["lives_lost"] for episode in map_episodes])),
+            "reward_mean": float(np.mean([episode["reward"] for episode in map_episodes])),
+            "stuck_episodes": sum(episode["stuck"] for episode in map_episodes),
+            "tower_counts_mean": {tower_type: float(np.mean([episode[tower_type] for episode in map_episodes])) for tower_type in tower_types},
+        }
+    return summary
+
+def main(model_path, maps_path, default_map, episodes_per_map, local, num_envs, server_command, server_dir, base_port, frame_skip, max_stuck_steps, output_dir, info_cache=None):
+    """
+    Plays episodes_per_map deterministic episodes on each map with num_envs envs in parallel (one process and one game backend each),
+    the actions of all the envs are predicted in one batch, and saves the stats of each episode (csv) and of each map (json).
+    Without maps_path only the default map is played (a model trained without --random-maps has an observation sized for it).
+    """
+    # imported here rather than with the module: the env processes import this module too and do not need torch
+    from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
+    from sb3_contrib import MaskablePPO
+    from sb3_contrib.common.maskable.utils import get_action_masks
+
+    model = MaskablePPO.load(model_path, device="cpu")
+    map_list = []
+    if maps_path:
+        with open(maps_path, "r") as f:
+            map_list = json.load(f)
+    default_map = default_map or not map_list
+    map_names = (["default"] if default_map else []) + [map_entry.get("name", f"map_{index}") for index, map_entry in enumerate(map_list)]
+    jobs = [(map_index, episode) for map_index in range(len(map_names)) for episode in range(episodes_per_map)]
+    num_envs = min(num_envs, len(jobs))
+
+    server_pool = None
+    urls = [f"http://localhost:{base_port + i}/" for i in range(num_envs)]
+    if server_command and not local:
+        server_pool = ServerPool(shlex.split(server_command), num_envs, base_port=base_port, cwd=server_dir)
+        urls = server_pool.start()
+    backend_options = info_cache_options(info_cache, urls[0]) if info_cache and not local else None
+
+    env_fns = [make_env(urls[rank], local, map_list, default_map, frame_skip, max_stuck_steps, env_options_of(model), backend_options) for rank in range(num_envs)]
+    env = SubprocVecEnv(env_fns) if num_envs > 1 else DummyVecEnv(env_fns)
+    try:
+        if env.observation_space != model.observation_space:
+            raise ValueError(f"The env observation space {env.observation_space} differs from the model one {model.observation_space}, "
+                             "the observation is sized for the largest map: evaluate on the maps file the model was trained with (--random-maps), "
+                             "or without --maps for a model trained on the default map")
+        game_info = env.get_attr("game_info", [0])[0]
+        max_lives = game_info["max_global_info"]["lives"]
+        tower_types = [tower["type"] for tower in game_info["towers"]]
+
+        start = time.perf_counter()
+        env_jobs = [None] * num_envs # (map index, episode) played by each env, None once there are no more jobs
+        next_jobs = [None] * num_envs # job each env plays next, its map is set for the auto-reset ending the current episode
+        rewards = np.zeros(num_envs)
+        steps = np.zeros(num_envs, dtype=np.int64)
+        pending = list(reversed(jobs))
+        for env_index in range(num_envs):
+            env_jobs[env_index] = pending.pop()
+            env.env_method("select_map", env_jobs[env_index][0], indices=[env_index])
+        observation = env.reset()
+        for env_index in range(num_envs):
+            next_jobs[env_index] = queue_next_job(env, env_index, pending)
+
+        episodes = []
+        while len(episodes) < len(jobs):
+            actions, _ = model.predict(observation, action_masks=get_action_masks(env), deterministic=True)
+            observation, reward, dones, infos = env.step(actions)
+            rewards += reward
+            steps += 1
+            for env_index in np.flatnonzero(dones):
+                if env_jobs[env_index] is None: # idle env, stepped with the others until the last episodes end
+                    continue
+                map_index, episode = env_jobs[env_index]
+                info = infos[env_index]
+                episodes.append({
+                    "map": map_names[map_index],
+                    "episode": episode,
+                    "wave_number": info["wave_number"],
+                    "game_time": info["game_time"],
+                    "lives_lost": max_lives - info["lives"],
+                    "reward": float(rewards[env_index]),
+                    "steps": int(steps[env_index]),
+                    "stuck": info.get("stuck", False),
+                    **info["tower_counts"],
+                })
+                rewards[env_index] = 0
+                steps[env_index] = 0
+                env_jobs[env_index] = next_jobs[env_index] # already started by the auto-reset
+                next_jobs[env_index] = queue_next_job(env, env_index, pending) if env_jobs[env_index] is not None else None
+        elapsed = time.perf_counter() - start
+    finally:
+        env.close()
+        if server_pool:
+            server_pool.close()
+
+    if output_dir is None:
+        output_dir = os.path.join(os.path.dirname(os.path.abspath(model_path)), "evaluation")
+    os.makedirs(output_dir, exist_ok=True)
+    episodes.sort(key=lambda e: (e["map"], e["episode"]))
+    with open(os.path.join(output_dir, "episodes.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(episodes[0]))
+        writer.writeheader()
+        writer.writerows(episodes)
+    summary = summarize(episodes, tower_types)
+    with open(os.path.join(output_dir, "summary.json"), "w") as f:
+        json.dump({"model": model_path, "maps": maps_path, "episodes_per_map": episodes_per_map, "frame_skip": frame_skip, "seconds": elapsed, "maps_summary": summary}, f, indent=2)
+
+    for map_name, stats in summary.items():
+        towers = "  ".join(f"{tower_type} {count:.1f}" for tower_type, count in stats["tower_counts_mean"].items())
+        print(f"{map_name:<12} waves {stats['wave_number_mean']:5.1f} (min {stats['wave_number_min']}, max {stats['wave_number_max']})  game time {stats['game_time_mean']:7.1f} s  lives lost {stats['lives_lost_mean']:4.1f}  {towers}" + (f"  ({stats['stuck_episodes']} stuck)" if stats["stuck_episodes"] else ""))
+    print(f"{len(episodes)} episodes in {elapsed:.1f} s, results saved to {output_dir}")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Evaluate a trained MaskablePPO model on every map of a maps file.")
+    parser.add_argument("--model", required=True, help="Path to the model zip file.")
+    parser.add_argument("--maps", help="Optional. Path to the maps JSON file the model was trained on with --random-maps (without it, only the default map is played: the only one a model trained without --random-maps can be evaluated on).")
+    parser.add_argument("--default-map", action="store_true", help="Optional. Evaluate on the default map of the game server too (the map it starts on).")
+    parser.add_argument("--episodes", type=int, default=1, help="Optional. Episodes per map.")
+    parser.add_argument("--local", action="store_true", help="Optional. Play on the in-process game simulator (estimated rules, not checked against the game server) instead of the game server.")
+    parser.add_argument("--num-envs", type=int, default=4, help="Optional. Number of environments run in parallel (one game server each).")
+    parser.add_argument("--server-command", help="Optional. Command starting one game server (port given by the PORT variable or '{port}'), started once per env.")
+    parser.add_argument("--server-dir", help="Optional. Working directory of the game server command.")
+    parser.add_argument("--base-port", type=int, default=3000, help="Optional. Port of the first game server, the others use the following ports.")
+    parser.add_argument("--frame-skip", type=int, default=1, help="Optional. Game ticks advanced by each step (as in training).")
+    parser.add_argument("--max-stuck-steps", type=int, default=200, help="Optional. Steps without game progress (repeated illegal builds) after which an episode is ended and counted as stuck.")
+    parser.add_argument("--output-dir", help="Optional. Directory of the results (default: evaluation/ next to the model).")
+    parser.add_argument("--info-cache", help="Optional. Directory where the game info of each server version and map is saved, the envs then start without asking their server (the servers must be on their default map at start).")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args.model, args.maps, args.default_map, args.episodes, args.local, args.num_envs, args.server_command, args.server_dir, args.base_port, args.frame_skip, args.max_stuck_steps, args.output_dir, args.info_cache)
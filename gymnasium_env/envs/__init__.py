@@ -3,4 +3,11 @@ import gymnasium as gym
 gym.register(
     id="gymnasium_env/TowerDefenseWorld-v0",
     entry_point="gymnasium_env.envs.tower_defense_world:TowerDefenseWorldEnv"
+)
+
+# same environment with the game rules simulated in-process (no game server, estimated rules, see local_game.py)
+gym.register(
+    id="gymnasium_env/TowerDefenseWorldLocal-v0",
+    entry_point="gymnasium_env.envs.tower_defense_world:TowerDefenseWorldEnv",
+    kwargs={"backend": "local"}
 )
\ No newline at end of file
@@ -0,0 +1,63 @@
+import json
+import numpy as np
+
+# actions of one episode as rows of raw (action index, tower index, x, y) int16 values, stored in a numpy array
+# doubled when full, the game action dicts are only built when a log is written (see to_game_actions)
+class ActionLog:
+    def __init__(self, capacity: int = 4096):
+        self.actions = np.zeros((capacity, 4), dtype=np.int16)
+        self.size = 0
+
+    def append(self, action_index: int, tower_index: int, x: int, y: int, count: int = 1) -> None:
+        if self.size + count > len(self.actions):
+            grown = np.zeros((max(2 * len(self.actions), self.size + count), 4), dtype=np.int16)
+            grown[:self.size] = self.actions[:self.size]
+            self.actions = grown
+        self.actions[self.size:self.size + count] = (action_index, tower_index, x, y)
+        self.size += count
+
+    # read-only view of the logged rows (no copy), later appends never change it
+    def view(self) -> np.ndarray:
+        rows = self.actions[:self.size]
+        rows.flags.writeable = False
+        return rows
+
+    def __len__(self) -> int:
+        return self.size
+
+# rows of an action log -> game actions as sent to the game server (the format of best_episode_actions.json)
+# equal rows share the same dict (most of them are NOOPs), copy the dicts before changing them
+def to_game_actions(actions: np.ndarray, game_info: dict) -> list[dict]:
+    action_types = game_info["actions"]
+    tower_types = game_info["towers"]
+    cell_size = game_info["map"]["cell_size"]
+    decoded = {}
+    game_actions = []
+    for row in map(tuple, actions.tolist()):
+        game_action = decoded.get(row)
+        if game_action is None:
+            action_index, tower_index, x, y = row
+            if action_types[action_index]["type"] == "BUILD_TOWER":
+                game_action = {"type": "BUILD_TOWER", "towerType": tower_types[tower_index]["type"], "position": {"x": cell_size/2 + cell_size*x, "y": cell_size/2 + cell_size*y}}
+            else:
+                game_action = dict(action_types[action_index])
+            decoded[row] = game_action
+        game_actions.append(game_action)
+    return game_actions
+
+# best episode file: .json with the game actions, or .npz with the raw rows and what is needed to decode them
+def save_episode_actions(path: str, game_time: int, wave_number: int, actions: np.ndarray, game_info: dict) -> None:
+    if path.endswith(".npz"):
+        decoding_info = {"actions": game_info["actions"], "towers": [{"type": tower["type"]} for tower in game_info["towers"]], "map": {"cell_size": game_info["map"]["cell_size"]}}
+        np.savez(path, actions=actions, game_time=game_time, wave_number=wave_number, game_info=json.dumps(decoding_info))
+    else:
+        with open(path, "w") as f:
+            json.dump({"game_time": game_time, "wave_number": wave_number, "actions": to_game_actions(actions, game_info)}, f)
+
+# {"game_time", "wave_number", "actions"} with the game actions, from either format
+def load_episode_actions(path: str) -> dict:
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            return {"game_time": int(data["game_time"]), "wave_number": int(data["wave_number"]), "actions": to_game_actions(data["actions"], json.loads(str(data["game_info"])))}
+    with open(path, "r") as f:
+        return json.load(f)
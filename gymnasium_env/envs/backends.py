@@ -0,0 +1,248 @@
+import io
+import numpy as np
+from gymnasium_env.envs.game_state import GameState, GameStateDecoder, local_game_state
+from gymnasium_env.envs.info_cache import InfoCache
+from gymnasium_env.envs.local_game import LocalGame, IllegalActionError, load_rules
+from gymnasium_env.envs.rasterizer import FrameRasterizer
+from gymnasium_env.envs.state_delta import StateDeltaEncoder, NO_BASE, enemy_count_after
+
+DEFAULT_URL = "http://localhost:3000/"
+RAW_FRAME_CONTENT_TYPE = "application/octet-stream"
+
+# talks to the tower defense game server over a keep-alive connection (see transport.py for the options)
+# render_format: "png" decodes the image the server draws, "raw" asks for the pixels themselves (GET /render?format=raw&scale=s,
+# answered with the X-Frame-Width/Height/Channels headers) and wraps them without copy, servers answering with a png are decoded as before
+# delta: reset, step and restore ask for delta-encoded states (?delta=<id of the last state received>, see state_delta.py), to apply
+# to an EntityMirror; servers without delta support answer with whole states, which the mirror takes too
+# typed_states: reset, step and restore return GameState objects parsed straight from the response bodies (see game_state.py,
+# the decoder is built from the first info())
+# info_cache: directory where the info of each map is saved (see info_cache.py), info() then only asks the server for the maps
+# not saved yet; with server_version too, an info already saved is read without any request, even the first one (the server
+# must be on its default map when the backend is created, as a server just started)
+class HttpBackend:
+    def __init__(self, url: str = DEFAULT_URL, render_format: str = "png", delta: bool = False, typed_states: bool = False, info_cache: str | None = None, server_version: str | None = None, **transport_options):
+        from gymnasium_env.envs.transport import HttpTransport # imports requests, which the local backend does not need
+
+        if render_format not in ("png", "raw"):
+            raise ValueError(f"Unknown render format: {render_format} (expected 'png' or 'raw')")
+        if delta and typed_states:
+            raise ValueError("delta and typed_states can't be combined (the delta payloads are applied to an EntityMirror, which gives the GameState)")
+        self.url = url if url.endswith("/") else url + "/"
+        self.render_format = render_format
+        self.delta = delta
+        self.state_id = NO_BASE
+        self.enemy_count = 0 # after the last delta response, the payloads only have the enemies that changed
+        self.typed_states = typed_states
+        self.state_decoder = None
+        self.transport = HttpTransport(self.url, **transport_options)
+        self.info_cache = InfoCache(info_cache) if info_cache else None
+        self.server_version = server_version
+        self.map_waypoints = None # waypoints last set on the server (None: its default map)
+        self.map_known = True # False after restoring a snapshot without its waypoints, the info is then asked to the server
+        self.multi_tick_supported = True # until the server answers a multi-tick step without the "ticks" summaries
+
+    def info(self) -> dict:
+        use_cache = self.info_cache is not None and self.map_known
+        game_info = self.info_cache.load(self.server_version, self.map_waypoints) if use_cache and self.server_version else None
+        if game_info is None:
+            response = self.transport.get("info")
+            if response.status_code != 200:
+                raise ConnectionError(f"Failed to get game info: {response.text}")
+            game_info = self.transport.decode(response)
+            if use_cache:
+                self.server_version = self.info_cache.save(game_info, self.map_waypoints, self.server_version)
+        if self.typed_states and self.state_decoder is None:
+            self.state_decoder = GameStateDecoder(game_info)
+        return game_info
+
+    # the game info of a map as saved in the info cache (None if not saved or without cache), the map on the server is not changed
+    def cached_info(self, waypoints: list[dict]) -> dict | None:
+        if self.info_cache is None or self.server_version is None:
+            return None
+        return self.info_cache.load(self.server_version, waypoints)
+
+    def reset(self) -> dict | GameState:
+        response = self.transport.post(self.__state_path("reset", NO_BASE))
+        if response.status_code != 200:
+            raise ConnectionError(f"Failed to reset game: {response.text}")
+        return self.__decode_state(response)
+
+    # returns None if the server rejects the action (building tower on path or in occupied cell)
+    # with more than one tick the state has the "ticks" summaries (see LocalGame.step), servers without
+    # the multi-tick endpoint get the remaining ticks as NOOP steps (in delta mode the responses before the last one are
+    # returned in its "preceding" list, for the mirror to apply them in order)
+    def step(self, game_action: dict, ticks: int = 1) -> dict | GameState | None:
+        if ticks > 1 and self.multi_tick_supported:
+            response = self.transport.post(self.__state_path(f"step?ticks={ticks}", self.state_id), game_action)
+        else:
+            response = self.transport.post(self.__state_path("step", self.state_id), game_action)
+        if response.status_code != 200:
+            return None
+        game_state = self.__decode_state(response)
+        if ticks == 1 or "ticks" in game_state:
+            return game_state
+
+        self.multi_tick_supported = False
+        responses = [game_state]
+        tick_summaries = [self.__tick_summary(game_state)]
+        while len(tick_summaries) < ticks and not game_state["gameOver"]:
+            response = self.transport.post(self.__state_path("step", self.state_id), {"type": "NOOP"})
+            if response.status_code != 200:
+                break
+            game_state = self.__decode_state(response)
+            responses.append(game_state)
+            tick_summaries.append(self.__tick_summary(game_state))
+        if self.delta and len(responses) > 1:
+            game_state["preceding"] = responses[:-1]
+        game_state["ticks"] = tick_summaries
+        return game_state
+
+    # rgb array downscaled by the integer factor scale
+    def render(self, scale: int = 1) -> np.ndarray | None:
+        if self.render_format == "raw":
+            response = self.transport.get(f"render?format=raw&scale={scale}")
+        else:
+            response = self.transport.get("render")
+        if response.status_code != 200:
+            print(f"Error during render: {response.text}")
+            return None
+        if response.headers.get("Content-Type", "").startswith(RAW_FRAME_CONTENT_TYPE):
+            return decode_raw_frame(response.content, response.headers)
+
+        self.render_format = "png" # the server only draws png images
+        from PIL import Image
+
+        image_bytes = io.BytesIO(response.content)
+        image = Image.open(image_bytes).convert("RGB")
+        return np.array(image)[::scale, ::scale]
+
+    # the whole game state (GET /snapshot, an opaque json object), to continue the game later with restore
+    def snapshot(self) -> dict:
+        response = self.transport.get("snapshot")
+        if response.status_code != 200:
+            raise ConnectionError(f"Failed to get game snapshot (the server may not support snapshots): {response.text}")
+        return self.transport.decode(response)
+
+    # continue the game from a snapshot (POST /restore), returns the game state
+    def restore(self, snapshot: dict) -> dict | GameState:
+        response = self.transport.post(self.__state_path("restore", NO_BASE), snapshot)
+        if response.status_code != 200:
+            raise ConnectionError(f"Failed to restore game snapshot: {response.text}")
+        self.map_waypoints = snapshot.get("waypoints")
+        self.map_known = "waypoints" in snapshot
+        return self.__decode_state(response)
+
+    def set_map(self, waypoints: list[dict]) -> bool:
+        response = self.transport.post("set-map", waypoints)
+        if response.status_code != 200:
+            print(f"Error setting map: {response.text}")
+            return False
+        self.map_waypoints = waypoints
+        self.map_known = True
+        return True
+
+    def close(self):
+        self.transport.close()
+
+    def __state_path(self, path: str, base: int) -> str:
+        if not self.delta:
+            return path
+        return f"{path}{'&' if '?' in path else '?'}delta={base}"
+
+    def __decode_state(self, response) -> dict | GameState:
+        if self.typed_states:
+            if self.state_decoder is None:
+                self.info()
+            return self.state_decoder.decode(response.content, self.transport.is_msgpack(response))
+        game_state = self.transport.decode(response)
+        if self.delta:
+            self.state_id = game_state.get("stateId", NO_BASE)
+            self.enemy_count = enemy_count_after(game_state, self.enemy_count)
+        return game_state
+
+    def __tick_summary(self, game_state: dict | GameState) -> dict:
+        summary = tick_summary(game_state)
+        if self.delta:
+            summary["enemyCount"] = self.enemy_count
+        return summary
+
+# runs the game rules in-process (see local_game.py, the rules /info does not give are estimates), no server needed
+# delta: reset, step and restore return delta-encoded states (see state_delta.py) instead of building the dicts of every entity
+# typed_states: they return GameState objects built from the columns of the game (see game_state.py)
+# rules: the rules /info does not give, as a dict or the path of a rules file (see local_game.py, the estimates by default)
+class LocalBackend:
+    def __init__(self, game_info: dict | None = None, delta: bool = False, typed_states: bool = False, rules: dict | str | None = None):
+        if delta and typed_states:
+            raise ValueError("delta and typed_states can't be combined (the delta payloads are applied to an EntityMirror, which gives the GameState)")
+        self.game = LocalGame(game_info, load_rules(rules) if isinstance(rules, str) else rules)
+        self.rasterizers = {} # by scale, drawn for the current map
+        self.delta_encoder = StateDeltaEncoder() if delta else None
+        self.typed_states = typed_states
+
+    def info(self) -> dict:
+        return self.game.info()
+
+    def cached_info(self, waypoints: list[dict]) -> dict | None:
+        return None
+
+    def reset(self) -> dict | GameState:
+        if self.delta_encoder is not None:
+            self.game.reset()
+            return self.delta_encoder.encode(self.game, NO_BASE)
+        if self.typed_states:
+            self.game.reset()
+            return local_game_state(self.game)
+        return self.game.reset()
+
+    def step(self, game_action: dict, ticks: int = 1) -> dict | GameState | None:
+        try:
+            if self.delta_encoder is not None:
+                tick_summaries = self.game.advance(game_action, ticks)
+                return self.delta_encoder.encode(self.game, self.delta_encoder.state_id, tick_summaries if ticks > 1 else None)
+            if self.typed_states:
+                tick_summaries = self.game.advance(game_action, ticks)
+                return local_game_state(self.game, tick_summaries if ticks > 1 else None)
+            return self.game.step(game_action, ticks)
+        except IllegalActionError:
+            return None
+
+    def render(self, scale: int = 1) -> np.ndarray | None:
+        if scale not in self.rasterizers:
+            self.rasterizers[scale] = FrameRasterizer(self.game.game_info, scale)
+        return self.rasterizers[scale].draw(self.game.state())
+
+    def snapshot(self) -> dict:
+        return self.game.snapshot()
+
+    def restore(self, snapshot: dict) -> dict | GameState:
+        state = self.game.restore(snapshot)
+        if self.delta_encoder is not None:
+            return self.delta_encoder.encode(self.game, NO_BASE)
+        if self.typed_states:
+            return local_game_state(self.game)
+        return state
+
+    def set_map(self, waypoints: list[dict]) -> bool:
+        self.game.set_map(waypoints)
+        self.rasterizers.clear()
+        return True
+
+    def close(self):
+        pass
+
+# the part of a game state the per-tick rewards depend on (a GameState has it as summary())
+def tick_summary(game_state: dict | GameState) -> dict:
+    return {"enemyCount": len(game_state["enemies"]), "waveNumber": game_state["waveNumber"], "money": game_state["money"], "lives": game_state["lives"], "gameOver": game_state["gameOver"]}
+
+# frame sent by GET /render?format=raw: height*width*channels uint8 pixels (rgb or rgba), the array is a read-only view of data
+def decode_raw_frame(data: bytes, headers) -> np.ndarray:
+    shape = (int(headers["X-Frame-Height"]), int(headers["X-Frame-Width"]), int(headers.get("X-Frame-Channels", 3)))
+    frame = np.frombuffer(data, dtype=np.uint8).reshape(shape)
+    return frame[:, :, :3] if shape[2] == 4 else frame
+
+def make_backend(backend: str, url: str = DEFAULT_URL, **backend_options) -> HttpBackend | LocalBackend:
+    if backend == "http":
+        return HttpBackend(url, **backend_options)
+    if backend == "local":
+        return LocalBackend(**backend_options)
+    raise ValueError(f"Unknown backend: {backend} (expected 'http' or 'local')")
@@ -0,0 +1,211 @@
+import json
+import numpy as np
+
+try:
+    import msgspec
+except ImportError: # optional, the bodies are parsed into dicts first without it
+    msgspec = None
+try:
+    import orjson
+except ImportError: # optional, faster json parsing than the json module
+    orjson = None
+try:
+    import msgpack
+except ImportError: # optional, only needed for msgpack responses without msgspec
+    msgpack = None
+
+# fields of the towers and enemies of a game state, as columns (the position is split into x and y)
+ENTITY_FIELDS = {
+    "towers": ("x", "y", "attackCooldown"),
+    "enemies": ("x", "y", "currentHealth", "fullHealth", "currentSpeed", "pathProgress"),
+}
+# keys of the game state dicts of the game server -> GameState attributes
+STATE_KEYS = {"gameTime": "game_time", "waveNumber": "wave_number", "money": "money", "lives": "lives", "gameOver": "game_over", "towers": "towers", "enemies": "enemies", "ticks": "ticks"}
+
+# a game state as the env reads it: the global values as attributes, the towers and enemies as columns (EntityColumns, or the
+# EntityTable of an EntityMirror, see state_delta.py) and the summaries of the ticks of a multi-tick step (None for one tick)
+# indexing with the keys of the server dicts (game_state["waveNumber"], game_state["towers"] ...) works too, iterating the
+# towers or the enemies gives their dicts
+class GameState:
+    __slots__ = ("game_time", "wave_number", "money", "lives", "game_over", "towers", "enemies", "ticks")
+
+    def __init__(self, game_time: float, wave_number: int, money: int, lives: int, game_over: bool, towers, enemies, ticks: list[dict] | None = None):
+        self.game_time = game_time
+        self.wave_number = wave_number
+        self.money = money
+        self.lives = lives
+        self.game_over = game_over
+        self.towers = towers
+        self.enemies = enemies
+        self.ticks = ticks
+
+    def __getitem__(self, key: str):
+        value = getattr(self, STATE_KEYS[key])
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value) -> None:
+        setattr(self, STATE_KEYS[key], value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in STATE_KEYS and getattr(self, STATE_KEYS[key]) is not None
+
+    def get(self, key: str, default=None):
+        return self[key] if key in self else default
+
+    # the part of the state the per-tick rewards depend on (same as backends.tick_summary)
+    def summary(self) -> dict:
+        return {"enemyCount": len(self.enemies), "waveNumber": self.wave_number, "money": self.money, "lives": self.lives, "gameOver": self.game_over}
+
+# the towers or the enemies of a whole game state as columns, in the order of the state, with the interface of EntityTable
+# (the slots are the positions in the state, all active)
+class EntityColumns:
+    __slots__ = ("kind", "fields", "type_names", "type", "columns")
+
+    def __init__(self, kind: str, type_names: list[str], types: np.ndarray, columns: dict[str, np.ndarray]):
+        self.kind = kind
+        self.fields = ENTITY_FIELDS[kind]
+        self.type_names = type_names
+        self.type = types
+        self.columns = columns
+
+    # values: (entities, fields + 1) with the type index last
+    @classmethod
+    def from_rows(cls, kind: str, type_names: list[str], values: np.ndarray) -> "EntityColumns":
+        columns = values.T.copy() # one contiguous row per field
+        return cls(kind, type_names, columns[-1].astype(np.intp), dict(zip(ENTITY_FIELDS[kind], columns)))
+
+    @property
+    def active(self) -> np.ndarray:
+        return np.ones(len(self.type), dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.type)
+
+    def ordered_slots(self) -> np.ndarray:
+        return np.arange(len(self.type))
+
+    def type_counts(self) -> np.ndarray:
+        return np.bincount(self.type, minlength=len(self.type_names))
+
+    def __iter__(self):
+        return entity_dicts(self.type_names, self.type, self.columns)
+
+# constants of the game info read at every step, resolved once into floats (and arrays by tower type)
+class GameConstants:
+    __slots__ = ("max_game_time", "max_wave_number", "max_money", "max_lives", "map_width", "map_height", "slower_tower_attack_cooldown",
+                 "tower_costs", "tower_dps", "tower_unlock_waves", "cheapest_tower_cost", "most_expensive_tower_cost", "max_tower_dps")
+
+    def __init__(self, game_info: dict):
+        max_global_info = game_info["max_global_info"]
+        self.max_game_time = float(max_global_info["gameTime"])
+        self.max_wave_number = float(max_global_info["waveNumber"])
+        self.max_money = float(max_global_info["money"])
+        self.max_lives = float(max_global_info["lives"])
+        self.map_width = float(game_info["map"]["width"])
+        self.map_height = float(game_info["map"]["height"])
+        self.slower_tower_attack_cooldown = float(game_info["slower_tower_sample"]["attackCooldown"])
+        self.tower_costs = np.array([tower["cost"] for tower in game_info["towers"]], dtype=np.float64)
+        self.tower_dps = np.array([tower["dps"] for tower in game_info["towers"]], dtype=np.float64)
+        self.tower_unlock_waves = np.array([tower["unlock_wave"] for tower in game_info["towers"]], dtype=np.float64)
+        self.cheapest_tower_cost = float(self.tower_costs.min())
+        self.most_expensive_tower_cost = float(self.tower_costs.max())
+        self.max_tower_dps = float(self.tower_dps.max())
+
+# schema of the game state bodies, decoded by msgspec without building the dicts (the other keys, e.g. "stateId", are skipped)
+if msgspec is not None:
+    class PositionMessage(msgspec.Struct):
+        x: float
+        y: float
+
+    class TowerMessage(msgspec.Struct):
+        type: str
+        position: PositionMessage
+        attackCooldown: float = 0.0
+
+    class EnemyMessage(msgspec.Struct):
+        type: str
+        position: PositionMessage
+        currentHealth: float
+        fullHealth: float
+        currentSpeed: float = 0.0
+        pathProgress: float = 0.0
+
+    class StateMessage(msgspec.Struct):
+        gameTime: int | float
+        waveNumber: int | float
+        money: int | float
+        lives: int | float
+        gameOver: bool
+        towers: list[TowerMessage] = []
+        enemies: list[EnemyMessage] = []
+        ticks: list[dict] | None = None
+
+# parses the game state bodies of /reset, /step and /restore (json or msgpack) into GameState
+# parser: "msgspec" decodes the bytes straight through the schema above, "orjson" and "json" parse json bodies into dicts first
+# (msgpack bodies with the msgpack package), "auto" picks the first one installed
+class GameStateDecoder:
+    def __init__(self, game_info: dict, parser: str = "auto"):
+        if parser not in ("auto", "msgspec", "orjson", "json"):
+            raise ValueError(f"Unknown parser: {parser} (expected 'auto', 'msgspec', 'orjson' or 'json')")
+        if parser == "auto":
+            parser = "msgspec" if msgspec is not None else "orjson" if orjson is not None else "json"
+        if (parser == "msgspec" and msgspec is None) or (parser == "orjson" and orjson is None):
+            raise ImportError(f"{parser} parser requested but the {parser} package is not installed")
+        self.parser = parser
+        self.tower_types = [tower["type"] for tower in game_info["towers"]]
+        self.enemy_types = list(game_info["waves"]["enemy_types"])
+        self.tower_type_to_index = {name: index for index, name in enumerate(self.tower_types)}
+        self.enemy_type_to_index = {name: index for index, name in enumerate(self.enemy_types)}
+        self.json_decoder = None
+        self.msgpack_decoder = None
+        if parser == "msgspec":
+            self.json_decoder = msgspec.json.Decoder(StateMessage)
+            self.msgpack_decoder = msgspec.msgpack.Decoder(StateMessage)
+        self.json_loads = orjson.loads if parser == "orjson" else json.loads
+
+    def decode(self, content: bytes, is_msgpack: bool = False) -> GameState:
+        if self.json_decoder is not None:
+            return self.from_message((self.msgpack_decoder if is_msgpack else self.json_decoder).decode(content))
+        return self.from_dict(msgpack.unpackb(content) if is_msgpack else self.json_loads(content))
+
+    def from_dict(self, state: dict) -> GameState:
+        tower_index, enemy_index = self.tower_type_to_index, self.enemy_type_to_index
+        towers = state["towers"]
+        tower_values = [v for t in towers for v in (t["position"]["x"], t["position"]["y"], t["attackCooldown"], tower_index[t["type"]])]
+        enemies = state["enemies"]
+        enemy_values = [v for e in enemies for v in (e["position"]["x"], e["position"]["y"], e["currentHealth"], e["fullHealth"], e.get("currentSpeed", 0.0), e["pathProgress"], enemy_index[e["type"]])]
+        return GameState(state["gameTime"], state["waveNumber"], state["money"], state["lives"], state["gameOver"],
+                         self.__columns("towers", tower_values, len(towers)), self.__columns("enemies", enemy_values, len(enemies)), state.get("ticks"))
+
+    def from_message(self, message) -> GameState:
+        tower_index, enemy_index = self.tower_type_to_index, self.enemy_type_to_index
+        towers = message.towers
+        tower_values = [v for t in towers for v in (t.position.x, t.position.y, t.attackCooldown, tower_index[t.type])]
+        enemies = message.enemies
+        enemy_values = [v for e in enemies for v in (e.position.x, e.position.y, e.currentHealth, e.fullHealth, e.currentSpeed, e.pathProgress, enemy_index[e.type])]
+        return GameState(message.gameTime, message.waveNumber, message.money, message.lives, message.gameOver,
+                         self.__columns("towers", tower_values, len(towers)), self.__columns("enemies", enemy_values, len(enemies)), message.ticks)
+
+    def __columns(self, kind: str, values: list, count: int) -> EntityColumns:
+        rows = np.fromiter(values, dtype=np.float64, count=len(values)).reshape(count, len(ENTITY_FIELDS[kind]) + 1)
+        return EntityColumns.from_rows(kind, self.tower_types if kind == "towers" else self.enemy_types, rows)
+
+# the state of a LocalGame from its columns, without building the dicts
+def local_game_state(game, tick_summaries: list[dict] | None = None) -> GameState:
+    columns = game.entity_columns()
+    tower_names = [tower["type"] for tower in game.tower_types]
+    towers = EntityColumns("towers", tower_names, columns["towers"]["type"], {field: columns["towers"][field] for field in ENTITY_FIELDS["towers"]})
+    enemies = EntityColumns("enemies", game.enemy_types, columns["enemies"]["type"], {field: columns["enemies"][field] for field in ENTITY_FIELDS["enemies"]})
+    return GameState(game.game_time, game.wave_number, game.money, game.lives, game.game_over, towers, enemies, tick_summaries)
+
+# entity columns -> the dicts of a whole game state
+def entity_dicts(type_names: list[str], types: np.ndarray, columns: dict[str, np.ndarray]):
+    other_fields = [field for field in columns if field not in ("x", "y")]
+    values = {field: column.tolist() for field, column in columns.items()}
+    for i, type_index in enumerate(types.tolist()):
+        entity = {"type": type_names[type_index], "position": {"x": values["x"][i], "y": values["y"][i]}}
+        for field in other_fields:
+            entity[field] = values[field][i]
+        yield entity
@@ -0,0 +1,60 @@
+import hashlib
+import json
+import os
+
+# GET /info responses saved on disk, so that the backends of a server version already seen answer info() without a request
+# one file per server version and map: <directory>/<server version>/<map hash>.json, the map being the waypoints last set on
+# the server (None: the default map of a server started fresh)
+# the server version is given by the caller (train.py and evaluate.py ask one server for it and pass it to every env), or is
+# derived from an info by server_version; the tables the env derives from an info (see map_registry.py) are recomputed from
+# it, which takes a fraction of a millisecond per map
+class InfoCache:
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    # the game info saved for this version and map, None if there is none
+    def load(self, version: str, waypoints: list[dict] | None = None) -> dict | None:
+        try:
+            with open(self.__path(version, waypoints), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    # saves the game info of a map (under the version derived from it if none is given), returns the version
+    # the file is written under a temporary name and renamed, so that the envs of several processes can fill the cache at once
+    def save(self, game_info: dict, waypoints: list[dict] | None = None, version: str | None = None) -> str:
+        version = version or server_version(game_info)
+        path = self.__path(version, waypoints)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(game_info, f)
+        os.replace(temporary_path, path)
+        return version
+
+    def __path(self, version: str, waypoints: list[dict] | None) -> str:
+        return os.path.join(self.directory, version, map_hash(waypoints) + ".json")
+
+# version of the server an info comes from: its "version" entry if it has one, the hash of the game rules (everything but the map) otherwise
+def server_version(game_info: dict) -> str:
+    if "version" in game_info:
+        return str(game_info["version"])
+    rules = {key: value for key, value in game_info.items() if key != "map"}
+    return hashlib.sha1(json.dumps(rules, sort_keys=True).encode()).hexdigest()[:16]
+
+def map_hash(waypoints: list[dict] | None) -> str:
+    if waypoints is None:
+        return "default"
+    return hashlib.sha1(json.dumps(waypoints, sort_keys=True).encode()).hexdigest()[:16]
+
+# backend_options of http envs sharing the cache in directory: the server at url (started fresh or not) is asked its version
+# once, so that the envs read the infos already saved without any request (all the servers must run the same version)
+def info_cache_options(directory: str, url: str) -> dict:
+    from gymnasium_env.envs.backends import HttpBackend
+
+    backend = HttpBackend(url)
+    try:
+        version = server_version(backend.info())
+    finally:
+        backend.close()
+    return {"info_cache": directory, "server_version": version}
@@ -0,0 +1,417 @@
+from copy import deepcopy
+import json
+import math
+import numpy as np
+
+TICK_SECONDS = 0.1 # game time advanced by one step (same as the server)
+
+DEFAULT_MAP_WAYPOINTS = [
+    { "x": 75, "y": 25 },
+    { "x": 75, "y": 325 },
+    { "x": 225, "y": 325 },
+    { "x": 225, "y": 475 },
+    { "x": 375, "y": 475 },
+    { "x": 375, "y": 125 },
+    { "x": 825, "y": 125 },
+    { "x": 825, "y": 275 },
+    { "x": 525, "y": 275 },
+    { "x": 525, "y": 525 },
+    { "x": 725, "y": 525 },
+    { "x": 725, "y": 575 }
+]
+
+# rules the server does not expose through /info: ESTIMATES, they were not taken from the server source, so the local game only
+# approximates the server until they are checked against it (compare_backends.py, tests/test_local_parity.py)
+# a rules file (see load_rules) replaces some of them, what /info does expose (towers, waves, map, limits, the slower enemy sample)
+# is taken from the info the game is built with
+ESTIMATED_RULES = {
+    "starting_money": 150,
+    "enemies": { # per type stats
+        "BASIC": {"health": 100, "speed": 50, "reward": 10},
+        "FAST": {"health": 60, "speed": 90, "reward": 12},
+        "TANK": {"health": 300, "speed": 30, "reward": 25},
+    },
+    # wave n: min(max_enemies, base + per_wave * n) enemies, of the first 1 + n // waves_per_type types (in turns), with
+    # their health scaled by 1 + health_growth * (n - 1)
+    "wave_enemies_base": 4,
+    "wave_enemies_per_wave": 2,
+    "waves_per_enemy_type": 3,
+    "wave_health_growth": 0.15,
+}
+
+# towers of the games built without an info (estimates too, the info of the server has the real ones)
+DEFAULT_TOWERS = [
+    {"type": "ARCHER", "cost": 50, "dps": 10, "range": 125, "attackCooldown": 0.5, "unlock_wave": 0},
+    {"type": "CANNON", "cost": 120, "dps": 30, "range": 100, "attackCooldown": 2.0, "unlock_wave": 3},
+    {"type": "SNIPER", "cost": 200, "dps": 25, "range": 225, "attackCooldown": 1.5, "unlock_wave": 6},
+]
+
+class IllegalActionError(ValueError):
+    pass
+
+# path cells are the centers of the cells crossed by the (axis aligned) segments between waypoints
+def path_cells_from_waypoints(waypoints: list[dict], cell_size: int) -> list[dict]:
+    cells = [{"x": waypoints[0]["x"], "y": waypoints[0]["y"]}]
+    for start, end in zip(waypoints, waypoints[1:]):
+        dx = end["x"] - start["x"]
+        dy = end["y"] - start["y"]
+        steps = max(abs(dx), abs(dy)) // cell_size
+        for i in range(1, steps + 1):
+            cells.append({"x": start["x"] + dx * i // steps, "y": start["y"] + dy * i // steps})
+
+    return cells
+
+def path_length_from_waypoints(waypoints: list[dict]) -> int:
+    return round(sum(math.hypot(end["x"] - start["x"], end["y"] - start["y"]) for start, end in zip(waypoints, waypoints[1:])))
+
+# the estimated rules updated with a json file holding some of their keys (e.g. the values of the server source)
+def load_rules(path: str) -> dict:
+    with open(path, "r") as f:
+        rules = json.load(f)
+    unknown_keys = set(rules) - set(ESTIMATED_RULES)
+    if unknown_keys:
+        raise ValueError(f"Unknown rules in {path}: {sorted(unknown_keys)} (expected some of {list(ESTIMATED_RULES)})")
+    return {**deepcopy(ESTIMATED_RULES), **rules}
+
+def default_game_info(waypoints: list[dict] = DEFAULT_MAP_WAYPOINTS) -> dict:
+    cell_size = 50
+    enemy_stats = ESTIMATED_RULES["enemies"]
+    enemy_types = list(enemy_stats)
+    slower_enemy_type = min(enemy_types, key=lambda t: enemy_stats[t]["speed"])
+    slower_enemy = enemy_stats[slower_enemy_type]
+    return {
+        "actions": [{"type": "NOOP"}, {"type": "BUILD_TOWER", "towerType": None, "position": {"x": 0, "y": 0}}],
+        "towers": deepcopy(DEFAULT_TOWERS),
+        "map": {
+            "cell_size": cell_size,
+            "width": 900,
+            "height": 600,
+            "waypoints": deepcopy(waypoints),
+            "path_cells": path_cells_from_waypoints(waypoints, cell_size),
+            "path_length": path_length_from_waypoints(waypoints),
+        },
+        "waves": {
+            "enemy_types": enemy_types,
+            "wave_delay": 10,
+            "max_enemies": 20,
+            "spawn_delay": 0.5,
+            "slower_enemy_sample": {
+                "type": slower_enemy_type,
+                "position": {"x": waypoints[0]["x"], "y": waypoints[0]["y"]},
+                "currentHealth": slower_enemy["health"],
+                "fullHealth": slower_enemy["health"],
+                "currentSpeed": slower_enemy["speed"],
+                "pathProgress": 0,
+            },
+        },
+        "max_global_info": {"gameTime": 1800, "waveNumber": 50, "money": 5000, "lives": 20},
+        "slower_tower_sample": deepcopy(max(DEFAULT_TOWERS, key=lambda t: t["attackCooldown"])),
+    }
+
+# in-process implementation of the game rules, entities are stored column-wise in numpy arrays
+# every tower and enemy gets an id when it appears, never reused in a game: the columns stay sorted by id (see state_delta.py)
+# rules: the ones /info does not give (see ESTIMATED_RULES, load_rules), the estimates by default
+class LocalGame:
+    def __init__(self, game_info: dict | None = None, rules: dict | None = None):
+        self.game_info = deepcopy(game_info) if game_info is not None else default_game_info()
+        self.rules = deepcopy(rules) if rules is not None else deepcopy(ESTIMATED_RULES)
+        self.enemy_stats = self.rules["enemies"]
+        sample = self.game_info["waves"].get("slower_enemy_sample")
+        if sample is not None and sample["type"] in self.enemy_stats: # the one enemy the server describes
+            self.enemy_stats[sample["type"]].update(health=sample["fullHealth"], speed=sample["currentSpeed"])
+        self.tower_types = self.game_info["towers"]
+        self.tower_type_to_index = {tower["type"]: idx for idx, tower in enumerate(self.tower_types)}
+        self.enemy_types = self.game_info["waves"]["enemy_types"]
+        self.cell_size = self.game_info["map"]["cell_size"]
+        self.map_horizontal_cells = self.game_info["map"]["width"] // self.cell_size
+        self.map_vertical_cells = self.game_info["map"]["height"] // self.cell_size
+
+        # per type lookup tables
+        self.tower_cost = np.array([tower["cost"] for tower in self.tower_types], dtype=np.int64)
+        self.tower_range = np.array([tower["range"] for tower in self.tower_types], dtype=np.float64)
+        self.tower_cooldown = np.array([tower["attackCooldown"] for tower in self.tower_types], dtype=np.float64)
+        self.tower_damage = np.array([tower["dps"] * tower["attackCooldown"] for tower in self.tower_types], dtype=np.float64)
+        self.enemy_health = np.array([self.enemy_stats[t]["health"] for t in self.enemy_types], dtype=np.float64)
+        self.enemy_speed = np.array([self.enemy_stats[t]["speed"] for t in self.enemy_types], dtype=np.float64)
+        self.enemy_reward = np.array([self.enemy_stats[t]["reward"] for t in self.enemy_types], dtype=np.int64)
+
+        self.set_map(self.game_info["map"].get("waypoints", DEFAULT_MAP_WAYPOINTS))
+
+    def info(self) -> dict:
+        return deepcopy(self.game_info)
+
+    def set_map(self, waypoints: list[dict]) -> None:
+        map_info = self.game_info["map"]
+        map_info["waypoints"] = deepcopy(waypoints)
+        map_info["path_cells"] = path_cells_from_waypoints(waypoints, self.cell_size)
+        map_info["path_length"] = path_length_from_waypoints(waypoints)
+
+        self.waypoints = np.array([[p["x"], p["y"]] for p in waypoints], dtype=np.float64)
+        segments = np.diff(self.waypoints, axis=0)
+        self.segment_lengths = np.hypot(segments[:, 0], segments[:, 1])
+        self.segment_starts = np.concatenate([[0.0], np.cumsum(self.segment_lengths)[:-1]])
+        self.path_length = float(self.segment_lengths.sum())
+
+        self.path_grid = np.zeros((self.map_horizontal_cells, self.map_vertical_cells), dtype=bool)
+        for cell in map_info["path_cells"]:
+            self.path_grid[int(cell["x"] // self.cell_size), int(cell["y"] // self.cell_size)] = True
+        self.reset()
+
+    def reset(self) -> dict:
+        self.ticks = 0
+        self.wave_number = 0
+        self.money = self.rules["starting_money"]
+        self.lives = self.game_info["max_global_info"]["lives"]
+        self.game_over = False
+        self.next_wave_time = self.game_info["waves"]["wave_delay"]
+        self.spawn_queue = [] # (spawn time, enemy type index, full health) of the current wave, ordered by time
+
+        self.next_tower_id = 0
+        self.next_enemy_id = 0
+        self.tower_id = np.zeros(0, dtype=np.int64)
+        self.tower_x = np.zeros(0, dtype=np.int64) # cell indices
+        self.tower_y = np.zeros(0, dtype=np.int64)
+        self.tower_type = np.zeros(0, dtype=np.int64)
+        self.tower_ready_in = np.zeros(0, dtype=np.float64)
+        self.occupied = self.path_grid.copy()
+
+        self.enemy_id = np.zeros(0, dtype=np.int64)
+        self.enemy_type = np.zeros(0, dtype=np.int64)
+        self.enemy_distance = np.zeros(0, dtype=np.float64)
+        self.enemy_current_health = np.zeros(0, dtype=np.float64)
+        self.enemy_full_health = np.zeros(0, dtype=np.float64)
+
+        return self.state()
+
+    @property
+    def game_time(self) -> float:
+        return round(self.ticks * TICK_SECONDS, 6)
+
+    # apply the action and advance the game by the given ticks (stops at game over), raises IllegalActionError without advancing
+    # with more than one tick the state gets a "ticks" list with the summary of each tick, to accumulate rewards
+    def step(self, game_action: dict, ticks: int = 1) -> dict:
+        tick_summaries = self.advance(game_action, ticks)
+        state = self.state()
+        if ticks > 1:
+            state["ticks"] = tick_summaries
+        return state
+
+    # step without building the state, returns the summaries of the ticks when there are more than one
+    def advance(self, game_action: dict, ticks: int = 1) -> list[dict]:
+        if game_action["type"] == "BUILD_TOWER":
+            self.__build_tower(game_action)
+        tick_summaries = []
+        for _ in range(ticks):
+            if self.game_over:
+                break
+            self.__tick()
+            if ticks > 1:
+                tick_summaries.append(self.summary())
+        return tick_summaries
+
+    # the whole game state as plain lists and numbers (json or msgpack serializable), see restore
+    def snapshot(self) -> dict:
+        return {
+            "waypoints": deepcopy(self.game_info["map"]["waypoints"]),
+            "ticks": self.ticks,
+            "waveNumber": self.wave_number,
+            "money": self.money,
+            "lives": self.lives,
+            "gameOver": self.game_over,
+            "nextWaveTime": self.next_wave_time,
+            "spawnQueue": [[t, int(e), float(h)] for t, e, h in self.spawn_queue],
+            "towers": {"id": self.tower_id.tolist(), "x": self.tower_x.tolist(), "y": self.tower_y.tolist(), "type": self.tower_type.tolist(), "readyIn": self.tower_ready_in.tolist()},
+            "enemies": {"id": self.enemy_id.tolist(), "type": self.enemy_type.tolist(), "distance": self.enemy_distance.tolist(), "currentHealth": self.enemy_current_health.tolist(), "fullHealth": self.enemy_full_health.tolist()},
+        }
+
+    # continue the game from a snapshot (on its map), returns the game state
+    def restore(self, snapshot: dict) -> dict:
+        if snapshot["waypoints"] != self.game_info["map"]["waypoints"]:
+            self.set_map(snapshot["waypoints"])
+        self.ticks = snapshot["ticks"]
+        self.wave_number = snapshot["waveNumber"]
+        self.money = snapshot["money"]
+        self.lives = snapshot["lives"]
+        self.game_over = snapshot["gameOver"]
+        self.next_wave_time = snapshot["nextWaveTime"]
+        self.spawn_queue = [(t, e, h) for t, e, h in snapshot["spawnQueue"]]
+
+        # snapshots saved before the ids get new ones
+        towers = snapshot["towers"]
+        self.tower_id = np.array(towers.get("id", range(len(towers["x"]))), dtype=np.int64)
+        self.next_tower_id = int(self.tower_id.max(initial=-1)) + 1
+        self.tower_x = np.array(towers["x"], dtype=np.int64)
+        self.tower_y = np.array(towers["y"], dtype=np.int64)
+        self.tower_type = np.array(towers["type"], dtype=np.int64)
+        self.tower_ready_in = np.array(towers["readyIn"], dtype=np.float64)
+        self.occupied = self.path_grid.copy()
+        self.occupied[self.tower_x, self.tower_y] = True
+
+        enemies = snapshot["enemies"]
+        self.enemy_id = np.array(enemies.get("id", range(len(enemies["type"]))), dtype=np.int64)
+        self.next_enemy_id = int(self.enemy_id.max(initial=-1)) + 1
+        self.enemy_type = np.array(enemies["type"], dtype=np.int64)
+        self.enemy_distance = np.array(enemies["distance"], dtype=np.float64)
+        self.enemy_current_health = np.array(enemies["currentHealth"], dtype=np.float64)
+        self.enemy_full_health = np.array(enemies["fullHealth"], dtype=np.float64)
+
+        return self.state()
+
+    def summary(self) -> dict:
+        return {"enemyCount": len(self.enemy_type), "waveNumber": self.wave_number, "money": self.money, "lives": self.lives, "gameOver": self.game_over}
+
+    def state(self) -> dict:
+        enemy_x, enemy_y = self.__enemy_positions()
+        tower_centers_x = (self.tower_x * self.cell_size + self.cell_size / 2).tolist()
+        tower_centers_y = (self.tower_y * self.cell_size + self.cell_size / 2).tolist()
+        return {
+            "gameTime": self.game_time,
+            "waveNumber": self.wave_number,
+            "money": self.money,
+            "lives": self.lives,
+            "gameOver": self.game_over,
+            "towers": [
+                {"type": self.tower_types[t]["type"], "position": {"x": x, "y": y}, "attackCooldown": c}
+                for t, x, y, c in zip(self.tower_type.tolist(), tower_centers_x, tower_centers_y, self.tower_ready_in.tolist())
+            ],
+            "enemies": [
+                {"type": self.enemy_types[t], "position": {"x": x, "y": y}, "currentHealth": h, "fullHealth": f, "currentSpeed": self.enemy_stats[self.enemy_types[t]]["speed"], "pathProgress": d / self.path_length}
+                for t, x, y, h, f, d in zip(self.enemy_type.tolist(), enemy_x.tolist(), enemy_y.tolist(), self.enemy_current_health.tolist(), self.enemy_full_health.tolist(), self.enemy_distance.tolist())
+            ],
+        }
+
+    # towers and enemies as columns (copies) with their ids and the values of state(), types as indices
+    def entity_columns(self) -> dict[str, dict[str, np.ndarray]]:
+        enemy_x, enemy_y = self.__enemy_positions()
+        return {
+            "towers": {
+                "id": self.tower_id.copy(),
+                "type": self.tower_type.copy(),
+                "x": self.tower_x * self.cell_size + self.cell_size / 2,
+                "y": self.tower_y * self.cell_size + self.cell_size / 2,
+                "attackCooldown": self.tower_ready_in.copy(),
+            },
+            "enemies": {
+                "id": self.enemy_id.copy(),
+                "type": self.enemy_type.copy(),
+                "x": enemy_x,
+                "y": enemy_y,
+                "currentHealth": self.enemy_current_health.copy(),
+                "fullHealth": self.enemy_full_health.copy(),
+                "currentSpeed": self.enemy_speed[self.enemy_type],
+                "pathProgress": self.enemy_distance / self.path_length,
+            },
+        }
+
+    def __build_tower(self, game_action: dict) -> None:
+        tower_index = self.tower_type_to_index.get(game_action["towerType"])
+        if tower_index is None:
+            raise IllegalActionError(f"Unknown tower type: {game_action['towerType']}")
+        x = int(game_action["position"]["x"] // self.cell_size)
+        y = int(game_action["position"]["y"] // self.cell_size)
+        if not (0 <= x < self.map_horizontal_cells and 0 <= y < self.map_vertical_cells):
+            raise IllegalActionError("Position out of the map")
+        if self.occupied[x, y]:
+            raise IllegalActionError("Cell is occupied or on the path")
+        if self.money < self.tower_cost[tower_index]:
+            raise IllegalActionError("Not enough money")
+        if self.wave_number < self.tower_types[tower_index]["unlock_wave"]:
+            raise IllegalActionError("Tower type is locked")
+
+        self.money -= int(self.tower_cost[tower_index])
+        self.occupied[x, y] = True
+        self.tower_id = np.append(self.tower_id, self.next_tower_id)
+        self.next_tower_id += 1
+        self.tower_x = np.append(self.tower_x, x)
+        self.tower_y = np.append(self.tower_y, y)
+        self.tower_type = np.append(self.tower_type, tower_index)
+        self.tower_ready_in = np.append(self.tower_ready_in, 0.0)
+
+    def __tick(self) -> None:
+        self.ticks += 1
+        now = self.game_time
+        self.__spawn_enemies(now)
+
+        # move enemies along the path, the ones reaching the end cost one life each
+        self.enemy_distance += self.enemy_speed[self.enemy_type] * TICK_SECONDS
+        leaked = self.enemy_distance >= self.path_length
+        if leaked.any():
+            self.lives = max(0, self.lives - int(leaked.sum()))
+            self.__remove_enemies(leaked)
+
+        self.__towers_attack()
+
+        if self.lives <= 0:
+            self.game_over = True
+
+    # start a new wave when its time comes, then release the queued enemies whose spawn time passed
+    def __spawn_enemies(self, now: float) -> None:
+        waves = self.game_info["waves"]
+        rules = self.rules
+        if now >= self.next_wave_time:
+            self.wave_number += 1
+            enemy_count = min(waves["max_enemies"], rules["wave_enemies_base"] + rules["wave_enemies_per_wave"] * self.wave_number)
+            unlocked_types = min(len(self.enemy_types), 1 + self.wave_number // rules["waves_per_enemy_type"])
+            health_scale = 1 + rules["wave_health_growth"] * (self.wave_number - 1)
+            for i in range(enemy_count):
+                enemy_type = (i + self.wave_number) % unlocked_types
+                self.spawn_queue.append((now + i * waves["spawn_delay"], enemy_type, self.enemy_health[enemy_type] * health_scale))
+            self.next_wave_time = now + waves["wave_delay"] + enemy_count * waves["spawn_delay"]
+
+        spawned = 0
+        while spawned < len(self.spawn_queue) and self.spawn_queue[spawned][0] <= now:
+            spawned += 1
+        if spawned > 0:
+            new_types = np.array([e[1] for e in self.spawn_queue[:spawned]], dtype=np.int64)
+            new_health = np.array([e[2] for e in self.spawn_queue[:spawned]], dtype=np.float64)
+            self.enemy_id = np.concatenate([self.enemy_id, np.arange(self.next_enemy_id, self.next_enemy_id + spawned)])
+            self.next_enemy_id += spawned
+            self.enemy_type = np.concatenate([self.enemy_type, new_types])
+            self.enemy_distance = np.concatenate([self.enemy_distance, np.zeros(spawned)])
+            self.enemy_current_health = np.concatenate([self.enemy_current_health, new_health])
+            self.enemy_full_health = np.concatenate([self.enemy_full_health, new_health])
+            del self.spawn_queue[:spawned]
+
+    # every ready tower shoots the enemy in range that is closest to the end of the path
+    def __towers_attack(self) -> None:
+        self.tower_ready_in = np.maximum(self.tower_ready_in - TICK_SECONDS, 0.0)
+        if len(self.enemy_type) == 0 or len(self.tower_type) == 0:
+            return
+
+        ready = np.flatnonzero(self.tower_ready_in <= 0)
+        if len(ready) == 0:
+            return
+        enemy_x, enemy_y = self.__enemy_positions()
+        tower_x = self.tower_x[ready] * self.cell_size + self.cell_size / 2
+        tower_y = self.tower_y[ready] * self.cell_size + self.cell_size / 2
+        squared_distance = (tower_x[:, None] - enemy_x[None, :])**2 + (tower_y[:, None] - enemy_y[None, :])**2
+        in_range = squared_distance < self.tower_range[self.tower_type[ready]][:, None]**2
+        shooting = in_range.any(axis=1)
+        if not shooting.any():
+            return
+
+        targets = np.argmax(np.where(in_range, self.enemy_distance[None, :], -1.0), axis=1)[shooting]
+        shooters = ready[shooting]
+        np.subtract.at(self.enemy_current_health, targets, self.tower_damage[self.tower_type[shooters]])
+        self.tower_ready_in[shooters] = self.tower_cooldown[self.tower_type[shooters]]
+
+        killed = self.enemy_current_health <= 0
+        if killed.any():
+            self.money += int(self.enemy_reward[self.enemy_type[killed]].sum())
+            self.__remove_enemies(killed)
+
+    def __remove_enemies(self, removed: np.ndarray) -> None:
+        alive = ~removed
+        self.enemy_id = self.enemy_id[alive]
+        self.enemy_type = self.enemy_type[alive]
+        self.enemy_distance = self.enemy_distance[alive]
+        self.enemy_current_health = self.enemy_current_health[alive]
+        self.enemy_full_health = self.enemy_full_health[alive]
+
+    def __enemy_positions(self) -> tuple[np.ndarray, np.ndarray]:
+        segment = np.clip(np.searchsorted(self.segment_starts, self.enemy_distance, side="right") - 1, 0, len(self.segment_lengths) - 1)
+        fraction = np.minimum((self.enemy_distance - self.segment_starts[segment]) / self.segment_lengths[segment], 1.0)
+        start = self.waypoints[segment]
+        end = self.waypoints[segment + 1]
+        positions = start + (end - start) * fraction[:, None]
+        return positions[:, 0], positions[:, 1]
@@ -0,0 +1,87 @@
+import numpy as np
+
+# everything TowerDefenseWorldEnv derives from one map, computed once per map
+# game_info: the game info with the "map" entry of this map
+class MapTables:
+    def __init__(self, game_info: dict, name: str, waypoints: list[dict] | None = None):
+        self.name = name
+        self.map_info = game_info["map"]
+        self.waypoints = waypoints if waypoints is not None else self.map_info.get("waypoints")
+        self.path_cells_coordinates_normalized = normalize_path_cells(self.map_info)
+        self.path_grid = calculate_path_grid(self.map_info)
+        self.coverage_table = calculate_coverage_table(self.map_info, game_info["towers"])
+        self.max_towers = self.path_grid.size - self.map_info["path_length"] // self.map_info["cell_size"]
+        self.max_enemies = calculate_total_enemies(game_info)
+        self.observation_encoder = None # set by the env, depends on the observation layout of all its maps
+        self.rasterizer = None # built by the env on the first local render
+
+# tables of a list of maps ({"name", "waypoints"} dicts, like custom-maps.json), the map info of each one is read from
+# the info cache of the backend or asked once to the backend, the maps are set in reverse order so that the first one is left
+# on the backend (set at the end if it was in the cache)
+class MapRegistry:
+    def __init__(self, backend, game_info: dict, map_list: list[dict]):
+        self.maps = [None] * len(map_list)
+        backend_map = None # index of the map last set on the backend
+        for index in reversed(range(len(map_list))):
+            waypoints = map_list[index]["waypoints"]
+            map_info = backend.cached_info(waypoints)
+            if map_info is None:
+                if not backend.set_map(waypoints):
+                    raise ConnectionError(f"Failed to set map {index}")
+                backend_map = index
+                map_info = backend.info()
+            map_game_info = dict(game_info, map=map_info["map"])
+            self.maps[index] = MapTables(map_game_info, map_list[index].get("name", f"map_{index}"), waypoints)
+        if map_list and backend_map != 0 and not backend.set_map(map_list[0]["waypoints"]):
+            raise ConnectionError("Failed to set map 0")
+
+    def __len__(self) -> int:
+        return len(self.maps)
+
+    def __getitem__(self, index: int) -> MapTables:
+        return self.maps[index]
+
+def normalize_path_cells(map_info: dict) -> list[float]:
+    normalized_coordinates = []
+    for cell in map_info["path_cells"]:
+        normalized_coordinates.append(cell["x"] / map_info["width"])
+        normalized_coordinates.append(cell["y"] / map_info["height"])
+
+    return normalized_coordinates
+
+# cells where nothing can be built because of the path, shape (horizontal cells, vertical cells)
+def calculate_path_grid(map_info: dict) -> np.ndarray:
+    cell_size = map_info["cell_size"]
+    path_grid = np.zeros((map_info["width"] // cell_size, map_info["height"] // cell_size), dtype=bool)
+    for cell in map_info["path_cells"]:
+        path_grid[int(cell["x"] // cell_size), int(cell["y"] // cell_size)] = True
+    path_grid.flags.writeable = False
+    return path_grid
+
+# path cells in range of a tower of each type built on each cell, shape (tower types, horizontal cells, vertical cells)
+# (a path cell is in range if its distance from the tower, placed at the cell center, is less than the tower range)
+def calculate_coverage_table(map_info: dict, tower_types: list[dict]) -> np.ndarray:
+    cell_size = map_info["cell_size"]
+    path_cells = np.array([[cell["x"], cell["y"]] for cell in map_info["path_cells"]], dtype=np.float64).reshape(-1, 2)
+    cell_centers_x = cell_size/2 + cell_size*np.arange(map_info["width"] // cell_size)
+    cell_centers_y = cell_size/2 + cell_size*np.arange(map_info["height"] // cell_size)
+    squared_distance = (cell_centers_x[:, None, None] - path_cells[None, None, :, 0])**2 + (cell_centers_y[None, :, None] - path_cells[None, None, :, 1])**2
+    tower_ranges = np.array([tower["range"] for tower in tower_types], dtype=np.float64)
+    coverage_table = (squared_distance[None] < tower_ranges[:, None, None, None]**2).sum(axis=-1).astype(np.int32)
+    coverage_table.flags.writeable = False
+    return coverage_table
+
+# worst case (assuming enemies remain alive, max number of enemies per wave and the slower spawns last):
+# - Time between waves: T = wave delay + max enemies per wave * spawn delay
+# - Number of actual waves: N = slower enemy time to complete path / T
+# - Number of total enemies: = N * max enemies per wave
+def calculate_total_enemies(game_info: dict) -> int:
+    wave_delay = game_info["waves"]["wave_delay"]
+    wave_max_enemies = game_info["waves"]["max_enemies"]
+    spawn_delay = game_info["waves"]["spawn_delay"]
+    slower_enemy_time = game_info["map"]["path_length"] / game_info["waves"]["slower_enemy_sample"]["currentSpeed"]
+    total_enemies = int(slower_enemy_time*wave_max_enemies/(wave_delay+spawn_delay*wave_max_enemies))
+    if slower_enemy_time < wave_delay:
+        total_enemies = wave_max_enemies
+
+    return total_enemies
@@ -0,0 +1,315 @@
+import numpy as np
+from gymnasium_env.envs.game_state import GameState, GameConstants
+
+# encodes a game state into the flat observation vector of TowerDefenseWorldEnv:
+# [global features | path cells | max_towers tower slots | max_enemies enemy slots]
+# everything that only depends on the game info is computed once, the output buffer is reused between calls
+class ObservationEncoder:
+    def __init__(self, game_info: dict, path_cells_coordinates_normalized: list[float], max_towers: int, max_enemies: int):
+        self.tower_types = game_info["towers"]
+        self.enemy_types = game_info["waves"]["enemy_types"]
+        self.max_towers = max_towers
+        self.max_enemies = max_enemies
+
+        # normalization constants, the divisions are done in float64 like the python floats they replace
+        constants = GameConstants(game_info)
+        self.max_game_time = constants.max_game_time
+        self.max_wave_number = constants.max_wave_number
+        self.max_money = constants.max_money
+        self.max_lives = constants.max_lives
+        self.map_width = constants.map_width
+        self.map_height = constants.map_height
+        self.slower_tower_attack_cooldown = constants.slower_tower_attack_cooldown
+
+        self.tower_type_to_index = {tower["type"]: idx for idx, tower in enumerate(self.tower_types)}
+        self.enemy_type_to_index = {enemy_type: idx for idx, enemy_type in enumerate(self.enemy_types)}
+
+        self.path_cells = np.array(path_cells_coordinates_normalized, dtype=np.float32)
+        self.global_feature_count = 5+len(self.path_cells) # game time, wave number, money, lives, game over, path cells coordinates
+        self.features_per_tower = 5+len(self.tower_types) # active, x, y, attack cooldown, dps, one-hot encoding type
+        self.tower_feature_count = self.max_towers * self.features_per_tower
+        self.features_per_enemy = 5+len(self.enemy_types) # active, x, y, health, path progress, one-hot encoding type
+        self.enemy_feature_count = self.max_enemies * self.features_per_enemy
+
+        # per-type rows with the features that only depend on the type (active flag, dps, one-hot type)
+        self.tower_rows = np.zeros((len(self.tower_types), self.features_per_tower), dtype=np.float64)
+        self.tower_rows[:, 0] = 1
+        self.tower_rows[:, 4] = constants.tower_dps / constants.max_tower_dps
+        self.tower_rows[:, 5:] = np.eye(len(self.tower_types))
+        self.enemy_rows = np.zeros((len(self.enemy_types), self.features_per_enemy), dtype=np.float64)
+        self.enemy_rows[:, 0] = 1
+        self.enemy_rows[:, 5:] = np.eye(len(self.enemy_types))
+        self.tower_scale = np.array([self.map_width, self.map_height, self.slower_tower_attack_cooldown], dtype=np.float64)
+        self.enemy_scale = np.array([self.map_width, self.map_height], dtype=np.float64)
+        self.size = self.global_feature_count + self.tower_feature_count + self.enemy_feature_count
+
+        self.buffer = np.zeros(self.size, dtype=np.float32)
+        self.buffer[5:self.global_feature_count] = self.path_cells # never changes
+        # filled tower and enemy slots of the internal buffer, only those need to be cleared on the next call
+        self.filled_slots = (0, 0)
+        self.mirror_version = None # (mirror, version) encoded in the internal buffer by encode_mirror
+
+    # writes the observation of a game state dict into out (or the internal buffer, overwritten by the next call) and returns it
+    def encode(self, game_state: dict, out: np.ndarray | None = None) -> np.ndarray:
+        tower_rows = self.tower_features(game_state["towers"]) if len(game_state["towers"]) > 0 else None
+        enemy_rows = self.enemy_features(game_state["enemies"]) if len(game_state["enemies"]) > 0 else None
+        return self.__fill(game_state, tower_rows, enemy_rows, out)
+
+    # same as encode for a GameState (see game_state.py), from the columns of its towers and enemies
+    def encode_state(self, game_state: GameState, out: np.ndarray | None = None) -> np.ndarray:
+        towers, enemies = game_state.towers, game_state.enemies
+        tower_rows = self.table_tower_features(towers, towers.ordered_slots()) if len(towers) > 0 else None
+        enemy_rows = self.table_enemy_features(enemies, enemies.ordered_slots()) if len(enemies) > 0 else None
+        return self.__fill(game_state, tower_rows, enemy_rows, out)
+
+    # same as encode for the game state of an EntityMirror (see state_delta.py), the towers and enemies are in the slot they have
+    # in the mirror: when the internal buffer has the previous version of the mirror, only the slots touched by the last
+    # response are written (the enemies move at every tick, the towers only change when built or cooling down)
+    def encode_mirror(self, mirror, game_state: GameState) -> np.ndarray:
+        out = self.buffer
+        self.encode_globals(game_state, out)
+        towers = self.__entity_block(out, self.global_feature_count, self.max_towers, self.features_per_tower)
+        enemies = self.__entity_block(out, self.global_feature_count + self.tower_feature_count, self.max_enemies, self.features_per_enemy)
+        if self.mirror_version == (mirror, mirror.version):
+            return out # same state (e.g. after an illegal action)
+        if self.mirror_version == (mirror, mirror.version - 1) and mirror.reload_version != mirror.version:
+            tower_slots = mirror.towers.touched_slots()
+            enemy_slots = mirror.enemies.touched_slots()
+        else:
+            towers[:] = 0
+            enemies[:] = 0
+            tower_slots = np.flatnonzero(mirror.towers.active)
+            enemy_slots = np.flatnonzero(mirror.enemies.active)
+        self.__write_slots(towers, mirror.towers, tower_slots, self.table_tower_features)
+        self.__write_slots(enemies, mirror.enemies, enemy_slots, self.table_enemy_features)
+        self.mirror_version = (mirror, mirror.version)
+        self.filled_slots = (self.max_towers, self.max_enemies) # encode clears everything after it
+        return out
+
+    # global features normalized: game time, wave number, money, lives, game over
+    def encode_globals(self, game_state: dict | GameState, out: np.ndarray) -> None:
+        if isinstance(game_state, GameState):
+            out[0] = game_state.game_time / self.max_game_time
+            out[1] = game_state.wave_number / self.max_wave_number
+            out[2] = game_state.money / self.max_money
+            out[3] = game_state.lives / self.max_lives
+            out[4] = game_state.game_over
+            return
+        out[0] = game_state["gameTime"] / self.max_game_time
+        out[1] = game_state["waveNumber"] / self.max_wave_number
+        out[2] = game_state["money"] / self.max_money
+        out[3] = game_state["lives"] / self.max_lives
+        out[4] = game_state["gameOver"]
+
+    # features of each tower, shape (towers, features_per_tower) float64
+    def tower_features(self, towers: list[dict]) -> np.ndarray:
+        # one pass over the dicts to get the columns: x, y, attack cooldown, type index
+        flat = [v for t in towers for v in (t["position"]["x"], t["position"]["y"], t["attackCooldown"], self.tower_type_to_index[t["type"]])]
+        columns = np.fromiter(flat, dtype=np.float64, count=len(flat)).reshape(len(towers), 4)
+        rows = self.tower_rows[columns[:, 3].astype(np.intp)] # active, dps and one-hot type come from the per-type row
+        rows[:, 1:4] = columns[:, :3] / self.tower_scale # normalized x, y, attack cooldown
+        return rows
+
+    # features of each enemy, shape (enemies, features_per_enemy) float64
+    def enemy_features(self, enemies: list[dict]) -> np.ndarray:
+        # x, y, current health, full health, path progress, type index
+        flat = [v for e in enemies for v in (e["position"]["x"], e["position"]["y"], e["currentHealth"], e["fullHealth"], e["pathProgress"], self.enemy_type_to_index[e["type"]])]
+        columns = np.fromiter(flat, dtype=np.float64, count=len(flat)).reshape(len(enemies), 6)
+        rows = self.enemy_rows[columns[:, 5].astype(np.intp)] # active and one-hot type
+        rows[:, 1:3] = columns[:, :2] / self.enemy_scale # normalized x, y
+        rows[:, 3] = columns[:, 2] / columns[:, 3] # normalized health
+        rows[:, 4] = columns[:, 4] # path progress
+        return rows
+
+    # features of the towers in the given slots of an EntityTable, same values as tower_features
+    def table_tower_features(self, table, slots: np.ndarray) -> np.ndarray:
+        rows = self.tower_rows[table.type[slots]]
+        rows[:, 1] = table.columns["x"][slots] / self.map_width
+        rows[:, 2] = table.columns["y"][slots] / self.map_height
+        rows[:, 3] = table.columns["attackCooldown"][slots] / self.slower_tower_attack_cooldown
+        return rows
+
+    # features of the enemies in the given slots of an EntityTable, same values as enemy_features
+    def table_enemy_features(self, table, slots: np.ndarray) -> np.ndarray:
+        rows = self.enemy_rows[table.type[slots]]
+        rows[:, 1] = table.columns["x"][slots] / self.map_width
+        rows[:, 2] = table.columns["y"][slots] / self.map_height
+        rows[:, 3] = table.columns["currentHealth"][slots] / table.columns["fullHealth"][slots]
+        rows[:, 4] = table.columns["pathProgress"][slots]
+        return rows
+
+    # tower_rows, enemy_rows: features of the towers and enemies in game order (None when there are none), packed from the first slot
+    def __fill(self, game_state: dict | GameState, tower_rows: np.ndarray | None, enemy_rows: np.ndarray | None, out: np.ndarray | None) -> np.ndarray:
+        if out is None:
+            out = self.buffer
+            last_tower_count, last_enemy_count = self.filled_slots
+        else:
+            out[:] = 0
+            out[5:self.global_feature_count] = self.path_cells
+            last_tower_count, last_enemy_count = 0, 0
+
+        self.encode_globals(game_state, out)
+
+        tower_count = 0 if tower_rows is None else len(tower_rows)
+        enemy_count = 0 if enemy_rows is None else len(enemy_rows)
+        if tower_count > self.max_towers:
+            raise ValueError(f"Too many towers: {tower_count} for the {self.max_towers} slots of the observation")
+        if enemy_count > self.max_enemies:
+            raise ValueError(f"Too many enemies: {enemy_count} for the {self.max_enemies} slots of the observation")
+
+        towers = self.__entity_block(out, self.global_feature_count, self.max_towers, self.features_per_tower)
+        towers[tower_count:last_tower_count] = 0 # slots of the towers gone since the last call
+        if tower_count > 0:
+            towers[:tower_count] = tower_rows
+
+        enemies = self.__entity_block(out, self.global_feature_count + self.tower_feature_count, self.max_enemies, self.features_per_enemy)
+        enemies[enemy_count:last_enemy_count] = 0
+        if enemy_count > 0:
+            enemies[:enemy_count] = enemy_rows
+
+        if out is self.buffer:
+            self.filled_slots = (tower_count, enemy_count)
+            self.mirror_version = None
+        return out
+
+    # rows of the slots (the ones without an entity cleared), an entity in a slot beyond the block does not fit the observation
+    # (as more entities than slots with encode), the slots beyond it of entities removed since are left out
+    def __write_slots(self, block: np.ndarray, table, slots: np.ndarray, features) -> None:
+        beyond = slots >= len(block)
+        if table.active[slots[beyond]].any():
+            raise ValueError(f"Too many {table.kind}: slot {slots[beyond].max()} is beyond the {len(block)} slots of the observation")
+        slots = slots[~beyond]
+        if len(slots) == 0:
+            return
+        rows = features(table, slots)
+        rows[~table.active[slots]] = 0
+        block[slots] = rows
+
+    def __entity_block(self, out: np.ndarray, offset: int, slots: int, features: int) -> np.ndarray:
+        return out[offset:offset + slots * features].reshape(slots, features)
+
+# the "entities" observation: the global features (with the path cells) and fixed-size arrays of tower and enemy features
+# with their counts, the towers beyond tower_slots are left out (the last built) and so are the enemies beyond enemy_slots
+# (the farthest from the end of the path)
+class EntityObservationEncoder(ObservationEncoder):
+    def __init__(self, game_info: dict, path_cells_coordinates_normalized: list[float], tower_slots: int, enemy_slots: int):
+        super().__init__(game_info, path_cells_coordinates_normalized, 0, 0)
+        self.tower_slots = tower_slots
+        self.enemy_slots = enemy_slots
+        self.buffers = {
+            "globals": np.zeros(self.global_feature_count, dtype=np.float32),
+            "towers": np.zeros((tower_slots, self.features_per_tower), dtype=np.float32),
+            "tower_count": np.zeros(1, dtype=np.float32),
+            "enemies": np.zeros((enemy_slots, self.features_per_enemy), dtype=np.float32),
+            "enemy_count": np.zeros(1, dtype=np.float32),
+        }
+        self.buffers["globals"][5:] = self.path_cells
+
+    # fills and returns the internal buffers (overwritten by the next call)
+    def encode(self, game_state: dict) -> dict[str, np.ndarray]:
+        towers = game_state["towers"][:self.tower_slots]
+        tower_rows = self.tower_features(towers) if len(towers) > 0 else None
+        enemy_rows = self.enemy_features(game_state["enemies"]) if len(game_state["enemies"]) > 0 else None
+        return self.__fill(game_state, tower_rows, enemy_rows)
+
+    # same as encode for a GameState (see game_state.py), from the columns of its towers and enemies
+    def encode_state(self, game_state: GameState) -> dict[str, np.ndarray]:
+        tower_slots = game_state.towers.ordered_slots()[:self.tower_slots]
+        enemy_slots = game_state.enemies.ordered_slots()
+        tower_rows = self.table_tower_features(game_state.towers, tower_slots) if len(tower_slots) > 0 else None
+        enemy_rows = self.table_enemy_features(game_state.enemies, enemy_slots) if len(enemy_slots) > 0 else None
+        return self.__fill(game_state, tower_rows, enemy_rows)
+
+    # the game state of an EntityMirror (see state_delta.py) is a GameState of its tables
+    def encode_mirror(self, mirror, game_state: GameState) -> dict[str, np.ndarray]:
+        return self.encode_state(game_state)
+
+    # tower_rows: features of the first tower_slots towers, enemy_rows: features of every enemy (None when there are none)
+    def __fill(self, game_state: dict | GameState, tower_rows: np.ndarray | None, enemy_rows: np.ndarray | None) -> dict[str, np.ndarray]:
+        out = self.buffers
+        self.encode_globals(game_state, out["globals"])
+
+        tower_count = 0 if tower_rows is None else len(tower_rows)
+        out["towers"][tower_count:] = 0
+        if tower_count > 0:
+            out["towers"][:tower_count] = tower_rows
+        out["tower_count"][0] = tower_count
+
+        enemy_count = 0 if enemy_rows is None else min(len(enemy_rows), self.enemy_slots)
+        out["enemies"][enemy_count:] = 0
+        if enemy_count > 0:
+            if len(enemy_rows) > enemy_count: # keep the enemies closest to the end of the path
+                enemy_rows = enemy_rows[np.argsort(-enemy_rows[:, 4], kind="stable")[:enemy_count]]
+            out["enemies"][:enemy_count] = enemy_rows
+        out["enemy_count"][0] = enemy_count
+        return out
+
+# the "grid" observation: a (channels, horizontal cells, vertical cells) uint8 tensor with the path, the towers of each type,
+# the enemy count and the sum of the enemy health fractions of each cell (32 per enemy, saturated at 255),
+# and the global features (without the path cells, already in the grid)
+class GridObservationEncoder(ObservationEncoder):
+    def __init__(self, game_info: dict, path_grid: np.ndarray):
+        super().__init__(game_info, [], 0, 0)
+        self.cell_size = game_info["map"]["cell_size"]
+        self.cells_x, self.cells_y = path_grid.shape
+        self.channel_count = 3 + len(self.tower_types) # path, towers by type, enemy count, enemy health
+        self.buffers = {
+            "grid": np.zeros((self.channel_count, self.cells_x, self.cells_y), dtype=np.uint8),
+            "globals": np.zeros(5, dtype=np.float32),
+        }
+        self.buffers["grid"][0] = path_grid * 255 # never changes
+
+    # fills and returns the internal buffers (overwritten by the next call)
+    def encode(self, game_state: dict) -> dict[str, np.ndarray]:
+        towers = game_state["towers"]
+        tower_columns = None
+        if len(towers) > 0:
+            flat = [v for t in towers for v in (t["position"]["x"], t["position"]["y"], self.tower_type_to_index[t["type"]])]
+            tower_columns = np.fromiter(flat, dtype=np.float64, count=len(flat)).reshape(len(towers), 3)
+        enemies = game_state["enemies"]
+        enemy_columns = None
+        if len(enemies) > 0:
+            flat = [v for e in enemies for v in (e["position"]["x"], e["position"]["y"], e["currentHealth"] / e["fullHealth"])]
+            enemy_columns = np.fromiter(flat, dtype=np.float64, count=len(flat)).reshape(len(enemies), 3)
+        return self.__fill(game_state, tower_columns, enemy_columns)
+
+    # same as encode for a GameState (see game_state.py), from the columns of its towers and enemies
+    def encode_state(self, game_state: GameState) -> dict[str, np.ndarray]:
+        towers, enemies = game_state.towers, game_state.enemies
+        tower_columns = None
+        if len(towers) > 0:
+            active = towers.active
+            tower_columns = np.stack([towers.columns["x"][active], towers.columns["y"][active], towers.type[active]], axis=1)
+        enemy_columns = None
+        if len(enemies) > 0:
+            active = enemies.active
+            enemy_columns = np.stack([enemies.columns["x"][active], enemies.columns["y"][active], enemies.columns["currentHealth"][active] / enemies.columns["fullHealth"][active]], axis=1)
+        return self.__fill(game_state, tower_columns, enemy_columns)
+
+    # the game state of an EntityMirror (see state_delta.py) is a GameState of its tables
+    def encode_mirror(self, mirror, game_state: GameState) -> dict[str, np.ndarray]:
+        return self.encode_state(game_state)
+
+    # tower_columns: (x, y, type index) of every tower, enemy_columns: (x, y, health fraction) of every enemy (None when there are none)
+    def __fill(self, game_state: dict | GameState, tower_columns: np.ndarray | None, enemy_columns: np.ndarray | None) -> dict[str, np.ndarray]:
+        out = self.buffers
+        self.encode_globals(game_state, out["globals"])
+        grid = out["grid"]
+        grid[1:] = 0
+        cell_count = self.cells_x * self.cells_y
+
+        if tower_columns is not None:
+            columns = tower_columns.astype(np.intp)
+            columns[:, :2] //= self.cell_size
+            grid[1 + columns[:, 2], columns[:, 0], columns[:, 1]] = 255
+
+        if enemy_columns is not None:
+            columns = enemy_columns
+            cells_x = np.clip((columns[:, 0] // self.cell_size).astype(np.intp), 0, self.cells_x - 1)
+            cells_y = np.clip((columns[:, 1] // self.cell_size).astype(np.intp), 0, self.cells_y - 1)
+            cells = cells_x * self.cells_y + cells_y
+            counts = np.bincount(cells, minlength=cell_count)
+            health = np.bincount(cells, weights=columns[:, 2], minlength=cell_count)
+            grid[-2] = np.minimum(counts * 32, 255).reshape(self.cells_x, self.cells_y)
+            grid[-1] = np.minimum(health * 32, 255).reshape(self.cells_x, self.cells_y)
+        return out
@@ -0,0 +1,77 @@
+import time
+
+SUB_BUCKETS = 4 # histogram buckets per power of 2, the quantiles are within ~12% of the exact ones
+BUCKETS = 64 * SUB_BUCKETS
+
+# index of the log-scale bucket of a duration in nanoseconds: 4 buckets per octave, from the leading bits (integer operations only)
+def bucket_index(nanoseconds: int) -> int:
+    bits = nanoseconds.bit_length()
+    if bits <= 2:
+        return nanoseconds
+    return (bits - 2) * SUB_BUCKETS + ((nanoseconds >> (bits - 3)) & (SUB_BUCKETS - 1))
+
+# smallest duration of a bucket, in nanoseconds
+def bucket_start(index: int) -> int:
+    if index < SUB_BUCKETS:
+        return index
+    octave, sub_bucket = divmod(index, SUB_BUCKETS)
+    return (SUB_BUCKETS + sub_bucket) << (octave - 1)
+
+# durations of named sections accumulated with perf_counter_ns, as totals, counts and log-scale histograms (fixed memory, nothing is logged)
+# usage: start = perf_counter_ns(); ...; timers.add("name", perf_counter_ns() - start)
+class PerfTimers:
+    def __init__(self):
+        self.sections = {} # name -> [total nanoseconds, count, histogram]
+
+    def add(self, name: str, nanoseconds: int) -> None:
+        section = self.sections.get(name)
+        if section is None:
+            section = self.sections[name] = [0, 0, [0] * BUCKETS]
+        section[0] += nanoseconds
+        section[1] += 1
+        section[2][bucket_index(nanoseconds)] += 1
+
+    # function calling the given one and adding its duration to the section
+    def timed(self, name: str, function):
+        def timed_function(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter_ns() - start)
+        return timed_function
+
+    # {name: {"total_ns", "count", "histogram"}} since the last reset, json/pickle friendly (see merge_perf_stats)
+    def stats(self, reset: bool = False) -> dict:
+        stats = {name: {"total_ns": total, "count": count, "histogram": histogram} for name, (total, count, histogram) in self.sections.items()}
+        if reset:
+            self.sections = {}
+        else:
+            stats = {name: dict(section, histogram=list(section["histogram"])) for name, section in stats.items()}
+        return stats
+
+# sums the stats of several timers (e.g. one per env), section by section
+def merge_perf_stats(all_stats: list[dict]) -> dict:
+    merged = {}
+    for stats in all_stats:
+        for name, section in stats.items():
+            if name not in merged:
+                merged[name] = {"total_ns": 0, "count": 0, "histogram": [0] * BUCKETS}
+            total = merged[name]
+            total["total_ns"] += section["total_ns"]
+            total["count"] += section["count"]
+            total["histogram"] = [a + b for a, b in zip(total["histogram"], section["histogram"])]
+    return merged
+
+# duration (nanoseconds) below which a fraction p of the timed calls are, the middle of the bucket where it falls
+def histogram_quantile(histogram: list[int], p: float) -> float:
+    count = sum(histogram)
+    if count == 0:
+        return float("nan")
+    rank = p * count
+    seen = 0
+    for index, bucket_count in enumerate(histogram):
+        seen += bucket_count
+        if seen >= rank and bucket_count > 0:
+            return (bucket_start(index) + bucket_start(index + 1)) / 2
+    return float(bucket_start(len(histogram)))
@@ -0,0 +1,74 @@
+import numpy as np
+
+BACKGROUND_COLOR = (34, 139, 34)
+PATH_COLOR = (194, 178, 128)
+TOWER_COLORS = [(30, 90, 200), (90, 90, 90), (150, 40, 170), (0, 170, 170), (230, 230, 230)] # by tower type index (cycled)
+ENEMY_COLORS = [(220, 40, 40), (250, 160, 0), (120, 40, 20), (240, 240, 0), (255, 105, 180)] # by enemy type index (cycled)
+HEALTH_COLOR = (0, 230, 0)
+MISSING_HEALTH_COLOR = (200, 0, 0)
+
+# draws game states with numpy only (no server call, no image library): the map with its path is drawn once,
+# towers and enemies are stamped as squares on a copy of it, enemies with a health bar above them
+# scale: integer downscale factor, the frames are (map height // scale, map width // scale, 3) uint8 rgb arrays
+class FrameRasterizer:
+    def __init__(self, game_info: dict, scale: int = 1):
+        if scale < 1:
+            raise ValueError(f"scale must be at least 1, got {scale}")
+        self.scale = scale
+        self.cell_size = game_info["map"]["cell_size"]
+        self.width = game_info["map"]["width"] // scale
+        self.height = game_info["map"]["height"] // scale
+        self.tower_type_to_index = {tower["type"]: idx for idx, tower in enumerate(game_info["towers"])}
+        self.enemy_type_to_index = {enemy_type: idx for idx, enemy_type in enumerate(game_info["waves"]["enemy_types"])}
+        self.tower_colors = np.array([TOWER_COLORS[i % len(TOWER_COLORS)] for i in range(len(self.tower_type_to_index))], dtype=np.uint8)
+        self.enemy_colors = np.array([ENEMY_COLORS[i % len(ENEMY_COLORS)] for i in range(len(self.enemy_type_to_index))], dtype=np.uint8)
+
+        self.background = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self.background[:] = BACKGROUND_COLOR
+        path_cell = self.cell_size // scale
+        for cell in game_info["map"]["path_cells"]:
+            left = int(cell["x"] // self.cell_size * self.cell_size) // scale
+            top = int(cell["y"] // self.cell_size * self.cell_size) // scale
+            self.background[top:top + path_cell, left:left + path_cell] = PATH_COLOR
+
+        # pixel offsets of the sprites around their center
+        self.tower_offsets = self.__square_offsets(max(1, int(self.cell_size * 0.7) // scale))
+        self.enemy_offsets = self.__square_offsets(max(1, int(self.cell_size * 0.4) // scale))
+        enemy_size = max(1, int(self.cell_size * 0.4) // scale)
+        bar_width = max(2, int(self.cell_size * 0.5) // scale)
+        bar_height = max(1, 4 // scale)
+        bar_y, bar_x = np.indices((bar_height, bar_width)).reshape(2, -1)
+        self.health_bar_offsets = (bar_y - enemy_size // 2 - bar_height - 1, bar_x - bar_width // 2)
+        self.health_bar_fraction = (bar_x + 0.5) / bar_width # position of each bar pixel, green up to the health fraction
+
+    # draws the game state into out (or a new array) and returns it
+    def draw(self, game_state: dict, out: np.ndarray | None = None) -> np.ndarray:
+        if out is None:
+            out = self.background.copy()
+        else:
+            np.copyto(out, self.background)
+
+        towers = game_state["towers"]
+        if len(towers) > 0:
+            columns = np.array([(t["position"]["x"], t["position"]["y"], self.tower_type_to_index[t["type"]]) for t in towers], dtype=np.float64)
+            self.__stamp(out, columns[:, 0], columns[:, 1], self.tower_offsets, self.tower_colors[columns[:, 2].astype(np.intp)][:, None, :])
+
+        enemies = game_state["enemies"]
+        if len(enemies) > 0:
+            columns = np.array([(e["position"]["x"], e["position"]["y"], self.enemy_type_to_index[e["type"]], e["currentHealth"] / e["fullHealth"]) for e in enemies], dtype=np.float64)
+            self.__stamp(out, columns[:, 0], columns[:, 1], self.enemy_offsets, self.enemy_colors[columns[:, 2].astype(np.intp)][:, None, :])
+            bar_colors = np.where((self.health_bar_fraction[None, :] <= columns[:, 3:4])[..., None], np.array(HEALTH_COLOR, dtype=np.uint8), np.array(MISSING_HEALTH_COLOR, dtype=np.uint8))
+            self.__stamp(out, columns[:, 0], columns[:, 1], self.health_bar_offsets, bar_colors)
+        return out
+
+    # writes the sprite pixels of every entity at once, the pixels outside the frame are clipped
+    def __stamp(self, out: np.ndarray, x: np.ndarray, y: np.ndarray, offsets: tuple[np.ndarray, np.ndarray], colors: np.ndarray) -> None:
+        rows = (y / self.scale).astype(np.intp)[:, None] + offsets[0][None, :]
+        cols = (x / self.scale).astype(np.intp)[:, None] + offsets[1][None, :]
+        inside = (rows >= 0) & (rows < self.height) & (cols >= 0) & (cols < self.width)
+        colors = np.broadcast_to(colors, rows.shape + (3,))
+        out[rows[inside], cols[inside]] = colors[inside]
+
+    def __square_offsets(self, size: int) -> tuple[np.ndarray, np.ndarray]:
+        offset_y, offset_x = np.indices((size, size)).reshape(2, -1)
+        return offset_y - size // 2, offset_x - size // 2
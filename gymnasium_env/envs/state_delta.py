@@ -0,0 +1,257 @@
+import heapq
+import numpy as np
+from gymnasium_env.envs.game_state import GameState, ENTITY_FIELDS, entity_dicts
+
+# delta-encoded game states: instead of every tower and enemy as a dict, a response only has the entities added, removed
+# and changed since the state the client already has, as columns keyed by the stable entity ids (see LocalGame.entity_columns)
+# {"gameTime", "waveNumber", "money", "lives", "gameOver", ("ticks"), "stateId": id of this state, "base": id of the state it
+#  applies to (None: a whole state, the client starts from nothing),
+#  "towers"/"enemies": {"added": {"id": [...], "type": [names], <field>: [...]}, "removed": [ids],
+#                       "changed": {<group>: {"id": [...], <field of the group>: [...]}}}}
+# the client sends the id of its state with each request (?delta=<state id>, NO_BASE for none), a server that no longer
+# has this state (another client, a request without delta) answers with a whole state
+NO_BASE = -1
+# fields sent for the entities kept from the base state, by group: an entity is in a group when a field of the group changed
+# (the enemies move at every tick, the towers only change while their attack cools down)
+CHANGE_GROUPS = {
+    "towers": {"cooldown": ("attackCooldown",)},
+    "enemies": {"position": ("x", "y", "pathProgress"), "health": ("currentHealth",)},
+}
+
+# server side: remembers the entity columns of the last state sent to compute the next delta
+class StateDeltaEncoder:
+    def __init__(self):
+        self.state_id = 0
+        self.previous = None # entity columns of the state self.state_id
+
+    # the game changed without a delta response (or the map), the next response is a whole state
+    def invalidate(self) -> None:
+        self.previous = None
+
+    # the state of the game as a delta from the state base (a whole state when base is not the last state sent)
+    def encode(self, game, base: int | None = NO_BASE, tick_summaries: list[dict] | None = None) -> dict:
+        columns = game.entity_columns()
+        type_names = {"towers": [tower["type"] for tower in game.tower_types], "enemies": game.enemy_types}
+        is_delta = self.previous is not None and base == self.state_id
+        payload = {"gameTime": game.game_time, "waveNumber": game.wave_number, "money": game.money, "lives": game.lives, "gameOver": game.game_over}
+        payload["base"] = self.state_id if is_delta else None
+        self.state_id += 1
+        payload["stateId"] = self.state_id
+        for kind, new in columns.items():
+            if is_delta:
+                payload[kind] = diff_entities(self.previous[kind], new, kind, type_names[kind])
+            else:
+                payload[kind] = {"added": entity_rows(new, 0, kind, type_names[kind]), "removed": [], "changed": {}}
+        if tick_summaries is not None:
+            payload["ticks"] = tick_summaries
+        self.previous = columns
+        return payload
+
+# the columns of the entities from row start, types as names
+def entity_rows(columns: dict[str, np.ndarray], start: int, kind: str, type_names: list[str]) -> dict:
+    rows = {"id": columns["id"][start:].tolist(), "type": [type_names[t] for t in columns["type"][start:].tolist()]}
+    for field in ENTITY_FIELDS[kind]:
+        rows[field] = columns[field][start:].tolist()
+    return rows
+
+# delta between two column sets sorted by id, the ids only grow: the entities added are the ones after the last old id,
+# the others were all there in the old state
+def diff_entities(old: dict[str, np.ndarray], new: dict[str, np.ndarray], kind: str, type_names: list[str]) -> dict:
+    old_ids = old["id"]
+    new_ids = new["id"]
+    kept_count = int(np.searchsorted(new_ids, old_ids[-1], side="right")) if len(old_ids) > 0 else 0
+    old_rows = np.searchsorted(old_ids, new_ids[:kept_count])
+    removed = np.ones(len(old_ids), dtype=bool)
+    removed[old_rows] = False
+    changed = {}
+    for group, fields in CHANGE_GROUPS[kind].items():
+        group_changed = new[fields[0]][:kept_count] != old[fields[0]][old_rows]
+        for field in fields[1:]:
+            group_changed |= new[field][:kept_count] != old[field][old_rows]
+        if group_changed.any():
+            rows = np.flatnonzero(group_changed)
+            changed[group] = {"id": new_ids[rows].tolist(), **{field: new[field][rows].tolist() for field in fields}}
+    return {"added": entity_rows(new, kept_count, kind, type_names), "removed": old_ids[removed].tolist(), "changed": changed}
+
+# client side: the entities of one kind as columns, each entity keeps its slot while it exists (a removed entity frees its slot,
+# the lowest free slot is given to the next one), so that a delta only writes the slots of the entities it names;
+# the slots written since clear_touched are given by touched_slots, the columns grow when full
+# iterating gives the entities as the dicts of a whole game state, in id order
+class EntityTable:
+    def __init__(self, kind: str, type_names: list[str], capacity: int = 64):
+        self.kind = kind
+        self.fields = ENTITY_FIELDS[kind]
+        self.type_names = list(type_names)
+        self.type_to_index = {name: index for index, name in enumerate(self.type_names)}
+        self.id = np.full(capacity, -1, dtype=np.int64)
+        self.type = np.zeros(capacity, dtype=np.int64)
+        self.columns = {field: np.zeros(capacity, dtype=np.float64) for field in self.fields}
+        self.active = np.zeros(capacity, dtype=bool)
+        self.slot_of = {} # id -> slot
+        self.slot_by_id = np.full(capacity, -1, dtype=np.intp) # same as an array, to look up the changed entities at once (grows with the ids)
+        self.free_slots = list(range(capacity)) # heap
+        self.touched = [] # arrays of slots
+
+    @property
+    def capacity(self) -> int:
+        return len(self.id)
+
+    def __len__(self) -> int:
+        return len(self.slot_of)
+
+    def clear(self) -> None:
+        self.touched.append(np.fromiter(self.slot_of.values(), dtype=np.intp, count=len(self.slot_of)))
+        self.slot_by_id[list(self.slot_of)] = -1
+        self.id[:] = -1
+        self.active[:] = False
+        self.slot_of = {}
+        self.free_slots = list(range(self.capacity))
+
+    def clear_touched(self) -> None:
+        self.touched = []
+
+    def touched_slots(self) -> np.ndarray:
+        return np.unique(np.concatenate(self.touched)) if self.touched else np.zeros(0, dtype=np.intp)
+
+    # rows = {"id": [...], "type": [names], <field>: [...]}, returns the slots of the entities
+    def add(self, rows: dict) -> np.ndarray:
+        ids = rows["id"]
+        if not ids:
+            return np.zeros(0, dtype=np.intp)
+        if len(self.slot_of) + len(ids) > self.capacity:
+            self.__grow(len(self.slot_of) + len(ids))
+        slots = np.array([heapq.heappop(self.free_slots) for _ in ids], dtype=np.intp)
+        self.slot_of.update(zip(ids, slots.tolist()))
+        if ids[-1] >= len(self.slot_by_id): # the ids are sorted
+            self.slot_by_id = np.concatenate([self.slot_by_id, np.full(max(len(self.slot_by_id), ids[-1] + 1 - len(self.slot_by_id)), -1, dtype=np.intp)])
+        self.slot_by_id[ids] = slots
+        self.id[slots] = ids
+        self.type[slots] = [self.type_to_index[name] for name in rows["type"]]
+        self.active[slots] = True
+        for field in self.fields:
+            self.columns[field][slots] = rows[field]
+        self.touched.append(slots)
+        return slots
+
+    def remove(self, ids: list[int]) -> None:
+        if not ids:
+            return
+        slots = self.slot_by_id[ids]
+        for entity_id, slot in zip(ids, slots.tolist()):
+            del self.slot_of[entity_id]
+            heapq.heappush(self.free_slots, slot)
+        self.slot_by_id[ids] = -1
+        self.id[slots] = -1
+        self.active[slots] = False
+        self.touched.append(slots)
+
+    # rows = {"id": [...], <some fields>: [...]}
+    def update(self, rows: dict) -> None:
+        slots = self.slot_by_id[rows["id"]]
+        for field, values in rows.items():
+            if field != "id":
+                self.columns[field][slots] = values
+        self.touched.append(slots)
+
+    # slots of the entities, in id order
+    def ordered_slots(self) -> np.ndarray:
+        slots = np.flatnonzero(self.active)
+        return slots[np.argsort(self.id[slots], kind="stable")]
+
+    # number of entities of each type
+    def type_counts(self) -> np.ndarray:
+        return np.bincount(self.type[self.active], minlength=len(self.type_names))
+
+    def __iter__(self):
+        slots = self.ordered_slots()
+        return entity_dicts(self.type_names, self.type[slots], {field: self.columns[field][slots] for field in self.fields})
+
+    def __grow(self, count: int) -> None:
+        capacity = max(2 * self.capacity, count)
+        extra = capacity - self.capacity
+        for field in self.fields:
+            self.columns[field] = np.concatenate([self.columns[field], np.zeros(extra)])
+        self.free_slots.extend(range(self.capacity, capacity))
+        heapq.heapify(self.free_slots)
+        self.id = np.concatenate([self.id, np.full(extra, -1, dtype=np.int64)])
+        self.type = np.concatenate([self.type, np.zeros(extra, dtype=np.int64)])
+        self.active = np.concatenate([self.active, np.zeros(extra, dtype=bool)])
+
+# client side mirror of the towers and enemies, patched in place by the delta responses (apply), which returns the game state
+# the env reads: a GameState (see game_state.py) with the tables as towers and enemies
+# version counts the applied responses and reload_version is the last one that replaced everything, the observation encoders
+# use them to only rewrite the touched slots (see ObservationEncoder.encode_mirror)
+class EntityMirror:
+    def __init__(self, game_info: dict, tower_capacity: int = 64, enemy_capacity: int = 64):
+        self.towers = EntityTable("towers", [tower["type"] for tower in game_info["towers"]], tower_capacity)
+        self.enemies = EntityTable("enemies", game_info["waves"]["enemy_types"], enemy_capacity)
+        self.state_id = None
+        self.version = 0
+        self.reload_version = 0
+        self.added_tower_slots = np.zeros(0, dtype=np.intp) # towers added by the last response (rewards, occupancy grid)
+        self.removed_tower_count = 0
+
+    # payload["preceding"]: responses received before this one and not applied yet (the ticks of a frame skip played as one
+    # request each, see HttpBackend.step), applied first, the added and removed towers are those of all of them
+    def apply(self, payload: dict) -> GameState:
+        self.towers.clear_touched()
+        self.enemies.clear_touched()
+        added_tower_slots = []
+        self.removed_tower_count = 0
+        reloaded = False
+        for part in payload.get("preceding", []) + [payload]:
+            is_delta = part.get("base") is not None
+            if is_delta:
+                if part["base"] != self.state_id:
+                    raise RuntimeError(f"Delta for state {part['base']} applied to state {self.state_id}")
+                self.removed_tower_count += len(part["towers"]["removed"])
+                for table in (self.towers, self.enemies):
+                    delta = part[table.kind]
+                    table.remove(delta["removed"])
+                    for rows in delta["changed"].values():
+                        table.update(rows)
+                    added_slots = table.add(delta["added"])
+                    if table is self.towers:
+                        added_tower_slots.append(added_slots)
+            else:
+                # everything is replaced, the towers already there before (same id) are not new
+                old_tower_ids = set(self.towers.slot_of)
+                self.towers.clear()
+                self.enemies.clear()
+                if "stateId" in part:
+                    self.towers.add(part["towers"]["added"])
+                    self.enemies.add(part["enemies"]["added"])
+                else: # whole state from a server without delta support, the ids are the positions in the lists
+                    self.towers.add(whole_state_rows(part["towers"], self.towers.fields))
+                    self.enemies.add(whole_state_rows(part["enemies"], self.enemies.fields))
+                added_tower_slots.append(np.array(sorted(slot for tower_id, slot in self.towers.slot_of.items() if tower_id not in old_tower_ids), dtype=np.intp))
+                self.removed_tower_count += len(old_tower_ids - self.towers.slot_of.keys())
+                reloaded = True
+            self.state_id = part.get("stateId")
+        # a slot freed by a removed tower may hold a tower added after it
+        added_tower_slots = np.unique(np.concatenate(added_tower_slots)) if len(added_tower_slots) > 1 else added_tower_slots[0]
+        self.added_tower_slots = added_tower_slots[self.towers.active[added_tower_slots]]
+        self.version += 1
+        if reloaded:
+            self.reload_version = self.version
+
+        return GameState(payload["gameTime"], payload["waveNumber"], payload["money"], payload["lives"], payload["gameOver"], self.towers, self.enemies, payload.get("ticks"))
+
+# number of enemies after a response of a server, from the number before it (see EntityMirror.apply for the kinds of responses)
+def enemy_count_after(payload: dict, previous_count: int) -> int:
+    enemies = payload["enemies"]
+    if isinstance(enemies, list):
+        return len(enemies)
+    if payload.get("base") is None:
+        return len(enemies["added"]["id"])
+    return previous_count - len(enemies["removed"]) + len(enemies["added"]["id"])
+
+# entity dicts of a whole game state -> table rows, ids are the positions in the list
+def whole_state_rows(entities: list[dict], fields: tuple[str, ...]) -> dict:
+    rows = {"id": list(range(len(entities))), "type": [entity["type"] for entity in entities]}
+    for field in fields:
+        if field in ("x", "y"):
+            rows[field] = [entity["position"][field] for entity in entities]
+        else:
+            rows[field] = [entity[field] for entity in entities]
+    return rows
@@ -1,74 +1,129 @@
-from copy import deepcopy
 import gymnasium as gym
-import requests
 import math
-import io
-from PIL import Image
 import numpy as np
 from gymnasium import spaces
-
-url = "http://localhost:3000/"
+from gymnasium_env.envs.action_log import ActionLog, to_game_actions
+from gymnasium_env.envs.backends import make_backend, DEFAULT_URL
+from gymnasium_env.envs.game_state import GameState, GameConstants
+from gymnasium_env.envs.map_registry import MapRegistry, MapTables
+from gymnasium_env.envs.observation import ObservationEncoder, EntityObservationEncoder, GridObservationEncoder
+from gymnasium_env.envs.perf import PerfTimers
+from gymnasium_env.envs.rasterizer import FrameRasterizer
+from gymnasium_env.envs.state_delta import EntityMirror
 
 class TowerDefenseWorldEnv(gym.Env):
     metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 60}
     
     # define action_space and observation_space
-    def __init__(self, render_mode="rgb_array"):
+    # backend: "http" to play on the game server at url, "local" to run the game rules in-process (the rules /info does not give
+    # are estimates, backend_options={"rules": path} replaces them, see local_game.py)
+    # backend_options: passed to the backend, e.g. {"timeout": (2.0, 10.0), "retries": 2, "encoding": "auto"} for http
+    # action_mode: "multi_discrete" for (action, tower type, x, y), "flat" for a single index over the other actions and every (tower type, cell) build,
+    # which lets action_masks() disable each illegal build
+    # frame_skip: game ticks advanced by each step (the action is applied on the first one), in a single request to the backend
+    # max_idle_frame_skip: optionally, ticks advanced by a NOOP step while no enemy is alive (e.g. between waves)
+    # render_source: "backend" to get the frames from the game backend (e.g. backend_options={"render_format": "raw"} for http),
+    # "local" to draw them from the last game state with numpy (see rasterizer.py), without any request
+    # render_scale: integer downscale factor of the rendered frames
+    # observation_mode: "flat" for a Box with a slot for every possible tower and enemy, "entities" for a Dict with the global features
+    # and at most entity_slots towers and enemies (with their counts), "grid" for a Dict with a uint8 (channels, x, y) grid and the global features
+    # (see observation.py, custom_policies/feature_extractors.py has a features extractor for each Dict mode)
+    # profile: time step, reset, render, action_masks and their parts (backend call, http request and decoding, observation, reward, info),
+    # read with get_perf_stats() (see perf.py, custom_callbacks/perf_info.py logs them), no cost when disabled
+    # state_updates: "full" to get the whole game state at each step, "delta" to get the entities added, removed and changed
+    # since the previous state and patch a columnar mirror of them (see state_delta.py, the local backend and the stand-in server
+    # support it, other servers answer with whole states that the mirror takes too), the flat observation then only rewrites
+    # the slots of the changed entities, which keep their slot while they exist instead of being packed in game order
+    # in both modes self.game_state is a GameState (see game_state.py): the global values as attributes and the towers and enemies as columns
+    def __init__(self, render_mode="rgb_array", backend="http", url=DEFAULT_URL, backend_options=None, action_mode="multi_discrete", frame_skip=1, max_idle_frame_skip=None, render_source="backend", render_scale=1, observation_mode="flat", entity_slots=64, profile=False, state_updates="full"):
+        if state_updates not in ("full", "delta"):
+            raise ValueError(f"Unknown state updates: {state_updates} (expected 'full' or 'delta')")
+        if render_source not in ("backend", "local"):
+            raise ValueError(f"Unknown render source: {render_source} (expected 'backend' or 'local')")
+        if observation_mode not in ("flat", "entities", "grid"):
+            raise ValueError(f"Unknown observation mode: {observation_mode} (expected 'flat', 'entities' or 'grid')")
+        if frame_skip < 1:
+            raise ValueError(f"Invalid frame skip: {frame_skip} (expected at least 1)")
+        if max_idle_frame_skip is not None and max_idle_frame_skip < frame_skip:
+            raise ValueError(f"Invalid max idle frame skip: {max_idle_frame_skip} (expected None or at least frame_skip, {frame_skip})")
+        self.observation_mode = observation_mode
+        self.entity_slots = entity_slots
         self.render_mode = render_mode
-        response = requests.get(url + "info")
-        if response.status_code != 200:
-            raise ConnectionError(f"Failed to get game info: {response.text}")
-
-        self.game_info = response.json()
+        self.render_source = render_source
+        self.render_scale = render_scale
+        self.action_mode = action_mode
+        self.frame_skip = frame_skip
+        self.max_idle_frame_skip = max_idle_frame_skip
+        state_options = {"delta": state_updates == "delta", "typed_states": state_updates == "full"} # set by state_updates, over backend_options
+        self.backend = make_backend(backend, url, **{**(backend_options or {}), **state_options})
+        self.game_info = self.backend.info()
+        self.constants = GameConstants(self.game_info)
         self.action_types = self.game_info["actions"]
         self.tower_types = self.game_info["towers"]
         self.cell_size = self.game_info["map"]["cell_size"]
         self.map_horizontal_cells = self.game_info["map"]["width"] // self.cell_size
         self.map_vertical_cells = self.game_info["map"]["height"] // self.cell_size
 
-        self.action_space = spaces.MultiDiscrete([len(self.action_types), len(self.tower_types), self.map_horizontal_cells, self.map_vertical_cells]) # action, tower type, x, y
-
-        self.path_cells_coordinates_normalized = self.__normalize_path_cells()
-        self.max_towers = self.map_horizontal_cells * self.map_vertical_cells - self.game_info["map"]["path_length"] // self.cell_size
-        self.max_enemies = self.__calculate_total_enemies()
-
-        #self.global_feature_count = 4+self.map_horizontal_cells*self.map_vertical_cells # game time, wave number, money, game over, grid map
-        self.global_feature_count = 5+len(self.path_cells_coordinates_normalized) # game time, wave number, money, lives, game over, path cells coordinates
-        self.features_per_tower = 5+len(self.tower_types) # active, x, y, attack cooldown, dps, one-hot encoding type
-        self.tower_feature_count = self.max_towers * self.features_per_tower
-        self.features_per_enemy = 5+len(self.game_info["waves"]["enemy_types"]) # active, x, y, health, path progress, one-hot encoding type
-        self.enemy_feature_count = self.max_enemies * self.features_per_enemy
-
-        total_features_count = self.global_feature_count + self.tower_feature_count + self.enemy_feature_count
-        self.observation_space = spaces.Box(
-            low=0.0,
-            high=1.0,
-            shape=(total_features_count,),
-            dtype=np.float32
-        )
+        self.build_action_index = next(idx for idx, action in enumerate(self.action_types) if action["type"] == "BUILD_TOWER")
+        self.other_action_indices = [idx for idx, action in enumerate(self.action_types) if action["type"] != "BUILD_TOWER"]
+        if action_mode == "multi_discrete":
+            self.action_space = spaces.MultiDiscrete([len(self.action_types), len(self.tower_types), self.map_horizontal_cells, self.map_vertical_cells]) # action, tower type, x, y
+        elif action_mode == "flat":
+            self.action_space = spaces.Discrete(len(self.other_action_indices) + len(self.tower_types) * self.map_horizontal_cells * self.map_vertical_cells) # other actions, then builds ordered by (tower type, x, y)
+        else:
+            raise ValueError(f"Unknown action mode: {action_mode} (expected 'multi_discrete' or 'flat')")
 
         self.tower_type_to_index = {tower["type"]: idx for idx, tower in enumerate(self.tower_types)}
         self.enemy_type_to_index = {enemy_type: idx for idx, enemy_type in enumerate(self.game_info["waves"]["enemy_types"])}
-        self.most_expensive_tower_cost = max(tower["cost"] for tower in self.tower_types)
-        self.max_tower_dps = max(tower["dps"] for tower in self.tower_types)
+        self.noop_action_index = next(idx for idx, action in enumerate(self.action_types) if action["type"] == "NOOP")
+
+        # tables of the map set on the backend, switched by set_map and select_map (see register_maps)
+        self.map_registry = None
+        self.backend_map_tables = MapTables(self.game_info, "default")
+        self.__set_observation_layout([self.backend_map_tables])
+        self.__use_map(self.backend_map_tables)
+        self.mirror = EntityMirror(self.game_info, self.max_towers, self.max_enemies) if state_updates == "delta" else None
+
+        self.perf = None
+        if profile:
+            self.perf = PerfTimers()
+            self.__time_calls()
 
     # reset the environment and return the initial observation and info
+    # options={"start_state": snapshot} starts the episode from a snapshot (see snapshot()) instead of the beginning of the game
     def reset(self, seed=None, options=None) -> tuple[np.ndarray, dict]:
         super().reset(seed=seed)
-        response = requests.post(url + "reset")
-        if response.status_code != 200:
-            raise ConnectionError(f"Failed to reset game: {response.text}")
-
-        self.game_state = response.json()
+        start_state = (options or {}).get("start_state")
+        if start_state is not None:
+            self.__select_map_of(start_state)
+            self.game_state = self.backend.restore(start_state)
+        else:
+            self.game_state = self.backend.reset()
+        if self.mirror is not None:
+            self.game_state = self.mirror.apply(self.game_state)
+        self.from_start_state = start_state is not None
+        self.__rebuild_occupancy_grid()
         observation = self.__get_observation()
-        self.current_episode_actions = [] # to log actions taken in the current episode
+        self.current_episode_actions = ActionLog() # to log actions taken in the current episode (a new log each episode, the last one is handed to info)
         info = self.__get_info()
         
         return observation, info
 
+    # the whole game state (with its map) as a json serializable dict, to start episodes from it with reset(options={"start_state": ...})
+    # the http backend needs a server with the GET /snapshot and POST /restore endpoints (like the stand-in server)
+    def snapshot(self) -> dict:
+        return self.backend.snapshot()
+
+    # start a new episode from a snapshot, same as reset(options={"start_state": snapshot})
+    def restore(self, snapshot: dict) -> tuple[np.ndarray, dict]:
+        return self.reset(options={"start_state": snapshot})
+
     # perform the action and return the new observation, reward, terminated, truncated, info
-    def step(self, action: np.ndarray) -> tuple[np.ndarray, int, bool, bool, dict]:
-        action_index, tower_index, x, y = action
+    def step(self, action: np.ndarray | int) -> tuple[np.ndarray, int, bool, bool, dict]:
+        if self.action_mode == "flat":
+            action_index, tower_index, x, y = self.__decode_flat_action(int(action))
+        else:
+            action_index, tower_index, x, y = action
         game_action = self.action_types[action_index]
         if game_action["type"] == "BUILD_TOWER":
             game_action["towerType"] = self.tower_types[tower_index]["type"]
@@ -76,203 +131,330 @@ class TowerDefenseWorldEnv(gym.Env):
             game_action["position"]["y"] = self.cell_size/2 + self.cell_size*y
 
         # log the action taken
-        self.current_episode_actions.append(deepcopy(game_action))
-
-        response = requests.post(url + "step", json = game_action)
-        if response.status_code != 200:
+        if game_action["type"] == "BUILD_TOWER":
+            self.current_episode_actions.append(action_index, tower_index, x, y)
+        else:
+            self.current_episode_actions.append(action_index, 0, 0, 0)
+
+        ticks = self.frame_skip
+        if self.max_idle_frame_skip and game_action["type"] == "NOOP" and len(self.game_state.enemies) == 0:
+            ticks = max(ticks, self.max_idle_frame_skip)
+
+        # builds that are certainly illegal are rejected without asking the game backend
+        previous_tick = self.game_state.summary() # before the mirror is patched
+        new_game_state = None
+        if game_action["type"] != "BUILD_TOWER" or self.__is_build_allowed(tower_index, x, y):
+            new_game_state = self.backend.step(game_action, ticks)
+        if new_game_state is None:
             last_observation = self.__get_observation()
             info = self.__get_info()
             return last_observation, -1, False, False, info # small penalty for illegal action (building tower on path or in occupied cell)
 
-        new_game_state = response.json()
-        reward = self.__calculate_reward(new_game_state)
+        # the skipped ticks are logged as NOOPs so that the episode can be replayed one tick per action
+        if self.mirror is not None:
+            new_game_state = self.mirror.apply(new_game_state)
+        if new_game_state.ticks is not None and len(new_game_state.ticks) > 1:
+            self.current_episode_actions.append(self.noop_action_index, 0, 0, 0, count=len(new_game_state.ticks) - 1)
+
+        if self.mirror is not None:
+            new_towers = self.__tower_cells(new_game_state.towers, self.mirror.added_tower_slots)
+            towers_removed = self.mirror.removed_tower_count > 0
+        else:
+            old_towers_count = len(self.game_state.towers)
+            towers_removed = len(new_game_state.towers) < old_towers_count
+            new_towers = [] if towers_removed else self.__tower_cells(new_game_state.towers, np.arange(old_towers_count, len(new_game_state.towers))) # new towers are at the end of the list
+        reward = self.__calculate_reward(new_game_state, previous_tick, new_towers)
         self.game_state = new_game_state
+        self.__update_occupancy_grid(new_towers, towers_removed)
         observation = self.__get_observation()
-        terminated = new_game_state["gameOver"] or new_game_state["waveNumber"] >= self.game_info["max_global_info"]["waveNumber"] or new_game_state["money"] >= self.game_info["max_global_info"]["money"]
-        truncated = new_game_state["gameTime"] >= self.game_info["max_global_info"]["gameTime"]
+        terminated = new_game_state.game_over or new_game_state.wave_number >= self.constants.max_wave_number or new_game_state.money >= self.constants.max_money
+        truncated = new_game_state.game_time >= self.constants.max_game_time
         info = self.__get_info(terminated or truncated)
 
         return observation, reward, terminated, truncated, info
 
     # returns the game state as an rgb array
     def render(self) -> np.ndarray:
-        black_frame = np.zeros((self.game_info["map"]["height"], self.game_info["map"]["width"], 3), dtype=np.uint8)
+        black_frame = np.zeros((self.game_info["map"]["height"] // self.render_scale, self.game_info["map"]["width"] // self.render_scale, 3), dtype=np.uint8)
         if self.render_mode == "rgb_array":
-            response = requests.get(url + "render")
-            if response.status_code != 200:
-                print(f"Error during render: {response.text}")
+            if self.render_source == "local":
+                if self.map_tables.rasterizer is None:
+                    self.map_tables.rasterizer = FrameRasterizer(self.game_info, self.render_scale)
+                return self.map_tables.rasterizer.draw(self.game_state)
+            rgb_array = self.backend.render(self.render_scale)
+            if rgb_array is None:
                 return black_frame
-            image_bytes = io.BytesIO(response.content)
-            image = Image.open(image_bytes)
-            rgb_array = np.array(image)
             return rgb_array
         return black_frame
     
-    # just to comply with the interface
     def close(self):
-        pass
+        self.backend.close()
+
+    # durations of the timed sections since the last reset of the stats ({name: {"total_ns", "count", "histogram"}}, see PerfTimers),
+    # None without profile=True
+    def get_perf_stats(self, reset: bool = True) -> dict | None:
+        if self.perf is None:
+            return None
+        return self.perf.stats(reset)
+
+    # replaces the timed methods by wrappers on this instance only (the sections overlap: step includes backend, observation, reward and info)
+    def __time_calls(self) -> None:
+        timed = self.perf.timed
+        self.step = timed("step", self.step)
+        self.reset = timed("reset", self.reset)
+        self.render = timed("render", self.render)
+        self.action_masks = timed("action_masks", self.action_masks)
+        self.__get_observation = timed("observation", self.__get_observation)
+        self.__calculate_reward = timed("reward", self.__calculate_reward)
+        self.__get_info = timed("info", self.__get_info)
+        self.backend.step = timed("backend", self.backend.step)
+        transport = getattr(self.backend, "transport", None)
+        if transport is not None:
+            transport.request = timed("http", transport.request)
+            transport.decode = timed("decode", transport.decode)
+        state_decoder = getattr(self.backend, "state_decoder", None)
+        if state_decoder is not None: # typed states are parsed by the decoder instead of transport.decode
+            state_decoder.decode = timed("decode", state_decoder.decode)
+
+    # change the map in the game backend and compute the tables depending on it, the new map is used from the next reset
+    # name: reported in the info of the episodes played on the map
+    # the map must fit the observation layout (path length, max towers and enemies), register_maps makes room for several maps
+    def set_map(self, waypoints: list[dict], name: str = "custom") -> bool:
+        if not self.backend.set_map(waypoints):
+            return False
+        tables = MapTables(dict(self.game_info, map=self.backend.info()["map"]), name, waypoints)
+        self.backend_map_tables = tables
+        if len(tables.path_cells_coordinates_normalized) > self.path_cell_slots or tables.max_towers > self.max_towers or tables.max_enemies > self.max_enemies:
+            raise ValueError(f"Map {name} does not fit the observation layout, add it with register_maps() before training")
+        tables.observation_encoder = self.__make_observation_encoder(tables)
+        self.__use_map(tables)
+        return True
+
+    # computes the tables of the maps in map_list ({"name", "waypoints"} dicts) once, the observation layout is resized to fit
+    # all of them (call before creating the model), then select_map switches map without computing anything
+    # the first map of the list is selected
+    def register_maps(self, map_list: list[dict]) -> None:
+        self.map_registry = MapRegistry(self.backend, self.game_info, map_list)
+        self.backend_map_tables = self.map_registry[0] # the registry leaves the first map on the backend
+        self.__set_observation_layout([self.map_tables] + self.map_registry.maps)
+        self.__use_map(self.map_registry[0])
+
+    # switch to a registered map (from the next reset), the backend is only asked to change map if it has another one
+    def select_map(self, index: int) -> bool:
+        tables = self.map_registry[index]
+        if tables is not self.backend_map_tables:
+            if not self.backend.set_map(tables.waypoints):
+                return False
+            self.backend_map_tables = tables
+        self.__use_map(tables)
+        return True
+
+    # rows of info["episode_actions"] -> game actions as sent to the game server
+    def decode_actions(self, actions: np.ndarray) -> list[dict]:
+        return to_game_actions(actions, self.game_info)
+
+    # number of path cells in range of each tower type from each cell, shape (tower types, horizontal cells, vertical cells)
+    def get_coverage_table(self) -> np.ndarray:
+        return self.coverage_table
+
+    # free cells (in the current game state) sorted by path coverage for the given tower type, as (x, y, covered path cells) tuples
+    def rank_placements(self, tower_index: int, count: int | None = None) -> list[tuple[int, int, int]]:
+        coverage = np.where(self.occupancy_grid, -1, self.coverage_table[tower_index])
+        order = np.argsort(coverage, axis=None, kind="stable")[::-1][:count]
+        xs, ys = np.unravel_index(order, coverage.shape)
+        return [(int(x), int(y), int(coverage[x, y])) for x, y in zip(xs, ys) if coverage[x, y] >= 0]
 
     # create an action mask to disable illegal actions
     def action_masks(self) -> np.ndarray:
+        if self.action_mode == "flat":
+            return self.__flat_action_masks()
+
         action_type_mask = np.ones(len(self.action_types), dtype=bool)
-        tower_type_mask = np.ones(len(self.tower_types), dtype=bool)
         x_coordinate_mask = np.ones(self.map_horizontal_cells, dtype=bool)
         y_coordinate_mask = np.ones(self.map_vertical_cells, dtype=bool)
 
         # disable building towers if not enough money
-        cheapest_tower_type = min(self.tower_types, key=lambda t: t["cost"])
-        if self.game_state["money"] < cheapest_tower_type["cost"]:
+        if self.game_state.money < self.constants.cheapest_tower_cost:
             action_type_mask[1] = False # 1 = BUILD_TOWER
 
         # disable building towers if they cost too much or are locked
-        for idx, tower in enumerate(self.tower_types):
-            if self.game_state["money"] < tower["cost"] or self.game_state["waveNumber"] < tower["unlock_wave"]:
-                tower_type_mask[idx] = False
+        tower_type_mask = self.__tower_types_allowed()
 
         # for illegal coordinates I can't disable the action directly because the mask is applied per-dimension so I would disable all horizontal or vertical cells
         return np.concatenate([action_type_mask, tower_type_mask, x_coordinate_mask, y_coordinate_mask])
     
     # encodes the self game state into a tensor of shape self.observation_space.shape
-    def __get_observation(self) -> np.ndarray:
-        shape = self.observation_space.shape
-        if shape is None:
-            raise ValueError("Observation space shape is not defined")
-        observation = np.zeros(shape, dtype=np.float32)
-
-        # global features normalized
-        observation[0] = self.game_state["gameTime"] / self.game_info["max_global_info"]["gameTime"]
-        observation[1] = self.game_state["waveNumber"] / self.game_info["max_global_info"]["waveNumber"]
-        observation[2] = self.game_state["money"] / self.game_info["max_global_info"]["money"]
-        observation[3] = self.game_state["lives"] / self.game_info["max_global_info"]["lives"]
-        observation[4] = self.game_state["gameOver"]
-        observation[5:5+len(self.path_cells_coordinates_normalized)] = self.path_cells_coordinates_normalized
-        #observation[4:4+self.map_horizontal_cells*self.map_vertical_cells] = self.__calculate_grid_map()
-
-        # tower features normalized
-        for idx, tower in enumerate(self.game_state["towers"]):
-            offset = self.global_feature_count + idx * self.features_per_tower
-            observation[offset] = 1 # active
-            observation[offset+1] = tower["position"]["x"] / self.game_info["map"]["width"] # normalized x
-            observation[offset+2] = tower["position"]["y"] / self.game_info["map"]["height"] # normalized y
-            observation[offset+3] = tower["attackCooldown"] / self.game_info["slower_tower_sample"]["attackCooldown"] # normalized attack cooldown
-            observation[offset+4] = self.tower_types[self.tower_type_to_index[tower["type"]]]["dps"] / self.max_tower_dps # normalized dps
-            observation[offset+5+self.tower_type_to_index[tower["type"]]] = 1 # one-hot encoding type
-
-        # enemy features normalized
-        for idx, enemy in enumerate(self.game_state["enemies"]):
-            offset = self.global_feature_count + self.tower_feature_count + idx * self.features_per_enemy
-            observation[offset] = 1 # active
-            observation[offset+1] = enemy["position"]["x"] / self.game_info["map"]["width"] # normalized x
-            observation[offset+2] = enemy["position"]["y"] / self.game_info["map"]["height"] # normalized y
-            observation[offset+3] = enemy["currentHealth"] / enemy["fullHealth"] # normalized health
-            observation[offset+4] = enemy["pathProgress"]
-            observation[offset+5+self.enemy_type_to_index[enemy["type"]]] = 1 # one-hot encoding type
-
-        return observation
+    # (the encoder reuses its buffer, the copy keeps the returned observations independent, e.g. vec envs keep the terminal one)
+    def __get_observation(self) -> np.ndarray | dict[str, np.ndarray]:
+        if self.mirror is not None:
+            observation = self.observation_encoder.encode_mirror(self.mirror, self.game_state)
+        else:
+            observation = self.observation_encoder.encode_state(self.game_state)
+        if self.observation_mode == "flat":
+            return observation.copy()
+        return {key: value.copy() for key, value in observation.items()}
 
     # additional info for debugging or logging
     def __get_info(self, is_episode_over: bool = False) -> dict:
         info = {}
-        info["game_time"] = round(self.game_state["gameTime"])
-        info["wave_number"] = self.game_state["waveNumber"]
-        info["tower_counts"] = {tower_type["type"]: 0 for tower_type in self.tower_types}
-        for tower in self.game_state["towers"]:
-            info["tower_counts"][tower["type"]] += 1
+        info["game_time"] = round(self.game_state.game_time)
+        info["wave_number"] = self.game_state.wave_number
+        info["tower_counts"] = {tower_type["type"]: count for tower_type, count in zip(self.tower_types, self.game_state.towers.type_counts().tolist())}
         if is_episode_over:
-            info["episode_actions"] = deepcopy(self.current_episode_actions)
+            info["map_name"] = self.map_name
+            info["lives"] = self.game_state.lives
+            if self.from_start_state: # the actions don't replay the episode from the beginning of the game
+                info["start_state"] = True
+            else:
+                info["episode_actions"] = self.current_episode_actions.view() # raw (action, tower, x, y) rows, see decode_actions
 
         return info
 
-    def __normalize_path_cells(self) -> list[float]:
-        normalized_coordinates = []
-        for cell in self.game_info["map"]["path_cells"]:
-            normalized_coordinates.append(cell["x"] / self.game_info["map"]["width"])
-            normalized_coordinates.append(cell["y"] / self.game_info["map"]["height"])
+    # the env tables follow the map of the snapshot, the backend is only asked to change map if it has another one
+    def __select_map_of(self, snapshot: dict) -> None:
+        waypoints = snapshot["waypoints"]
+        if waypoints == self.map_tables.waypoints:
+            if self.map_tables is not self.backend_map_tables:
+                self.select_map(self.map_registry.maps.index(self.map_tables))
+            return
+        for index, tables in enumerate(self.map_registry.maps if self.map_registry else ()):
+            if waypoints == tables.waypoints:
+                self.select_map(index)
+                return
+        self.set_map(waypoints)
+
+    # observation sized for the largest of the maps: path cells, tower and enemy slots (the unused ones stay at 0)
+    def __set_observation_layout(self, maps: list[MapTables]) -> None:
+        self.path_cell_slots = max(len(tables.path_cells_coordinates_normalized) for tables in maps)
+        self.max_towers = max(tables.max_towers for tables in maps)
+        self.max_enemies = max(tables.max_enemies for tables in maps)
+
+        #self.global_feature_count = 4+self.map_horizontal_cells*self.map_vertical_cells # game time, wave number, money, game over, grid map
+        self.global_feature_count = 5+self.path_cell_slots # game time, wave number, money, lives, game over, path cells coordinates
+        self.features_per_tower = 5+len(self.tower_types) # active, x, y, attack cooldown, dps, one-hot encoding type
+        self.tower_feature_count = self.max_towers * self.features_per_tower
+        self.features_per_enemy = 5+len(self.game_info["waves"]["enemy_types"]) # active, x, y, health, path progress, one-hot encoding type
+        self.enemy_feature_count = self.max_enemies * self.features_per_enemy
+
+        total_features_count = self.global_feature_count + self.tower_feature_count + self.enemy_feature_count
+        if self.observation_mode == "flat":
+            self.observation_space = spaces.Box(
+                low=0.0,
+                high=1.0,
+                shape=(total_features_count,),
+                dtype=np.float32
+            )
+        elif self.observation_mode == "entities":
+            self.tower_slots = min(self.entity_slots, self.max_towers)
+            self.enemy_slots = min(self.entity_slots, self.max_enemies)
+            self.observation_space = spaces.Dict({
+                "globals": spaces.Box(low=0.0, high=1.0, shape=(self.global_feature_count,), dtype=np.float32),
+                "towers": spaces.Box(low=0.0, high=1.0, shape=(self.tower_slots, self.features_per_tower), dtype=np.float32),
+                "tower_count": spaces.Box(low=0.0, high=self.tower_slots, shape=(1,), dtype=np.float32),
+                "enemies": spaces.Box(low=0.0, high=1.0, shape=(self.enemy_slots, self.features_per_enemy), dtype=np.float32),
+                "enemy_count": spaces.Box(low=0.0, high=self.enemy_slots, shape=(1,), dtype=np.float32),
+            })
+        else:
+            self.observation_space = spaces.Dict({
+                "grid": spaces.Box(low=0, high=255, shape=(3 + len(self.tower_types), self.map_horizontal_cells, self.map_vertical_cells), dtype=np.uint8),
+                "globals": spaces.Box(low=0.0, high=1.0, shape=(5,), dtype=np.float32),
+            })
+        for tables in maps:
+            tables.observation_encoder = self.__make_observation_encoder(tables)
+
+    def __make_observation_encoder(self, tables: MapTables) -> ObservationEncoder:
+        game_info = dict(self.game_info, map=tables.map_info)
+        if self.observation_mode == "grid":
+            return GridObservationEncoder(game_info, tables.path_grid)
+        path_cells = tables.path_cells_coordinates_normalized + [0.0] * (self.path_cell_slots - len(tables.path_cells_coordinates_normalized))
+        if self.observation_mode == "entities":
+            return EntityObservationEncoder(game_info, path_cells, self.tower_slots, self.enemy_slots)
+        return ObservationEncoder(game_info, path_cells, self.max_towers, self.max_enemies)
+
+    # the env tables become the ones of the map
+    def __use_map(self, tables: MapTables) -> None:
+        self.map_tables = tables
+        self.map_name = tables.name
+        self.game_info["map"] = tables.map_info
+        self.path_cells_coordinates_normalized = tables.path_cells_coordinates_normalized
+        self.path_grid = tables.path_grid
+        self.coverage_table = tables.coverage_table
+        self.observation_encoder = tables.observation_encoder
+
+    # occupied cells (path or tower), kept up to date incrementally in step()
+    def __rebuild_occupancy_grid(self) -> None:
+        self.occupancy_grid = self.path_grid.copy()
+        towers = self.game_state.towers
+        self.occupancy_grid[(towers.columns["x"][towers.active] // self.cell_size).astype(np.intp), (towers.columns["y"][towers.active] // self.cell_size).astype(np.intp)] = True
+
+    # new_towers: (tower type index, x, y) of the towers built since the previous state, towers_removed: rebuild from scratch
+    def __update_occupancy_grid(self, new_towers: list[tuple[int, int, int]], towers_removed: bool) -> None:
+        if towers_removed:
+            self.__rebuild_occupancy_grid()
+            return
+        for _, x, y in new_towers:
+            self.occupancy_grid[x, y] = True
+
+    # (tower type index, x, y) of the towers in the given slots of the tower columns
+    def __tower_cells(self, towers, slots: np.ndarray) -> list[tuple[int, int, int]]:
+        xs = (towers.columns["x"][slots] // self.cell_size).astype(np.intp).tolist()
+        ys = (towers.columns["y"][slots] // self.cell_size).astype(np.intp).tolist()
+        return list(zip(towers.type[slots].tolist(), xs, ys))
+
+    def __tower_types_allowed(self) -> np.ndarray:
+        return (self.game_state.money >= self.constants.tower_costs) & (self.game_state.wave_number >= self.constants.tower_unlock_waves)
+
+    def __is_build_allowed(self, tower_index: int, x: int, y: int) -> bool:
+        return bool(self.__tower_types_allowed()[tower_index] and not self.occupancy_grid[x, y])
+
+    # flat index -> (action index, tower index, x, y)
+    def __decode_flat_action(self, action: int) -> tuple[int, int, int, int]:
+        if action < len(self.other_action_indices):
+            return self.other_action_indices[action], 0, 0, 0
+        tower_index, cell = divmod(action - len(self.other_action_indices), self.map_horizontal_cells * self.map_vertical_cells)
+        x, y = divmod(cell, self.map_vertical_cells)
+        return self.build_action_index, tower_index, x, y
+
+    # the other actions are always allowed, a build only with enough money, the tower type unlocked and a free cell
+    def __flat_action_masks(self) -> np.ndarray:
+        build_mask = self.__tower_types_allowed()[:, None] & ~self.occupancy_grid.reshape(1, -1)
+        return np.concatenate([np.ones(len(self.other_action_indices), dtype=bool), build_mask.ravel()])
 
-        return normalized_coordinates
-    
-    def __calculate_grid_map(self) -> list[float]:
-        grid_map = [0.0] * (self.map_horizontal_cells * self.map_vertical_cells) # 0 = empty, 0.5 = path, 1 = tower
-        for cell in self.game_info["map"]["path_cells"]:
-            x_index = cell["x"] // self.cell_size
-            y_index = cell["y"] // self.cell_size
-            grid_map[y_index * self.map_horizontal_cells + x_index] = 0.5 # mark path cells (never changes)
-
-        for tower in self.game_state["towers"]:
-            x_index = tower["position"]["x"] // self.cell_size
-            y_index = tower["position"]["y"] // self.cell_size
-            grid_map[y_index * self.map_horizontal_cells + x_index] = 1.0 # mark tower cells
-
-        return grid_map
-
-    # worst case (assuming enemies remain alive, max number of enemies per wave and the slower spawns last):
-    # - Time between waves: T = wave delay + max enemies per wave * spawn delay
-    # - Number of actual waves: N = slower enemy time to complete path / T
-    # - Number of total enemies: = N * max enemies per wave
-    def __calculate_total_enemies(self) -> int:
-        wave_delay = self.game_info["waves"]["wave_delay"]
-        wave_max_enemies = self.game_info["waves"]["max_enemies"]
-        spawn_delay = self.game_info["waves"]["spawn_delay"]
-        slower_enemy_time = self.game_info["map"]["path_length"] / self.game_info["waves"]["slower_enemy_sample"]["currentSpeed"]
-        total_enemies = int(slower_enemy_time*wave_max_enemies/(wave_delay+spawn_delay*wave_max_enemies))
-        if slower_enemy_time < wave_delay:
-            total_enemies = wave_max_enemies
-            
-        return total_enemies
-    
     # calculate the rewards based on the new game state
-    def __calculate_reward(self, new_game_state: dict) -> int:
+    # with frame skip new_game_state has the summaries of the skipped ticks in "ticks" (see LocalGame.step),
+    # the per-tick terms are accumulated over them while the action (building) only counts once
+    # previous_tick: summary of the previous state, new_towers: (tower type index, x, y) of the towers built since then
+    def __calculate_reward(self, new_game_state: GameState, previous_tick: dict, new_towers: list[tuple[int, int, int]]) -> int:
+        most_expensive_tower_cost = self.constants.most_expensive_tower_cost
         reward = 0
-        old_state = self.game_state
-        # + killing enemies
-        reward += max(0, len(old_state["enemies"]) - len(new_game_state["enemies"]))
-
-        # + completing waves
-        if new_game_state["waveNumber"] > old_state["waveNumber"]:
-            reward += new_game_state["waveNumber"]*2
-
-        # building towers + based on coverage and type, - penalized if no coverage
-        new_towers_count = len(new_game_state["towers"]) - len(old_state["towers"])
-        if new_towers_count > 0:
-            for i in range(new_towers_count):
-                tower = new_game_state["towers"][-i-1] # new towers are at the end of the list
-                tower_info = self.tower_types[self.tower_type_to_index[tower["type"]]]
-                path_coverage = self.__count_path_cells_in_range(tower)
-                if path_coverage == 0:
-                    reward -= 30
-                else:
-                    reward += tower_info["cost"] * tower_info["dps"] * path_coverage / 100
-
-        # - hoarding money uselessly
-        if new_game_state["money"] > self.most_expensive_tower_cost:
-            reward -= (new_game_state["money"] - self.most_expensive_tower_cost)
-
-        # - lives lost
-        reward -= (old_state["lives"] - new_game_state["lives"]) * 20
-
-        # - game over, for the illegal actions the penalty is given in step()
-        if new_game_state["gameOver"]:
-            reward -= 100
+        for i, tick in enumerate(new_game_state.ticks or [new_game_state.summary()]):
+            # + killing enemies
+            reward += max(0, previous_tick["enemyCount"] - tick["enemyCount"])
 
-        return round(reward)
+            # + completing waves
+            if tick["waveNumber"] > previous_tick["waveNumber"]:
+                reward += tick["waveNumber"]*2
+
+            # building towers + based on coverage and type, - penalized if no coverage
+            if i == 0:
+                for tower_index, x, y in new_towers:
+                    path_coverage = int(self.coverage_table[tower_index, x, y])
+                    if path_coverage == 0:
+                        reward -= 30
+                    else:
+                        reward += self.tower_types[tower_index]["cost"] * self.tower_types[tower_index]["dps"] * path_coverage / 100
+
+            # - hoarding money uselessly
+            if tick["money"] > most_expensive_tower_cost:
+                reward -= (tick["money"] - most_expensive_tower_cost)
 
-    # counts how many path cells are in range of the tower
-    def __count_path_cells_in_range(self, tower: dict) -> int:
-        count = 0
-        tower_index = self.tower_type_to_index[tower["type"]]
-        tower_range = self.game_info["towers"][tower_index]["range"]
-
-        # create a bounding box to quickly discard most path cells
-        min_x = tower["position"]["x"] - tower_range
-        max_x = tower["position"]["x"] + tower_range
-        min_y = tower["position"]["y"] - tower_range
-        max_y = tower["position"]["y"] + tower_range
-
-        for path_cell in self.game_info["map"]["path_cells"]:
-            # check if the cell is within the bounding box
-            if min_x < path_cell["x"] < max_x and min_y < path_cell["y"] < max_y:
-                distance = (tower["position"]["x"] - path_cell["x"])**2 + (tower["position"]["y"] - path_cell["y"])**2
-                if distance < tower_range**2:
-                    count += 1
-
-        return count
\ No newline at end of file
+            # - lives lost
+            reward -= (previous_tick["lives"] - tick["lives"]) * 20
+
+            # - game over, for the illegal actions the penalty is given in step()
+            if tick["gameOver"]:
+                reward -= 100
+
+            previous_tick = tick
+
+        return round(reward)
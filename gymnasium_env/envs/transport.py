@@ -0,0 +1,65 @@
+import json
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import msgpack
+except ImportError: # optional, json is used without it
+    msgpack = None
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+# keep-alive connection to one game server
+# encoding: "auto" uses msgpack once the server answers with it (and the package is installed), "json" never does
+# only connection errors and read errors of GET requests are retried, a POST could have already changed the game state
+class HttpTransport:
+    def __init__(self, url: str, timeout: tuple[float, float] = (2.0, 10.0), retries: int = 2, encoding: str = "auto"):
+        if encoding not in ("auto", "json", "msgpack"):
+            raise ValueError(f"Unknown encoding: {encoding} (expected 'auto', 'json' or 'msgpack')")
+        if encoding == "msgpack" and msgpack is None:
+            raise ImportError("msgpack encoding requested but the msgpack package is not installed")
+
+        self.url = url
+        self.timeout = timeout
+        self.accept_msgpack = encoding != "json" and msgpack is not None
+        self.send_msgpack = encoding == "msgpack" # with "auto" switched on by the first msgpack response
+
+        retry = Retry(total=retries, connect=retries, read=retries, status=0, other=0, allowed_methods=frozenset({"GET"}), backoff_factor=0.05, raise_on_status=False)
+        self.session = requests.Session()
+        self.session.mount(url, HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=retry))
+        self.session.headers["Accept"] = f"{MSGPACK_CONTENT_TYPE}, {JSON_CONTENT_TYPE};q=0.9" if self.accept_msgpack else JSON_CONTENT_TYPE
+
+    def get(self, path: str) -> requests.Response:
+        return self.request("GET", path)
+
+    def post(self, path: str, payload=None) -> requests.Response:
+        return self.request("POST", path, payload)
+
+    def request(self, method: str, path: str, payload=None) -> requests.Response:
+        headers = None
+        data = None
+        if payload is not None:
+            if self.send_msgpack:
+                data = msgpack.packb(payload)
+                headers = {"Content-Type": MSGPACK_CONTENT_TYPE}
+            else:
+                data = json.dumps(payload)
+                headers = {"Content-Type": JSON_CONTENT_TYPE}
+
+        response = self.session.request(method, self.url + path, data=data, headers=headers, timeout=self.timeout)
+        if self.accept_msgpack and not self.send_msgpack and self.is_msgpack(response):
+            self.send_msgpack = True # the server speaks msgpack, use it for the request bodies too
+        return response
+
+    def decode(self, response: requests.Response):
+        if self.is_msgpack(response):
+            return msgpack.unpackb(response.content)
+        return json.loads(response.content)
+
+    def close(self):
+        self.session.close()
+
+    def is_msgpack(self, response: requests.Response) -> bool:
+        return response.headers.get("Content-Type", "").startswith(MSGPACK_CONTENT_TYPE)
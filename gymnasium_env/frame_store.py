@@ -0,0 +1,202 @@
+import argparse
+import collections
+import json
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# single file of the frames of a replay, opened without reading the frames (the file is memory mapped) and decoded lazily
+# layout: header | compressed frames | index (offset, size, wave number per frame) | json metadata
+# every keyframe_interval-th frame is stored whole, the others as their xor with the previous frame (a few changed pixels, so
+# mostly zeros), each one compressed with zlib: reading frame i decompresses at most keyframe_interval frames, one when played in order
+MAGIC = b"TDFRAMES"
+VERSION = 1
+HEADER = struct.Struct("<8sIIIIIIQ") # magic, version, height, width, channels, keyframe interval, frame count, index offset
+INDEX_DTYPE = np.dtype([("offset", "<u8"), ("size", "<u4"), ("wave", "<i4")])
+KEYFRAME_INTERVAL = 32
+NO_WAVE = -1 # wave number of the frames whose wave is unknown (png directories saved without their waves)
+WAVES_FILE = "waves.json" # wave numbers of the frames of a png directory, see save_directory_waves
+
+# writes a frame store, the frames are compressed by a thread pool (zlib releases the GIL) and written in order by the caller,
+# at most max_pending of them wait for a worker; the file is written as path + ".tmp" and renamed by close, so an interrupted
+# capture never leaves a truncated store behind
+class FrameStoreWriter:
+    def __init__(self, path: str, keyframe_interval: int = KEYFRAME_INTERVAL, level: int = 1, workers: int | None = None, max_pending: int | None = None, metadata: dict | None = None):
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.level = level
+        self.metadata = metadata or {}
+        workers = workers or os.cpu_count() or 1
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.max_pending = max_pending or 2 * workers
+        self.pending = collections.deque() # (future of the compressed frame, wave number), in frame order
+        self.index = []
+        self.previous = None
+        self.shape = None
+        self.file = open(path + ".tmp", "wb")
+        self.file.write(bytes(HEADER.size)) # written by close
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def add(self, frame: np.ndarray, wave_number: int = NO_WAVE) -> None:
+        if self.shape is None:
+            self.shape = frame.shape if frame.ndim == 3 else frame.shape + (1,)
+        elif frame.shape[:2] != self.shape[:2]:
+            raise ValueError(f"Frame of shape {frame.shape} in a store of {self.shape} frames")
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        keyframe = (len(self.index) + len(self.pending)) % self.keyframe_interval == 0
+        data = frame if keyframe else np.bitwise_xor(frame, self.previous)
+        self.previous = frame
+        self.pending.append((self.pool.submit(zlib.compress, data, self.level), wave_number))
+        while len(self.pending) > self.max_pending or (self.pending and self.pending[0][0].done()):
+            self.__write_next()
+
+    def __len__(self) -> int:
+        return len(self.index) + len(self.pending)
+
+    # writes the pending frames, the index and the header, then moves the file to its path
+    def close(self) -> None:
+        self.pool.shutdown(wait=True)
+        while self.pending:
+            self.__write_next()
+        index_offset = self.file.tell()
+        self.file.write(np.array(self.index, dtype=INDEX_DTYPE).tobytes())
+        self.file.write(json.dumps(self.metadata).encode())
+        height, width, channels = self.shape or (0, 0, 0)
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, height, width, channels, self.keyframe_interval, len(self.index), index_offset))
+        self.file.close()
+        os.replace(self.path + ".tmp", self.path)
+
+    def discard(self) -> None:
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        self.file.close()
+        os.remove(self.path + ".tmp")
+
+    def __write_next(self) -> None:
+        future, wave_number = self.pending.popleft()
+        data = future.result()
+        self.index.append((self.file.tell(), len(data), wave_number))
+        self.file.write(data)
+
+# frames of a store file by index (frames[i], negative indices too) or in order, as (height, width, channels) uint8 arrays
+class FrameStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        if len(self.data) < HEADER.size:
+            raise ValueError(f"{path} is not a frame store")
+        magic, version, height, width, channels, self.keyframe_interval, count, index_offset = HEADER.unpack(self.data[:HEADER.size].tobytes())
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a frame store (or was written by another version)")
+        self.shape = (height, width, channels)
+        index_end = index_offset + count * INDEX_DTYPE.itemsize
+        self.index = self.data[index_offset:index_end].view(INDEX_DTYPE)
+        self.metadata = json.loads(self.data[index_end:].tobytes() or b"{}")
+        self.decoded = None # (index, frame) of the last decoded frame, the next one only needs its delta
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # drops the mapping (unmapped once the returned frames, which are copies, are the only ones left)
+    def close(self) -> None:
+        self.index = np.empty(0, dtype=INDEX_DTYPE)
+        self.decoded = None
+        self.data = None
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"Frame {i} out of range (0..{len(self) - 1})")
+        keyframe = i - i % self.keyframe_interval
+        if self.decoded is not None and keyframe <= self.decoded[0] <= i:
+            start, frame = self.decoded
+        else:
+            start, frame = keyframe, self.__decompress(keyframe)
+        for j in range(start + 1, i + 1):
+            frame = np.bitwise_xor(frame, self.__decompress(j))
+        self.decoded = (i, frame)
+        return frame.copy() # the decoded frame stays the start of the next one (and a keyframe is read-only)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    # wave number of every frame (NO_WAVE when unknown)
+    @property
+    def wave_numbers(self) -> np.ndarray:
+        return self.index["wave"]
+
+    def wave_starts(self) -> dict[int, int]:
+        return wave_starts(self.wave_numbers)
+
+    def __decompress(self, i: int) -> np.ndarray:
+        offset, size, _ = self.index[i]
+        return np.frombuffer(zlib.decompress(self.data[offset:offset + size]), dtype=np.uint8).reshape(self.shape)
+
+# {wave number: index of its first frame} from the wave number of every frame
+def wave_starts(wave_numbers) -> dict[int, int]:
+    waves = np.asarray(wave_numbers)
+    starts = np.flatnonzero(np.diff(waves, prepend=NO_WAVE)) if len(waves) else []
+    return {int(waves[i]): int(i) for i in starts if waves[i] != NO_WAVE}
+
+# wave numbers of the frames of a png directory, captured from the game states with the frames by replay_actions.py:
+# <directory>/waves.json {"wave_numbers": [wave of each frame, in name order], "metadata": {...}}
+def save_directory_waves(frames_dir: str, wave_numbers: list[int], metadata: dict | None = None) -> None:
+    with open(os.path.join(frames_dir, WAVES_FILE), "w") as f:
+        json.dump({"wave_numbers": [int(wave) for wave in wave_numbers], "metadata": metadata or {}}, f)
+
+# (wave numbers, metadata) of a png directory, (None, {}) for the directories saved without them
+def load_directory_waves(frames_dir: str) -> tuple[list[int] | None, dict]:
+    try:
+        with open(os.path.join(frames_dir, WAVES_FILE), "r") as f:
+            waves = json.load(f)
+    except FileNotFoundError:
+        return None, {}
+    return waves["wave_numbers"], waves["metadata"]
+
+# png frames of a directory (frame_0000.png, ... as saved by replay_actions.py, in name order) -> frame store, returns the frame count
+# the wave of each frame is read from the waves file of the directory (unknown for the directories saved without it)
+def convert_frame_directory(frames_dir: str, path: str, **writer_options) -> int:
+    import cv2
+
+    filenames = sorted(f for f in os.listdir(frames_dir) if f.endswith((".png", ".jpg", ".jpeg")))
+    wave_numbers, metadata = load_directory_waves(frames_dir)
+    if wave_numbers is not None and len(wave_numbers) != len(filenames):
+        raise ValueError(f"{len(wave_numbers)} wave numbers in {WAVES_FILE} for {len(filenames)} frames")
+    with FrameStoreWriter(path, metadata=metadata, **writer_options) as writer:
+        for i, filename in enumerate(filenames):
+            frame = cv2.imread(os.path.join(frames_dir, filename))
+            if frame is None:
+                raise IOError(f"Failed to read {filename}")
+            writer.add(frame, wave_numbers[i] if wave_numbers is not None else NO_WAVE)
+    return len(filenames)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Convert a directory of replay frames (best_frames/) to a single frame store file.")
+    parser.add_argument("frames_dir", help="Directory of png frames.")
+    parser.add_argument("output", nargs="?", help="Optional. Path of the frame store (default: the directory name + .frames).")
+    parser.add_argument("--keyframe-interval", type=int, default=KEYFRAME_INTERVAL, help="Optional. Frames between two whole frames, the others are stored as differences.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    output = args.output or os.path.normpath(args.frames_dir) + ".frames"
+    count = convert_frame_directory(args.frames_dir, output, keyframe_interval=args.keyframe_interval)
+    print(f"{count} frames saved to {output} ({os.path.getsize(output) / 2**20:.1f} MB)")
@@ -0,0 +1,69 @@
+import atexit
+import os
+import subprocess
+import time
+import requests
+
+# starts N game servers on consecutive ports and stops them on exit
+# the port is passed through the PORT environment variable and replaces any "{port}" in the command
+class ServerPool:
+    def __init__(self, command: list[str], num_servers: int, base_port: int = 3000, cwd: str | None = None, startup_timeout: float = 30.0):
+        self.command = command
+        self.num_servers = num_servers
+        self.base_port = base_port
+        self.cwd = cwd
+        self.startup_timeout = startup_timeout
+        self.processes = []
+        self.urls = []
+
+    def __enter__(self) -> list[str]:
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # launch every server and wait until all of them answer /info, returns their base urls
+    def start(self) -> list[str]:
+        atexit.register(self.close)
+        try:
+            for i in range(self.num_servers):
+                port = self.base_port + i
+                command = [arg.replace("{port}", str(port)) for arg in self.command]
+                process = subprocess.Popen(command, cwd=self.cwd, env={**os.environ, "PORT": str(port)}, stdout=subprocess.DEVNULL)
+                self.processes.append(process)
+                self.urls.append(f"http://localhost:{port}/")
+
+            for process, url in zip(self.processes, self.urls):
+                self.__wait_until_healthy(process, url)
+        except Exception:
+            self.close()
+            raise
+
+        return list(self.urls)
+
+    def close(self):
+        for process in self.processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        self.processes.clear()
+        self.urls.clear()
+
+    def __wait_until_healthy(self, process: subprocess.Popen, url: str) -> None:
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Game server for {url} exited with code {process.returncode}")
+            try:
+                if requests.get(url + "info", timeout=1).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass # not listening yet
+            time.sleep(0.2)
+
+        raise TimeoutError(f"Game server for {url} did not answer /info within {self.startup_timeout} seconds")
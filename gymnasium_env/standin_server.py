@@ -0,0 +1,170 @@
+import argparse
+import io
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from gymnasium_env.envs.backends import RAW_FRAME_CONTENT_TYPE
+from gymnasium_env.envs.local_game import LocalGame, IllegalActionError, load_rules
+from gymnasium_env.envs.rasterizer import FrameRasterizer
+from gymnasium_env.envs.state_delta import StateDeltaEncoder
+from gymnasium_env.envs.transport import msgpack, JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE
+
+# stand-in for the tower defense game server backed by the local simulator, speaks the same http api
+# (GET /info, POST /reset, POST /step, GET /render, POST /set-map) over keep-alive connections, in json or msgpack
+# POST /step?ticks=k advances k ticks in one request (see LocalGame.step)
+# GET /snapshot and POST /restore export and import the whole game state (see LocalGame.snapshot)
+# GET /render?format=raw&scale=s sends the rgb pixels (downscaled by s) without png encoding, the shape is in the X-Frame-* headers
+# POST /reset, /step and /restore with ?delta=<state id> answer with a delta-encoded state (see state_delta.py)
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive
+    disable_nagle_algorithm = True # headers and body are written separately, don't wait for the delayed ack
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = url.path
+        query = parse_qs(url.query)
+        with self.server.lock:
+            if path == "/info":
+                self.__send(200, self.server.game.info())
+            elif path == "/snapshot":
+                self.__send(200, self.server.game.snapshot())
+            elif path == "/render" and query.get("format", ["png"])[0] == "raw":
+                self.__send_raw_frame(self.server.render_frame(int(query.get("scale", ["1"])[0])))
+            elif path == "/render":
+                self.__send_png(self.server.render_png())
+            else:
+                self.__send(404, {"message": f"Unknown endpoint: {path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        path = url.path
+        query = parse_qs(url.query)
+        body = self.__read_body()
+        with self.server.lock:
+            game = self.server.game
+            delta_base = int(query["delta"][0]) if "delta" in query else None
+            if path == "/reset":
+                game.reset()
+                self.__send(200, self.server.game_state(delta_base))
+            elif path == "/step":
+                ticks = int(query.get("ticks", ["1"])[0])
+                try:
+                    tick_summaries = game.advance(body, ticks)
+                except IllegalActionError as e:
+                    self.__send(400, {"message": str(e)})
+                else:
+                    self.__send(200, self.server.game_state(delta_base, tick_summaries if ticks > 1 else None))
+            elif path == "/restore":
+                try:
+                    game.restore(body)
+                except (KeyError, TypeError, ValueError) as e:
+                    self.__send(400, {"message": f"Invalid snapshot: {e}"})
+                else:
+                    self.server.rasterizers.clear() # the snapshot may be on another map
+                    self.__send(200, self.server.game_state(delta_base))
+            elif path == "/set-map":
+                game.set_map(body)
+                self.server.rasterizers.clear()
+                self.server.delta_encoder.invalidate()
+                self.__send(200, {"message": "Map set"})
+            else:
+                self.__send(404, {"message": f"Unknown endpoint: {path}"})
+
+    # no per-request logging, it would dominate the cost of a step
+    def log_message(self, format, *args):
+        pass
+
+    def __read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length == 0:
+            return None
+        data = self.rfile.read(length)
+        if self.headers.get("Content-Type", "").startswith(MSGPACK_CONTENT_TYPE):
+            return msgpack.unpackb(data)
+        return json.loads(data)
+
+    # errors are always json, like the real server
+    def __send(self, status: int, payload) -> None:
+        if status == 200 and msgpack is not None and MSGPACK_CONTENT_TYPE in self.headers.get("Accept", ""):
+            data = msgpack.packb(payload)
+            content_type = MSGPACK_CONTENT_TYPE
+        else:
+            data = json.dumps(payload).encode()
+            content_type = JSON_CONTENT_TYPE
+        self.__send_bytes(status, data, content_type)
+
+    def __send_png(self, data: bytes) -> None:
+        self.__send_bytes(200, data, "image/png")
+
+    def __send_raw_frame(self, frame) -> None:
+        height, width, channels = frame.shape
+        self.__send_bytes(200, frame.tobytes(), RAW_FRAME_CONTENT_TYPE, {"X-Frame-Width": width, "X-Frame-Height": height, "X-Frame-Channels": channels})
+
+    def __send_bytes(self, status: int, data: bytes, content_type: str, headers: dict | None = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int, game_info: dict | None = None, rules: dict | None = None):
+        super().__init__(("localhost", port), StandInRequestHandler)
+        self.game = LocalGame(game_info, rules)
+        self.lock = threading.Lock() # one game per server, requests are applied one at a time
+        self.rasterizers = {} # by scale, drawn for the current map
+        self.delta_encoder = StateDeltaEncoder()
+
+    # state of the game after a request: delta-encoded from the state delta_base when asked (?delta=...), whole otherwise
+    # (the next delta is then sent whole, the client never got this state)
+    def game_state(self, delta_base: int | None, tick_summaries: list[dict] | None = None) -> dict:
+        if delta_base is not None:
+            return self.delta_encoder.encode(self.game, delta_base, tick_summaries)
+        self.delta_encoder.invalidate()
+        state = self.game.state()
+        if tick_summaries is not None:
+            state["ticks"] = tick_summaries
+        return state
+
+    # current game state drawn by the numpy rasterizer, shape (map height // scale, map width // scale, 3)
+    def render_frame(self, scale: int = 1):
+        if scale not in self.rasterizers:
+            self.rasterizers[scale] = FrameRasterizer(self.game.game_info, scale)
+        return self.rasterizers[scale].draw(self.game.state())
+
+    def render_png(self) -> bytes:
+        from PIL import Image
+
+        image = Image.fromarray(self.render_frame())
+        image_bytes = io.BytesIO()
+        image.save(image_bytes, format="PNG")
+        return image_bytes.getvalue()
+
+    # serve in a background thread, returns the thread (stop with shutdown())
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Stand-in tower defense game server running the local simulator.")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 3000)), help="Optional. Port to listen on (default: PORT variable or 3000).")
+    parser.add_argument("--rules", help="Optional. JSON file with the game rules /info does not give (see local_game.py, estimates by default).")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    server = StandInServer(args.port, rules=load_rules(args.rules) if args.rules else None)
+    print(f"Stand-in game server listening on http://localhost:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,172 @@
+import json
+import os
+import numpy as np
+
+# transitions (observation, action, action mask, reward, done) of recorded episodes, for offline training (behavior cloning, see
+# custom_policies/behavior_cloning.py), in shards of whole episodes: a directory of .npy files per shard, read memory mapped
+# shard of n transitions:
+#   <key>_indptr.npy (n + 1,) int64, <key>_indices.npy int32, <key>_values.npy: the observations as sparse rows (the nonzero
+#   values of each flattened observation and their positions, the padding slots are mostly zeros), one key for a Box observation
+#   ("observation") and one per key of a Dict observation
+#   actions.npy (n, ...), masks.npy (n, mask bytes) packed bits, rewards.npy (n,) float32, dones.npy (n,) bool
+# index.json: shape and dtype of each observation key and of the actions, mask size, shards with their transition and episode counts
+INDEX_FILE = "index.json"
+BOX_KEY = "observation"
+SHARD_SIZE = 10000
+
+# writes the transitions of the episodes added with add / end_episode, a shard is written once shard_size transitions are
+# waiting (the episodes are not split); a directory already holding a store is appended to
+# each shard is written as a temporary directory and renamed, then the index is replaced, so that a store read while the
+# episodes are recorded (or an interrupted recording) only has whole shards
+class TransitionStoreWriter:
+    def __init__(self, directory: str, shard_size: int = SHARD_SIZE):
+        self.directory = directory
+        self.shard_size = shard_size
+        os.makedirs(directory, exist_ok=True)
+        self.index = load_index(directory) if os.path.exists(os.path.join(directory, INDEX_FILE)) else {"observations": None, "action": None, "mask_size": None, "shards": []}
+        self.episode = new_buffer() # transitions of the episode being played
+        self.pending = new_buffer() # whole episodes waiting for the next shard
+        self.pending_episodes = 0
+
+    # observation: the one the action was taken from, with the action mask of that state
+    def add(self, observation, action, mask: np.ndarray, reward: float, done: bool) -> None:
+        observations = observation if isinstance(observation, dict) else {BOX_KEY: observation}
+        if self.index["observations"] is None:
+            self.index["observations"] = {key: {"shape": list(np.shape(value)), "dtype": np.asarray(value).dtype.str} for key, value in observations.items()}
+            self.index["action"] = {"shape": list(np.shape(action)), "dtype": np.asarray(action).dtype.str}
+            self.index["mask_size"] = len(mask)
+        for key, value in observations.items():
+            flat = np.ascontiguousarray(value).reshape(-1)
+            nonzero = np.flatnonzero(flat.view(f"u{flat.itemsize}")) # bit pattern, -0.0 is kept
+            self.episode["indices"].setdefault(key, []).append(nonzero.astype(np.int32))
+            self.episode["values"].setdefault(key, []).append(flat[nonzero])
+        self.episode["actions"].append(np.asarray(action))
+        self.episode["masks"].append(np.packbits(mask))
+        self.episode["rewards"].append(reward)
+        self.episode["dones"].append(done)
+
+    # keep: the episode is written (False drops it, e.g. not good enough to learn from)
+    def end_episode(self, keep: bool = True) -> None:
+        if keep and self.episode["actions"]:
+            for field in ("actions", "masks", "rewards", "dones"):
+                self.pending[field].extend(self.episode[field])
+            for field in ("indices", "values"):
+                for key, rows in self.episode[field].items():
+                    self.pending[field].setdefault(key, []).extend(rows)
+            self.pending_episodes += 1
+        self.episode = new_buffer()
+        if len(self.pending["actions"]) >= self.shard_size:
+            self.__write_shard()
+
+    def __len__(self) -> int:
+        return sum(shard["transitions"] for shard in self.index["shards"]) + len(self.pending["actions"])
+
+    # writes the waiting episodes, the episode being played is dropped
+    def close(self) -> None:
+        self.episode = new_buffer()
+        if self.pending["actions"]:
+            self.__write_shard()
+
+    def __write_shard(self) -> None:
+        name = f"shard_{len(self.index['shards']):05d}"
+        path = os.path.join(self.directory, name)
+        os.makedirs(path + ".tmp", exist_ok=True)
+        arrays = {
+            "actions": np.array(self.pending["actions"], dtype=self.index["action"]["dtype"]),
+            "masks": np.array(self.pending["masks"], dtype=np.uint8),
+            "rewards": np.array(self.pending["rewards"], dtype=np.float32),
+            "dones": np.array(self.pending["dones"], dtype=bool),
+        }
+        for key, spec in self.index["observations"].items():
+            indices = self.pending["indices"][key]
+            arrays[f"{key}_indptr"] = np.concatenate([[0], np.cumsum([len(row) for row in indices])]).astype(np.int64)
+            arrays[f"{key}_indices"] = np.concatenate(indices).astype(np.int32)
+            arrays[f"{key}_values"] = np.concatenate(self.pending["values"][key]).astype(spec["dtype"])
+        for array_name, array in arrays.items():
+            np.save(os.path.join(path + ".tmp", array_name + ".npy"), array)
+        os.replace(path + ".tmp", path)
+        self.index["shards"].append({"name": name, "transitions": len(arrays["rewards"]), "episodes": self.pending_episodes})
+        with open(os.path.join(self.directory, INDEX_FILE + ".tmp"), "w") as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(os.path.join(self.directory, INDEX_FILE + ".tmp"), os.path.join(self.directory, INDEX_FILE))
+        self.pending = new_buffer()
+        self.pending_episodes = 0
+
+def new_buffer() -> dict:
+    return {"indices": {}, "values": {}, "actions": [], "masks": [], "rewards": [], "dones": []}
+
+def load_index(directory: str) -> dict:
+    with open(os.path.join(directory, INDEX_FILE), "r") as f:
+        return json.load(f)
+
+# the transitions of a store, or of every store in the subdirectories of path (e.g. one per env), in shard order
+# the shard arrays are memory mapped (self.shards: one dict of arrays per shard, read without copy), batch gives the
+# transitions at some indices with dense observations and unpacked masks
+class TransitionDataset:
+    def __init__(self, path: str):
+        directories = [path] if os.path.exists(os.path.join(path, INDEX_FILE)) else sorted(
+            os.path.join(path, name) for name in os.listdir(path) if os.path.exists(os.path.join(path, name, INDEX_FILE)))
+        if not directories:
+            raise FileNotFoundError(f"No transition store in {path}")
+        self.shards = []
+        self.observation_specs = None
+        for directory in directories:
+            index = load_index(directory)
+            if self.observation_specs is None:
+                self.observation_specs, self.action_spec, self.mask_size = index["observations"], index["action"], index["mask_size"]
+            elif index["observations"] != self.observation_specs or index["action"] != self.action_spec:
+                raise ValueError(f"The transitions of {directory} do not have the observations and actions of {directories[0]}")
+            for shard in index["shards"]:
+                shard_path = os.path.join(directory, shard["name"])
+                self.shards.append({name[:-len(".npy")]: np.load(os.path.join(shard_path, name), mmap_mode="r") for name in os.listdir(shard_path)})
+        self.offsets = np.cumsum([0] + [len(shard["rewards"]) for shard in self.shards])
+        self.episode_count = int(sum(shard["dones"].sum() for shard in self.shards))
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    # {"observations": array (or dict of arrays for Dict observations), "actions", "masks" (bool), "rewards", "dones"}
+    def batch(self, indices: np.ndarray) -> dict:
+        indices = np.asarray(indices)
+        shard_of = np.searchsorted(self.offsets, indices, side="right") - 1
+        observations = {key: np.empty((len(indices), *spec["shape"]), dtype=spec["dtype"]) for key, spec in self.observation_specs.items()}
+        batch = {
+            "actions": np.empty((len(indices), *self.action_spec["shape"]), dtype=self.action_spec["dtype"]),
+            "masks": np.empty((len(indices), self.mask_size), dtype=bool),
+            "rewards": np.empty(len(indices), dtype=np.float32),
+            "dones": np.empty(len(indices), dtype=bool),
+        }
+        for shard_index in np.unique(shard_of):
+            positions = np.flatnonzero(shard_of == shard_index)
+            rows = indices[positions] - self.offsets[shard_index]
+            shard = self.shards[shard_index]
+            for key, spec in self.observation_specs.items():
+                observations[key][positions] = dense_rows(shard, key, rows, spec)
+            batch["actions"][positions] = shard["actions"][rows]
+            batch["masks"][positions] = np.unpackbits(shard["masks"][rows], axis=1, count=self.mask_size).astype(bool)
+            batch["rewards"][positions] = shard["rewards"][rows]
+            batch["dones"][positions] = shard["dones"][rows]
+        batch["observations"] = observations[BOX_KEY] if list(observations) == [BOX_KEY] else observations
+        return batch
+
+    # discounted return of every transition (the episodes are whole in each shard)
+    def returns(self, gamma: float) -> np.ndarray:
+        returns = np.empty(len(self), dtype=np.float32)
+        for shard_index, shard in enumerate(self.shards):
+            rewards, dones = np.asarray(shard["rewards"]), np.asarray(shard["dones"])
+            future = 0.0
+            for i in reversed(range(len(rewards))):
+                future = rewards[i] + gamma * future * (not dones[i])
+                returns[self.offsets[shard_index] + i] = future
+        return returns
+
+# the observations at rows of a shard (sparse rows of key) as a dense (rows, *shape) array
+def dense_rows(shard: dict, key: str, rows: np.ndarray, spec: dict) -> np.ndarray:
+    indptr = shard[f"{key}_indptr"]
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    dense = np.zeros((len(rows), int(np.prod(spec["shape"]))), dtype=spec["dtype"])
+    row_of_value = np.repeat(np.arange(len(rows)), lengths)
+    value_positions = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(starts, lengths)
+    dense[row_of_value, shard[f"{key}_indices"][value_positions]] = shard[f"{key}_values"][value_positions]
+    return dense.reshape((len(rows), *spec["shape"]))
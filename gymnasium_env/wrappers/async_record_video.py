@@ -0,0 +1,139 @@
+import os
+import queue
+import threading
+import time
+from typing import Callable
+import gymnasium as gym
+import numpy as np
+
+# records episodes like gymnasium's RecordVideo, but the frames are only rendered in the training loop:
+# they go through a bounded queue to a background thread piping them to ffmpeg (imageio-ffmpeg, installed with moviepy),
+# so the memory used does not depend on the episode length and the mp4 is written while the episode is played
+# drop_frames: when the encoder falls behind (full queue), drop the new frames instead of waiting for a free slot
+# preset: x264 speed/size trade-off, faster presets keep up with more steps per second
+# at the end of a recorded episode, info["video_recording"] has its capture stats (frames, dropped frames, seconds spent in the training loop)
+# an error of the encoder thread (e.g. ffmpeg failing) stops it and is raised by the next step or reset recording a frame, and by close
+# request_recording() records the next episode whatever the trigger says (e.g. videos scheduled by time, see TimeBudgetCallback)
+class AsyncRecordVideo(gym.Wrapper):
+    def __init__(self, env, video_folder: str, episode_trigger: Callable[[int], bool], name_prefix: str = "rl-video", fps: int | None = None, queue_size: int = 32, drop_frames: bool = False, preset: str = "veryfast"):
+        import imageio_ffmpeg # fails here rather than in the encoder thread
+
+        super().__init__(env)
+        self.write_frames = imageio_ffmpeg.write_frames
+        self.video_folder = os.path.abspath(video_folder)
+        os.makedirs(self.video_folder, exist_ok=True)
+        self.episode_trigger = episode_trigger
+        self.name_prefix = name_prefix
+        self.fps = fps if fps is not None else env.metadata.get("render_fps", 30)
+        self.drop_frames = drop_frames
+        self.preset = preset
+
+        self.episode_id = -1
+        self.recording = False
+        self.recording_requested = False
+        self.recording_stats = None # stats of the episode being recorded
+        self.last_recording_stats = None
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.encoder_error = None # exception that stopped the encoder thread, raised by the next put or close
+        self.encoder_thread = threading.Thread(target=self.__encode, daemon=True)
+        self.encoder_thread.start()
+
+    def reset(self, seed=None, options=None) -> tuple[np.ndarray, dict]:
+        observation, info = self.env.reset(seed=seed, options=options)
+        if self.recording: # episode interrupted by a reset
+            self.__stop_recording()
+        self.episode_id += 1
+        if self.episode_trigger(self.episode_id) or self.recording_requested:
+            self.recording_requested = False
+            self.__start_recording(os.path.join(self.video_folder, f"{self.name_prefix}-episode-{self.episode_id}.mp4"))
+        return observation, info
+
+    def step(self, action) -> tuple[np.ndarray, float, bool, bool, dict]:
+        observation, reward, terminated, truncated, info = self.env.step(action)
+        if self.recording:
+            self.__capture_frame()
+            if terminated or truncated:
+                info["video_recording"] = self.__stop_recording()
+        return observation, reward, terminated, truncated, info
+
+    def request_recording(self) -> None:
+        self.recording_requested = True
+
+    # finishes the current video and waits for the encoder to write it
+    def close(self):
+        try:
+            if self.recording:
+                self.__stop_recording()
+            self.__put(None)
+            self.encoder_thread.join()
+            self.__raise_encoder_error()
+        finally:
+            super().close()
+
+    def __start_recording(self, path: str) -> None:
+        self.recording = True
+        self.recording_stats = {"episode": self.episode_id, "frames": 0, "dropped_frames": 0, "capture_seconds": 0.0}
+        self.__put(path) # a path starts a new video
+        self.__capture_frame()
+
+    def __stop_recording(self) -> dict:
+        self.recording = False
+        self.__put(False) # ends the current video
+        self.last_recording_stats = self.recording_stats
+        return self.last_recording_stats
+
+    # render time plus the time spent waiting for the encoder
+    def __capture_frame(self) -> None:
+        start = time.perf_counter()
+        frame = self.env.render()
+        try:
+            self.__put(frame, block=not self.drop_frames)
+            self.recording_stats["frames"] += 1
+        except queue.Full:
+            self.recording_stats["dropped_frames"] += 1
+        self.recording_stats["capture_seconds"] += time.perf_counter() - start
+
+    # waits for a free slot while the encoder runs, raises its error once it stopped (a full queue would never be emptied)
+    def __put(self, item, block: bool = True) -> None:
+        while True:
+            self.__raise_encoder_error()
+            try:
+                self.frames.put(item, block=block, timeout=0.1 if block else None)
+                return
+            except queue.Full:
+                if not block:
+                    raise
+
+    def __raise_encoder_error(self) -> None:
+        if self.encoder_error is not None:
+            raise RuntimeError(f"The video encoder stopped: {self.encoder_error}") from self.encoder_error
+
+    # background thread: a path starts a video (the writer is opened with the first frame, whose size is the video size),
+    # False closes it and None stops the thread; an error stops the thread and is kept in encoder_error
+    def __encode(self) -> None:
+        path = None
+        writer = None
+        try:
+            while True:
+                item = self.frames.get()
+                if item is None or item is False:
+                    if writer is not None:
+                        writer.close()
+                    path, writer = None, None
+                    if item is None:
+                        return
+                elif isinstance(item, str):
+                    path = item
+                elif path is not None:
+                    if writer is None:
+                        writer = self.write_frames(path, (item.shape[1], item.shape[0]), fps=self.fps, macro_block_size=1, ffmpeg_log_level="error", output_params=["-preset", self.preset])
+                        writer.send(None)
+                    writer.send(np.ascontiguousarray(item))
+        except BaseException as e:
+            self.encoder_error = e
+        finally:
+            if writer is not None:
+                try:
+                    writer.close()
+                except Exception:
+                    pass # the error that stopped the encoder is the one reported
@@ -1,19 +1,16 @@
 import gymnasium as gym
 import numpy as np
-import requests
-
-url = "http://localhost:3000/"
 
 class RandomMapWrapper(gym.Wrapper):
     def __init__(self, env, map_list: list[dict]):
         super().__init__(env)
         self.map_list = map_list
+        # the tables of every map are computed once (the observation is sized for the largest map)
+        self.env.unwrapped.register_maps(map_list)
 
     def reset(self, seed=None, options=None) -> tuple[np.ndarray, dict]:
-        # select a random index and set the map in the server
+        # select a random index and switch the env to its map (the game backend is only asked to change map if it has another one)
         selected_map_index = self.env.unwrapped.np_random.integers(0, len(self.map_list))
-        response = requests.post(url + "set-map", json=self.map_list[selected_map_index]["waypoints"])
-        if response.status_code != 200:
-            print(f"Error setting map: {response.text}")
+        self.env.unwrapped.select_map(selected_map_index)
 
         return self.env.reset(seed=seed, options=options)
\ No newline at end of file
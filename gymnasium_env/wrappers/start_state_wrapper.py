@@ -0,0 +1,18 @@
+import gymnasium as gym
+import numpy as np
+
+# starts a share of the episodes from game snapshots (e.g. late waves of the best episodes, see capture_start_states.py)
+# instead of the beginning of the game, so that less time is spent replaying the easy waves
+class StartStateWrapper(gym.Wrapper):
+    def __init__(self, env, start_states: list[dict], probability: float = 0.5):
+        super().__init__(env)
+        self.start_states = start_states
+        self.probability = probability
+
+    def reset(self, seed=None, options=None) -> tuple[np.ndarray, dict]:
+        np_random = self.env.unwrapped.np_random
+        if len(self.start_states) > 0 and np_random.random() < self.probability and "start_state" not in (options or {}):
+            start_state = self.start_states[np_random.integers(0, len(self.start_states))]
+            options = dict(options or {}, start_state=start_state)
+
+        return self.env.reset(seed=seed, options=options)
\ No newline at end of file
@@ -0,0 +1,35 @@
+import gymnasium as gym
+from gymnasium_env.transition_store import TransitionStoreWriter, SHARD_SIZE
+
+# records the transitions (observation, action, action mask, reward, done) of the episodes played into a transition store
+# (see transition_store.py), to train a policy from them later without playing the games again (behavior cloning)
+# min_wave: only the episodes reaching this wave are kept, the others are dropped when they end
+# the action masks of each state are asked to the env once more than by the agent
+class TransitionRecorder(gym.Wrapper):
+    def __init__(self, env, directory: str, shard_size: int = SHARD_SIZE, min_wave: int | None = None):
+        super().__init__(env)
+        self.writer = TransitionStoreWriter(directory, shard_size)
+        self.min_wave = min_wave
+        self.observation = None
+        self.mask = None
+
+    def reset(self, seed=None, options=None):
+        observation, info = self.env.reset(seed=seed, options=options)
+        self.writer.end_episode(keep=False) # an episode reset before its end is not recorded
+        self.observation = observation
+        self.mask = self.env.unwrapped.action_masks()
+        return observation, info
+
+    def step(self, action):
+        observation, reward, terminated, truncated, info = self.env.step(action)
+        done = terminated or truncated
+        self.writer.add(self.observation, action, self.mask, reward, done)
+        if done:
+            self.writer.end_episode(keep=self.min_wave is None or info["wave_number"] >= self.min_wave)
+        self.observation = observation
+        self.mask = self.env.unwrapped.action_masks()
+        return observation, reward, terminated, truncated, info
+
+    def close(self):
+        self.writer.close()
+        super().close()
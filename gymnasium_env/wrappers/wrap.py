@@ -1,8 +1,12 @@
-from gymnasium.wrappers import RecordVideo, Autoreset
+from gymnasium.wrappers import Autoreset
 from stable_baselines3.common.monitor import Monitor
+from gymnasium_env.wrappers.async_record_video import AsyncRecordVideo
 
-def wrap_env(env, episode_recording_gap, prefix):
-    env = Monitor(env, f"./models/{prefix}/monitor.csv")
-    env = RecordVideo(env, video_folder=f"./models/{prefix}/videos/", name_prefix="training", episode_trigger=lambda e: e % episode_recording_gap == 0)
+# episode_recording_gap: record one episode every that many, None to only record the first one and the requested ones (see AsyncRecordVideo)
+def wrap_env(env, episode_recording_gap, prefix, rank=0, record_video=True):
+    env = Monitor(env, f"./models/{prefix}/monitor.csv" if rank == 0 else f"./models/{prefix}/env_{rank}")
+    if record_video:
+        episode_trigger = (lambda e: e % episode_recording_gap == 0) if episode_recording_gap else (lambda e: e == 0)
+        env = AsyncRecordVideo(env, video_folder=f"./models/{prefix}/videos/", name_prefix="training", episode_trigger=episode_trigger)
     env = Autoreset(env)
     return env
\ No newline at end of file
@@ -1,167 +1,347 @@
 import datetime
-import requests
-from io import BytesIO
-from PIL import Image
-import cv2
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import json
 import argparse
 import os
+from gymnasium_env.envs.action_log import load_episode_actions
+from gymnasium_env.envs.backends import HttpBackend, LocalBackend
+from gymnasium_env.envs.local_game import DEFAULT_MAP_WAYPOINTS
+from gymnasium_env.frame_store import FrameStore, FrameStoreWriter, wave_starts, save_directory_waves, load_directory_waves, NO_WAVE
 
 SERVER_URL = "http://localhost:3000"
-SET_MAP_ENDPOINT = f"{SERVER_URL}/set-map"
-RESET_ENDPOINT = f"{SERVER_URL}/reset"
-STEP_ENDPOINT = f"{SERVER_URL}/step"
-RENDER_ENDPOINT = f"{SERVER_URL}/render"
 PLAYBACK_SPEED_MS = 10  # delay between frames in milliseconds
-DEFAULT_MAP_WAYPOINTS = [
-    { "x": 75, "y": 25 },
-    { "x": 75, "y": 325 },
-    { "x": 225, "y": 325 },
-    { "x": 225, "y": 475 },
-    { "x": 375, "y": 475 },
-    { "x": 375, "y": 125 },
-    { "x": 825, "y": 125 },
-    { "x": 825, "y": 275 },
-    { "x": 525, "y": 275 },
-    { "x": 525, "y": 525 },
-    { "x": 725, "y": 525 },
-    { "x": 725, "y": 575 }
-]
-
-def main(actions_file, save_frames, load_dir):
+CAPTURE_QUEUE_SIZE = 32 # captured frames waiting for the main thread
+SCRUB_FRAMES = 100 # frames skipped by the 'a' and 'd' keys
+
+# frames encoded to png by a thread pool (opencv releases the GIL) as they are captured, at most max_pending of them wait for a worker
+# the pngs are written to save_dir (frame_0000.png, ..., readable with --load-dir, with the wave of each frame in waves.json) or kept
+# in memory (a few KB each instead of the raw frame) for the replays, the frames are decoded again when iterated
+class PngFrameStore:
+    def __init__(self, save_dir: str | None = None, workers: int | None = None, max_pending: int | None = None, metadata: dict | None = None):
+        self.save_dir = save_dir
+        self.metadata = metadata
+        if save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+        workers = workers or os.cpu_count() or 1
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.pending = threading.BoundedSemaphore(max_pending or 2 * workers)
+        self.encoded = [] # futures of the png bytes (None when written to a file)
+        self.wave_numbers = []
+
+    def add(self, frame: np.ndarray, wave_number: int = NO_WAVE) -> None:
+        self.pending.acquire() # blocks while the workers are behind, bounding the memory
+        future = self.pool.submit(self.__encode, len(self.encoded), frame)
+        future.add_done_callback(lambda _: self.pending.release())
+        self.encoded.append(future)
+        self.wave_numbers.append(wave_number)
+
+    # waits for the pending frames, raises the first encoding error, then saves the waves of the frames next to them
+    def close(self) -> None:
+        self.pool.shutdown(wait=True)
+        for future in self.encoded:
+            future.result()
+        if self.save_dir:
+            save_directory_waves(self.save_dir, self.wave_numbers, self.metadata)
+
+    # stops the encoding after a failed capture and removes the frames already written (and save_dir if nothing else is in it)
+    def discard(self) -> None:
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        if self.save_dir:
+            for index in range(len(self.encoded)):
+                if os.path.exists(self.__path(index)):
+                    os.remove(self.__path(index))
+            if not os.listdir(self.save_dir):
+                os.rmdir(self.save_dir)
+
+    def __len__(self) -> int:
+        return len(self.encoded)
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        import cv2
+
+        data = self.encoded[index].result()
+        return cv2.imread(self.__path(index % len(self))) if data is None else cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+    def __encode(self, index: int, frame: np.ndarray) -> np.ndarray | None:
+        import cv2
+
+        if self.save_dir:
+            if not cv2.imwrite(self.__path(index), frame):
+                raise IOError(f"Failed to write {self.__path(index)}")
+            return None
+        _, data = cv2.imencode(".png", frame)
+        return data
+
+    def __path(self, index: int) -> str:
+        return os.path.join(self.save_dir, f"frame_{index:04d}.png")
+
+# image files of a directory (as saved with --frames-format png) in name order, read when accessed
+# wave_numbers: the wave of each frame saved with them (None for the directories saved without it)
+class FrameDirectory:
+    def __init__(self, directory: str):
+        self.paths = [os.path.join(directory, f) for f in sorted(os.listdir(directory)) if f.endswith(('.png', '.jpg', '.jpeg'))]
+        self.wave_numbers, self.metadata = load_directory_waves(directory)
+        if self.wave_numbers is not None and len(self.wave_numbers) != len(self.paths):
+            self.wave_numbers = None # frames added or removed since
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        import cv2
+
+        frame = cv2.imread(self.paths[index])
+        if frame is None:
+            raise IOError(f"Failed to read {self.paths[index]}")
+        return frame
+
+# rgb frames piped to ffmpeg (imageio-ffmpeg, installed with moviepy) as they are captured, ffmpeg encodes them in its own process
+class VideoFrameWriter:
+    def __init__(self, path: str, fps: int):
+        import imageio_ffmpeg
+
+        self.path = path
+        self.fps = fps
+        self.write_frames = imageio_ffmpeg.write_frames
+        self.writer = None # opened with the first frame, whose size is the video size
+
+    def write(self, rgb_frame: np.ndarray) -> None:
+        if self.writer is None:
+            self.writer = self.write_frames(self.path, (rgb_frame.shape[1], rgb_frame.shape[0]), fps=self.fps, macro_block_size=1, ffmpeg_log_level="error")
+            self.writer.send(None)
+        self.writer.send(np.ascontiguousarray(rgb_frame))
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+    # closes ffmpeg after a failed capture and removes the partial video
+    def discard(self) -> None:
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+# background thread: replays the actions and puts the rendered rgb frames in the queue with their wave number, then None once
+# every action is replayed; a failure (error, frame not rendered) is put instead of None, for the main thread to raise
+def capture_frames(backend, actions: list[dict], captured: queue.Queue, stop: threading.Event) -> None:
+    end = None
+    try:
+        for i, action in enumerate(actions):
+            if stop.is_set():
+                break
+            game_state = backend.step(action)
+            if game_state is None:
+                print(f"\nAction {i + 1} was invalid. Continuing.")
+                continue
+            rgb_frame = backend.render()
+            if rgb_frame is None:
+                raise IOError(f"Error rendering frame at action {i + 1}")
+            captured.put((rgb_frame, game_state["waveNumber"]))
+    except Exception as e:
+        end = e
+    finally:
+        captured.put(end)
+
+def main(actions_file, save_frames, load_dir, save_video=None, video_fps=30, encoding_workers=None, local=False, display=True, frames_format="png", load_frames=None, start_frame=0, start_wave=None):
     """
-    Replays a game by either collecting frames from a server or loading them from a directory.
+    Replays a game by either collecting frames from a server or loading them from a frame store file or a directory.
+    The collected frames are shown and saved while the game is replayed (only their compressed encoding is kept in memory),
+    the loaded ones are decoded while they are played.
     """
+    import cv2
+
     frames = []
+    starts = {} # wave number -> first frame
     target_wave = 0
 
     # --- Determine the mode: Load from disk or collect from server ---
-    if load_dir:
-        # --- Load frames from a directory ---
+    if load_frames:
+        # --- Open a frame store, the frames are decoded when played ---
+        print(f"--- Opening frame store: {load_frames} ---")
+        try:
+            frames = FrameStore(load_frames)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            return
+        starts = frames.wave_starts()
+        target_wave = frames.metadata.get("wave_number", 0)
+        print(f"Opened {len(frames)} frames.")
+
+    elif load_dir:
+        # --- List the frames of a directory, read when played ---
         print(f"--- Loading frames from directory: {load_dir} ---")
         if not os.path.isdir(load_dir):
             print(f"Error: Directory not found at '{load_dir}'")
             return
-        
-        try:
-            # Get all image files and sort them to ensure correct order
-            image_files = sorted([f for f in os.listdir(load_dir) if f.endswith(('.png', '.jpg', '.jpeg'))])
-            if len(image_files) == 0:
-                print(f"Error: No image files found in '{load_dir}'")
-                return
-
-            start_time = datetime.datetime.now()
-            for i, filename in enumerate(image_files):
-                print(f"Loading frame {i + 1}/{len(image_files)}...", end='\r')
-                frame_path = os.path.join(load_dir, filename)
-                frame = cv2.imread(frame_path)
-                if frame is not None:
-                    frames.append(frame)
-            print(f"Successfully loaded {len(frames)} frames in {(datetime.datetime.now() - start_time).seconds} seconds.")
-        except Exception as e:
-            print(f"An error occurred while loading frames: {e}")
+        frames = FrameDirectory(load_dir)
+        if len(frames) == 0:
+            print(f"Error: No image files found in '{load_dir}'")
             return
+        if frames.wave_numbers is not None:
+            starts = wave_starts(frames.wave_numbers)
+            target_wave = frames.metadata.get("wave_number", 0)
+        print(f"Found {len(frames)} frames (convert the directory with 'python -m gymnasium_env.frame_store' for a faster start).")
 
     elif actions_file:
-        # --- Collect frames from the server ---
-        print(f"--- Collecting frames from server using: {actions_file} ---")
+        # --- Collect frames from the server, streamed to the display and the writers while the game is replayed ---
+        print(f"--- Collecting frames from {'the local simulator' if local else 'server'} using: {actions_file} ---")
         try:
-            with open(actions_file, 'r') as f:
-                data = json.load(f)
-                actions = data["actions"]
-                target_wave = data["wave_number"]
+            data = load_episode_actions(actions_file) # .json or .npz
+            actions = data["actions"]
+            target_wave = data["wave_number"]
         except Exception as e:
             print(f"An error occurred while reading the file: {e}")
             return
 
-        save_dir = None
+        store_path = None
         if save_frames:
             # Get the directory where the actions file is located
             base_dir = os.path.dirname(os.path.abspath(actions_file))
-            # Create the path for the 'best_frames' folder
-            save_dir = os.path.join(base_dir, "best_frames")
-
+            if frames_format == "store":
+                store_path = os.path.join(base_dir, "best_frames.frames")
+                frames = FrameStoreWriter(store_path, workers=encoding_workers, metadata={"wave_number": target_wave, "actions_file": os.path.basename(actions_file)})
+                print(f"Frames will be saved to: {store_path}")
+            else:
+                save_dir = os.path.join(base_dir, "best_frames")
+                frames = PngFrameStore(save_dir, workers=encoding_workers, metadata={"wave_number": target_wave, "actions_file": os.path.basename(actions_file)})
+                print(f"Frames will be saved to: {save_dir}")
+        else:
+            frames = PngFrameStore(workers=encoding_workers)
+        wave_numbers = []
+        video = None
+        backend = None
+        collected = False
+        stop = threading.Event()
         try:
-            requests.post(SET_MAP_ENDPOINT, json=DEFAULT_MAP_WAYPOINTS).raise_for_status()
-            requests.post(RESET_ENDPOINT).raise_for_status()
+            video = VideoFrameWriter(save_video, video_fps) if save_video else None
+            backend = LocalBackend() if local else HttpBackend(SERVER_URL, render_format="raw") # raw pixels if the server supports them, png otherwise
+            if not backend.set_map(DEFAULT_MAP_WAYPOINTS):
+                raise ConnectionError("Failed to set the default map")
+            backend.reset()
 
             start_time = datetime.datetime.now()
-            for i, action in enumerate(actions):
-                print(f"Processing action {i + 1}/{len(actions)}...", end='\r')
-                response = requests.post(STEP_ENDPOINT, json=action)
-                if response.status_code == 400:
-                    error_msg = response.json()["message"]
-                    print(f"\nAction {i + 1} was invalid: {error_msg}. Continuing.")
-                    continue
-                response.raise_for_status()
-                
-                render_response = requests.get(RENDER_ENDPOINT)
-                if render_response.status_code == 400:
-                    error_msg = render_response.json()["message"]
-                    print(f"\nError rendering frame at action {i + 1}: {error_msg}. Stopping.")
-                    break
-                render_response.raise_for_status()
-                
-                image_bytes = BytesIO(render_response.content)
-                image = Image.open(image_bytes).convert("RGB")
-                frame = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-                frames.append(frame)
-            
-            print(f"\nFrame collection complete. Collected {len(frames)} frames in {(datetime.datetime.now() - start_time).seconds} seconds.")
-            # save only after collecting all frames
-            if save_dir:
-                print(f"Frames will be saved to: {save_dir}")
-                os.makedirs(save_dir, exist_ok=True)
-                for i, frame in enumerate(frames):
-                    print(f"Saving frame {i + 1}/{len(frames)}...", end='\r')
-                    frame_filename = os.path.join(save_dir, f"frame_{i:04d}.png")
-                    cv2.imwrite(frame_filename, frame)
-
+            captured = queue.Queue(maxsize=CAPTURE_QUEUE_SIZE)
+            capture_thread = threading.Thread(target=capture_frames, args=(backend, actions, captured, stop), daemon=True)
+            capture_thread.start()
+            live = display
+            while (item := captured.get()) is not None:
+                if isinstance(item, Exception): # the capture failed, the frames collected so far are discarded
+                    raise item
+                rgb_frame, wave_number = item
+                if video:
+                    video.write(rgb_frame)
+                frame = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2BGR)
+                frames.add(frame, wave_number)
+                wave_numbers.append(wave_number)
+                print(f"Captured frame {len(frames)}/{len(actions)}...", end='\r')
+                if live: # progressive display, as fast as the frames arrive
+                    cv2.imshow("Game Replay", frame)
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        print("\nLive display stopped by user, the capture goes on.")
+                        live = False
+            capture_thread.join()
+            frames.close()
+            collected = True
+            print(f"\nFrame collection complete. Collected {len(wave_numbers)} frames in {(datetime.datetime.now() - start_time).seconds} seconds.")
         except Exception as e:
             print(f"\nAn error occurred during frame collection: {e}")
             return
+        finally:
+            stop.set()
+            if not collected: # no partial frames or video left behind
+                frames.discard()
+                if video:
+                    video.discard()
+            elif video:
+                video.close()
+                print(f"Video saved to: {save_video}")
+            if backend is not None:
+                backend.close()
+        starts = wave_starts(wave_numbers)
+        if store_path:
+            frames = FrameStore(store_path)
     else:
-        print("Error: You must provide an actions file (--actions-file) or a directory to load from (--load-dir).")
+        print("Error: You must provide an actions file (--actions-file), a frame store (--load-frames) or a directory to load from (--load-dir).")
         return
 
     # --- Replay collected frames ---
-    if not frames:
+    if len(frames) == 0:
         print("No frames to display. Exiting.")
         return
+    if not display:
+        return
 
     print("\n--- Starting replay ---")
     if target_wave != 0:
         print(f"Episode reached wave: {target_wave}")
-    print("Press 'q' to quit.")
+    if start_wave is not None:
+        if start_wave not in starts:
+            print(f"Wave {start_wave} not found in the frames (waves: {sorted(starts) or 'unknown'}).")
+            return
+        start_frame = starts[start_wave]
+    play(frames, starts, min(max(start_frame, 0), len(frames) - 1))
+
+# shows the frames from start_frame, seeking with the keys (by frame number and by wave when the wave starts are known)
+def play(frames, starts: dict[int, int], start_frame: int) -> None:
+    import cv2
 
+    print(f"Keys: 'q' quit, space pause, ',' '.' previous/next frame, 'a' 'd' back/forward {SCRUB_FRAMES} frames" + (", 's' 'w' previous/next wave" if starts else "") + ", 'r' replay.")
+    wave_frames = sorted(starts.values())
+    index = start_frame
+    paused = False
     while True:
-        for frame in frames:
-            cv2.imshow("Game Replay", frame)
-            if cv2.waitKey(PLAYBACK_SPEED_MS) & 0xFF == ord('q'):
-                print("Playback stopped by user.")
-                return
-        
-        print("\nReplay finished. Press 'q' to quit or 'r' to replay.")
-        while True:
-            key = cv2.waitKey(0) & 0xFF
-            if key == ord('q'):
-                print("Exiting.")
-                return
-            elif key == ord('r'):
-                print("Replaying...")
-                break
+        cv2.imshow("Game Replay", frames[index])
+        at_end = index == len(frames) - 1
+        if at_end and not paused:
+            print("\nReplay finished. Press 'q' to quit or 'r' to replay.")
+            paused = True
+        key = cv2.waitKey(0 if paused else PLAYBACK_SPEED_MS) & 0xFF
+        if key == ord('q'):
+            print("Playback stopped by user.")
+            return
+        elif key == ord(' '):
+            paused = not paused
+        elif key == ord('r'):
+            print("Replaying...")
+            index, paused = 0, False
+        elif key in (ord(','), ord('.')):
+            index, paused = index + (1 if key == ord('.') else -1), True
+        elif key in (ord('a'), ord('d')):
+            index += SCRUB_FRAMES if key == ord('d') else -SCRUB_FRAMES
+        elif key == ord('w'):
+            index = next((frame for frame in wave_frames if frame > index), index)
+        elif key == ord('s'):
+            index = next((frame for frame in reversed(wave_frames) if frame < index), index)
+        elif not paused:
+            index += 1
+        index = min(max(index, 0), len(frames) - 1)
+        if index < len(frames) - 1 and key in (ord('a'), ord('d'), ord('w'), ord('s'), ord('r')):
+            print(f"Frame {index + 1}/{len(frames)}")
 
 def parse_arguments():
-    parser = argparse.ArgumentParser(description="Replay a Tower Defense game from a saved actions file or a directory of frames.")
-    parser.add_argument("--actions-file", help="Path to the JSON actions file.")
-    parser.add_argument("--save-frames", action="store_true", help="Optional. Save frames to a 'best_frames' directory next to the actions file.")
+    parser = argparse.ArgumentParser(description="Replay a Tower Defense game from a saved actions file, a frame store file or a directory of frames.")
+    parser.add_argument("--actions-file", help="Path to the JSON (or NPZ) actions file.")
+    parser.add_argument("--save-frames", action="store_true", help="Optional. Save the frames next to the actions file: a 'best_frames' directory of png files (or a 'best_frames.frames' store file with --frames-format store).")
+    parser.add_argument("--frames-format", choices=["png", "store"], default="png", help="Optional. Format of the saved frames: a directory of png files or a single frame store file (fast to open and to seek).")
+    parser.add_argument("--load-frames", help="Optional. Frame store file to replay (see --save-frames, or convert a frames directory with 'python -m gymnasium_env.frame_store').")
     parser.add_argument("--load-dir", help="Optional. Directory to load frames.")
+    parser.add_argument("--start-frame", type=int, default=0, help="Optional. Frame the replay starts from.")
+    parser.add_argument("--start-wave", type=int, help="Optional. Wave the replay starts from (not for the directories saved without their waves).")
+    parser.add_argument("--save-video", help="Optional. Path of an mp4 video written while the frames are collected.")
+    parser.add_argument("--video-fps", type=int, default=30, help="Optional. Frames per second of the saved video.")
+    parser.add_argument("--encoding-workers", type=int, help="Optional. Threads compressing the frames (default: number of CPUs).")
+    parser.add_argument("--local", action="store_true", help="Optional. Replay on the in-process game simulator (estimated rules, not checked against the game server) instead of the game server.")
+    parser.add_argument("--no-display", action="store_true", help="Optional. Only collect and save the frames, without any window.")
     return parser.parse_args()
 
 if __name__ == "__main__":
     args = parse_arguments()
     try:
-        main(args.actions_file, args.save_frames, args.load_dir)
+        main(args.actions_file, args.save_frames, args.load_dir, args.save_video, args.video_fps, args.encoding_workers, args.local, not args.no_display, args.frames_format, args.load_frames, args.start_frame, args.start_wave)
     finally:
-        cv2.destroyAllWindows()
\ No newline at end of file
+        if not args.no_display:
+            import cv2
+
+            cv2.destroyAllWindows()
@@ -0,0 +1,59 @@
+from urllib.parse import urlsplit, parse_qs, urlencode
+import numpy as np
+import pytest
+import gymnasium_env.envs  # ensure the custom environment is registered
+from gymnasium_env.standin_server import StandInServer, StandInRequestHandler
+
+# stand-in of a game server without the multi-tick endpoint: ?ticks=k is ignored, every step advances one tick and has no "ticks" summaries
+class SingleTickRequestHandler(StandInRequestHandler):
+    def do_POST(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        query.pop("ticks", None)
+        self.path = url.path + (f"?{urlencode(query, doseq=True)}" if query else "")
+        super().do_POST()
+
+def start_server(handler=StandInRequestHandler):
+    server = StandInServer(0) # any free port
+    server.RequestHandlerClass = handler
+    server.start()
+    return server
+
+@pytest.fixture
+def standin_url():
+    server = start_server()
+    yield f"http://localhost:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def single_tick_url():
+    server = start_server(SingleTickRequestHandler)
+    yield f"http://localhost:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+# plays steps with a flat action mode env: NOOP most of the time, a random legal build otherwise (the games last and towers
+# pile up), returns the observations (as bytes, or dicts of bytes), rewards and ends of the steps
+@pytest.fixture
+def play():
+    def play(env, steps: int, seed: int = 0) -> list:
+        rng = np.random.default_rng(seed)
+        observation, _ = env.reset(seed=seed)
+        trajectory = [as_bytes(observation)]
+        for _ in range(steps):
+            legal = np.flatnonzero(env.unwrapped.action_masks())
+            action = legal[0] if rng.random() < 0.8 else rng.choice(legal) # legal[0] is NOOP
+            observation, reward, terminated, truncated, _ = env.step(action)
+            trajectory.append((as_bytes(observation), reward, terminated, truncated))
+            if terminated or truncated:
+                observation, _ = env.reset()
+                trajectory.append(as_bytes(observation))
+        env.close()
+        return trajectory
+    return play
+
+def as_bytes(observation):
+    if isinstance(observation, dict):
+        return {key: value.tobytes() for key, value in observation.items()}
+    return observation.tobytes()
@@ -0,0 +1,56 @@
+import os
+import gymnasium as gym
+import numpy as np
+import pytest
+
+pytest.importorskip("imageio_ffmpeg")
+from gymnasium_env.wrappers.async_record_video import AsyncRecordVideo
+
+# episodes of episode_length steps rendering a gray frame
+class FrameEnv(gym.Env):
+    metadata = {"render_modes": ["rgb_array"], "render_fps": 30}
+    observation_space = gym.spaces.Discrete(1)
+    action_space = gym.spaces.Discrete(1)
+
+    def __init__(self, episode_length: int = 20):
+        self.render_mode = "rgb_array"
+        self.episode_length = episode_length
+        self.steps = 0
+
+    def reset(self, seed=None, options=None):
+        self.steps = 0
+        return 0, {}
+
+    def step(self, action):
+        self.steps += 1
+        return 0, 0.0, self.steps >= self.episode_length, False, {}
+
+    def render(self):
+        return np.full((48, 64, 3), self.steps % 256, dtype=np.uint8)
+
+def play_episode(env) -> dict:
+    env.reset()
+    while True:
+        _, _, terminated, truncated, info = env.step(0)
+        if terminated or truncated:
+            return info
+
+def test_records_video(tmp_path):
+    env = AsyncRecordVideo(FrameEnv(), str(tmp_path), episode_trigger=lambda episode: episode == 0)
+    info = play_episode(env)
+    play_episode(env) # not recorded
+    env.close()
+    assert info["video_recording"]["frames"] == 21 # the reset frame and one per step
+    assert os.listdir(tmp_path) == ["rl-video-episode-0.mp4"]
+
+# the encoder thread failing must not leave the training loop waiting on the full frame queue
+def test_encoder_error_is_raised(tmp_path):
+    def failing_writer(*args, **kwargs):
+        raise OSError("ffmpeg not found")
+
+    env = AsyncRecordVideo(FrameEnv(episode_length=1000), str(tmp_path), episode_trigger=lambda episode: True, queue_size=4)
+    env.write_frames = failing_writer
+    with pytest.raises(RuntimeError, match="ffmpeg not found"):
+        play_episode(env)
+    with pytest.raises(RuntimeError, match="ffmpeg not found"):
+        env.close()
@@ -0,0 +1,65 @@
+import os
+import numpy as np
+import pytest
+from gymnasium_env.frame_store import FrameStore, FrameStoreWriter, NO_WAVE
+
+# frames changing a few pixels at a time, as replay frames do
+def random_frames(count: int, seed: int = 0) -> list[np.ndarray]:
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 256, (24, 32, 3), dtype=np.uint8)
+    frames = []
+    for _ in range(count):
+        frame = frame.copy()
+        frame[rng.integers(0, 24, 5), rng.integers(0, 32, 5)] = rng.integers(0, 256, (5, 3), dtype=np.uint8)
+        frames.append(frame)
+    return frames
+
+def test_frames_read_back(tmp_path):
+    path = str(tmp_path / "replay.frames")
+    frames = random_frames(50)
+    with FrameStoreWriter(path, keyframe_interval=8, workers=2, max_pending=3, metadata={"map": "default"}) as writer:
+        for i, frame in enumerate(frames):
+            writer.add(frame, i // 10)
+    assert os.listdir(tmp_path) == ["replay.frames"]
+
+    with FrameStore(path) as store:
+        assert len(store) == 50
+        assert store.metadata == {"map": "default"}
+        assert store.wave_starts() == {wave: 10 * wave for wave in range(5)}
+        assert all(np.array_equal(frame, expected) for frame, expected in zip(store, frames))
+        # random access, backwards and across keyframes (the last decoded frame is not the start of the next one)
+        for i in np.random.default_rng(1).permutation(50):
+            assert np.array_equal(store[int(i)], frames[i])
+        for i in (-1, -8, -9, -50):
+            assert np.array_equal(store[i], frames[i])
+        with pytest.raises(IndexError):
+            store[50]
+        with pytest.raises(IndexError):
+            store[-51]
+
+# the returned frames are copies: changing one changes neither the store nor the frames read after it
+def test_frames_are_copies(tmp_path):
+    path = str(tmp_path / "replay.frames")
+    frames = random_frames(10)
+    with FrameStoreWriter(path, keyframe_interval=4) as writer:
+        for frame in frames:
+            writer.add(frame)
+    with FrameStore(path) as store:
+        assert store.wave_numbers.tolist() == [NO_WAVE] * 10
+        keyframe = store[4]
+        keyframe[:] = 0
+        frame = store[5]
+        frame[:] = 0
+        assert np.array_equal(store[6], frames[6])
+        assert np.array_equal(store[4], frames[4])
+        assert np.array_equal(store[5], frames[5])
+
+# a capture failing while the frames are written leaves neither the store nor its temporary file
+def test_discard(tmp_path):
+    path = str(tmp_path / "replay.frames")
+    with pytest.raises(RuntimeError):
+        with FrameStoreWriter(path, keyframe_interval=4) as writer:
+            for frame in random_frames(10):
+                writer.add(frame)
+            raise RuntimeError("capture failed")
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,60 @@
+import glob
+import os
+import numpy as np
+import pytest
+from compare_backends import record_trajectory, replay_trajectory, load_trajectory, save_trajectory
+from gymnasium_env.envs.backends import HttpBackend
+from gymnasium_env.envs.local_game import ESTIMATED_RULES
+
+# server trajectories recorded with compare_backends.py --save-trajectory tests/trajectories/<name>.json.gz, each one is
+# replayed on the local game with the estimated rules (a trajectory of the game server failing here means the estimates are off)
+TRAJECTORY_FILES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "trajectories", "*.json*")))
+
+# builds of random towers on random cells (many refused: locked, occupied, too expensive) between NOOPs
+def random_actions(game_info: dict, count: int, seed: int = 0) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    map_info = game_info["map"]
+    actions = []
+    for _ in range(count):
+        if rng.random() < 0.8:
+            actions.append({"type": "NOOP"})
+        else:
+            x = int(rng.integers(map_info["width"] // map_info["cell_size"])) * map_info["cell_size"]
+            y = int(rng.integers(map_info["height"] // map_info["cell_size"])) * map_info["cell_size"]
+            tower = game_info["towers"][int(rng.integers(len(game_info["towers"])))]
+            actions.append({"type": "BUILD_TOWER", "towerType": tower["type"], "position": {"x": x, "y": y}})
+    return actions
+
+def record(url: str, count: int) -> dict:
+    server = HttpBackend(url)
+    try:
+        return record_trajectory(server, random_actions(server.info(), count))
+    finally:
+        server.close()
+
+# without any trajectory the test is reported as skipped (not silently dropped as an empty parameter set)
+NO_TRAJECTORY = pytest.param(None, marks=pytest.mark.skip(reason="no game server trajectory in tests/trajectories (record one with compare_backends.py --save-trajectory)"), id="no-trajectory")
+
+@pytest.mark.parametrize("path", TRAJECTORY_FILES or [NO_TRAJECTORY], ids=lambda path: os.path.basename(path) if path else "no-trajectory")
+def test_local_game_replays_server_trajectory(path):
+    mismatches = replay_trajectory(load_trajectory(path))
+    assert not mismatches, f"{len(mismatches)} mismatches:\n" + "\n".join(mismatches[:20])
+
+# TD_SERVER_URL: a game server (started fresh or on its default map) to compare the local game with
+@pytest.mark.skipif("TD_SERVER_URL" not in os.environ, reason="no game server (set TD_SERVER_URL)")
+def test_local_game_matches_live_server():
+    mismatches = replay_trajectory(record(os.environ["TD_SERVER_URL"], 3000))
+    assert not mismatches, f"{len(mismatches)} mismatches:\n" + "\n".join(mismatches[:20])
+
+# checks the replay harness only, not the rules (the stand-in server runs the local game, so its trajectories always replay):
+# a trajectory survives the file round trip and a change of rules is reported as mismatches
+def test_replay_reports_rule_changes(standin_url, tmp_path):
+    path = str(tmp_path / "standin.json.gz")
+    save_trajectory(path, record(standin_url, 3000))
+    trajectory = load_trajectory(path)
+    assert [step["state"] for step in trajectory["steps"] if step["state"] is not None][-1]["waveNumber"] >= 5
+    assert replay_trajectory(trajectory) == []
+
+    for rules in ({"starting_money": 140}, {"wave_enemies_per_wave": 3}, {"wave_health_growth": 0.2}):
+        mismatches = replay_trajectory(trajectory, {**ESTIMATED_RULES, **rules})
+        assert mismatches, f"{rules} not detected"
@@ -0,0 +1,78 @@
+import gymnasium as gym
+import numpy as np
+import pytest
+from benchmarks.observation_encoding import legacy_encode, random_state
+from conftest import start_server
+from gymnasium_env.envs.backends import LocalBackend
+from gymnasium_env.envs.local_game import default_game_info
+from gymnasium_env.envs.map_registry import MapTables
+from gymnasium_env.envs.observation import ObservationEncoder
+from gymnasium_env.envs.state_delta import EntityMirror
+
+# the vectorized encoder gives the bytes of the per-entity loop encoder it replaced, slots emptied between states included
+def test_encoder_matches_loop_encoder():
+    game_info = default_game_info()
+    encoder = ObservationEncoder(game_info, [0.5] * 100, max_towers=60, max_enemies=40)
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        game_state = random_state(game_info, rng, int(rng.integers(0, 61)), int(rng.integers(0, 41)))
+        assert encoder.encode(game_state).tobytes() == legacy_encode(game_info, encoder, game_state).tobytes()
+
+# same on the states of games played on the stand-in server: the flat observations of the env are the loop encoding of the
+# state the server sent (read from its game)
+def test_env_observations_match_loop_encoder():
+    server = start_server()
+    try:
+        env = gym.make("gymnasium_env/TowerDefenseWorld-v0", url=f"http://localhost:{server.server_address[1]}/", action_mode="flat")
+        game_info = env.unwrapped.game_info
+        rng = np.random.default_rng(0)
+        observation, _ = env.reset(seed=0)
+        encoded_entities = 0
+        for _ in range(1500):
+            game_state = server.game.state()
+            assert observation.tobytes() == legacy_encode(game_info, env.unwrapped.observation_encoder, game_state).tobytes()
+            encoded_entities += len(game_state["towers"]) + len(game_state["enemies"])
+            legal = np.flatnonzero(env.unwrapped.action_masks())
+            action = legal[0] if rng.random() < 0.8 else rng.choice(legal)
+            observation, _, terminated, truncated, _ = env.step(action)
+            if terminated or truncated:
+                observation, _ = env.reset()
+        env.close()
+        assert encoded_entities > 0
+    finally:
+        server.shutdown()
+        server.server_close()
+
+# more towers or enemies than the slots of the observation is an error with whole states and with the mirror of the delta
+# responses alike (the mirror slots beyond the observation are not left out)
+@pytest.mark.parametrize("limits", [{"max_towers": 2, "max_enemies": 40}, {"max_towers": 60, "max_enemies": 3}])
+def test_delta_and_full_overflow(limits):
+    full, delta = LocalBackend(), LocalBackend(delta=True)
+    game_info = full.info()
+    cell_size = game_info["map"]["cell_size"]
+    tables = MapTables(game_info, "default")
+    full_encoder = ObservationEncoder(game_info, tables.path_cells_coordinates_normalized, **limits)
+    delta_encoder = ObservationEncoder(game_info, tables.path_cells_coordinates_normalized, **limits)
+    mirror = EntityMirror(game_info)
+    full.reset()
+    mirror.apply(delta.reset())
+    free_cells = np.argwhere(~tables.path_grid)
+    for step in range(2000):
+        action = {"type": "NOOP"}
+        if step < len(free_cells) and step % 10 == 0:
+            x, y = free_cells[step]
+            action = {"type": "BUILD_TOWER", "towerType": game_info["towers"][0]["type"], "position": {"x": cell_size * (x + 0.5), "y": cell_size * (y + 0.5)}}
+        state = full.step(action)
+        game_state = mirror.apply(delta.step(action)) if state is not None else None
+        if state is None:
+            continue
+        if len(state["towers"]) > limits["max_towers"] or len(state["enemies"]) > limits["max_enemies"]:
+            break
+        full_encoder.encode(state)
+        delta_encoder.encode_mirror(mirror, game_state)
+    else:
+        pytest.fail("the limits were never exceeded")
+    with pytest.raises(ValueError, match="Too many"):
+        full_encoder.encode(state)
+    with pytest.raises(ValueError, match="Too many"):
+        delta_encoder.encode_mirror(mirror, game_state)
@@ -0,0 +1,31 @@
+import json
+import os
+import pytest
+
+pytest.importorskip("cv2")
+import replay_actions
+from gymnasium_env.envs.backends import LocalBackend
+
+@pytest.fixture
+def actions_file(tmp_path):
+    path = tmp_path / "best_episode_actions.json"
+    path.write_text(json.dumps({"game_time": 5, "wave_number": 1, "actions": [{"type": "NOOP"}] * 50}))
+    return str(path)
+
+@pytest.mark.parametrize("frames_format", ["png", "store"])
+def test_capture_saves_frames(actions_file, tmp_path, frames_format):
+    replay_actions.main(actions_file, True, None, local=True, display=False, frames_format=frames_format)
+    saved = "best_frames" if frames_format == "png" else "best_frames.frames"
+    assert sorted(os.listdir(tmp_path)) == sorted(["best_episode_actions.json", saved])
+
+# a frame the backend fails to render ends the capture as a failure: no partial frames or video are kept
+@pytest.mark.parametrize("frames_format", ["png", "store"])
+def test_failed_capture_is_discarded(actions_file, tmp_path, monkeypatch, frames_format):
+    render = LocalBackend.render
+    rendered = []
+    def failing_render(self, scale=1):
+        rendered.append(scale)
+        return render(self, scale) if len(rendered) <= 10 else None
+    monkeypatch.setattr(LocalBackend, "render", failing_render)
+    replay_actions.main(actions_file, True, None, save_video=str(tmp_path / "replay.mp4"), local=True, display=False, frames_format=frames_format)
+    assert os.listdir(tmp_path) == ["best_episode_actions.json"]
@@ -0,0 +1,63 @@
+import gymnasium as gym
+import numpy as np
+import pytest
+from gymnasium_env.envs.backends import LocalBackend
+from gymnasium_env.envs.state_delta import EntityMirror
+
+# the mirror patched by the delta responses has the towers and enemies of the whole state after every step
+def test_mirror_matches_whole_state():
+    full, delta = LocalBackend(), LocalBackend(delta=True)
+    game_info = full.info()
+    cell_size = game_info["map"]["cell_size"]
+    mirror = EntityMirror(game_info, tower_capacity=4, enemy_capacity=4) # grown while playing
+    full.reset()
+    mirror.apply(delta.reset())
+    rng = np.random.default_rng(0)
+    for step in range(1500):
+        action = {"type": "NOOP"}
+        if rng.random() < 0.1:
+            x, y = rng.integers(0, game_info["map"]["width"] // cell_size), rng.integers(0, game_info["map"]["height"] // cell_size)
+            tower_type = game_info["towers"][rng.integers(0, len(game_info["towers"]))]["type"]
+            action = {"type": "BUILD_TOWER", "towerType": tower_type, "position": {"x": cell_size * (x + 0.5), "y": cell_size * (y + 0.5)}}
+        ticks = int(rng.integers(1, 4))
+        state = full.step(action, ticks)
+        payload = delta.step(action, ticks)
+        assert (state is None) == (payload is None)
+        if state is None:
+            continue
+        game_state = mirror.apply(payload)
+        assert list(game_state.towers) == state["towers"]
+        assert list(game_state.enemies) == state["enemies"]
+        assert game_state.summary() == {"enemyCount": len(state["enemies"]), "waveNumber": state["waveNumber"], "money": state["money"], "lives": state["lives"], "gameOver": state["gameOver"]}
+        if state["gameOver"]:
+            break
+    assert len(mirror.towers) > 0
+
+# same observations and rewards with delta and whole states (the grid observation does not depend on the entity order)
+def test_delta_env_matches_full_env(play):
+    options = dict(action_mode="flat", observation_mode="grid", frame_skip=3)
+    full = play(gym.make("gymnasium_env/TowerDefenseWorldLocal-v0", **options), 400)
+    delta = play(gym.make("gymnasium_env/TowerDefenseWorldLocal-v0", state_updates="delta", **options), 400)
+    assert delta == full
+
+# a server without the multi-tick endpoint gets the skipped ticks as NOOP steps: in delta mode every response must be applied
+# to the mirror and the tick rewards counted from the enemies of the whole state, not from the keys of the delta payloads
+@pytest.mark.parametrize("state_updates", ["full", "delta"])
+def test_frame_skip_without_tick_summaries(play, single_tick_url, state_updates):
+    options = dict(action_mode="flat", observation_mode="grid", frame_skip=4)
+    local = play(gym.make("gymnasium_env/TowerDefenseWorldLocal-v0", **options), 300)
+    http = play(gym.make("gymnasium_env/TowerDefenseWorld-v0", url=single_tick_url, state_updates=state_updates, **options), 300)
+    assert http == local
+
+# state_updates sets the delta and typed_states options of the backend, whatever backend_options has
+@pytest.mark.parametrize("state_updates", ["full", "delta"])
+def test_state_updates_over_backend_options(state_updates):
+    env = gym.make("gymnasium_env/TowerDefenseWorldLocal-v0", state_updates=state_updates, backend_options={"delta": True, "typed_states": True})
+    assert (env.unwrapped.backend.delta_encoder is not None) == (state_updates == "delta")
+    assert env.unwrapped.backend.typed_states == (state_updates == "full")
+    env.close()
+
+@pytest.mark.parametrize("frame_skips", [{"frame_skip": 0}, {"frame_skip": 4, "max_idle_frame_skip": 2}])
+def test_invalid_frame_skip(frame_skips):
+    with pytest.raises(ValueError, match="frame skip"):
+        gym.make("gymnasium_env/TowerDefenseWorldLocal-v0", **frame_skips)
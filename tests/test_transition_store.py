@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from gymnasium_env.transition_store import TransitionDataset, TransitionStoreWriter
+
+# episodes of random sparse observations (a Box observation, or a Dict one), returned as the list of their transitions
+def record(directory: str, episodes: int, dict_observations: bool = False, shard_size: int = 16, seed: int = 0) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    writer = TransitionStoreWriter(directory, shard_size=shard_size)
+    transitions = []
+    for _ in range(episodes):
+        length = int(rng.integers(3, 12))
+        for step in range(length):
+            box = np.where(rng.random(40) < 0.2, rng.standard_normal(40), 0).astype(np.float32)
+            observation = {"globals": box[:8], "towers": box[8:].reshape(4, 8)} if dict_observations else box
+            transition = {"observation": observation, "action": rng.integers(0, 5, 3), "mask": rng.random(11) < 0.5,
+                          "reward": float(rng.standard_normal()), "done": step == length - 1}
+            writer.add(transition["observation"], transition["action"], transition["mask"], transition["reward"], transition["done"])
+            transitions.append(transition)
+        writer.end_episode()
+    writer.close()
+    return transitions
+
+def check_batch(dataset: TransitionDataset, transitions: list[dict], indices: np.ndarray) -> None:
+    batch = dataset.batch(indices)
+    for position, i in enumerate(indices):
+        expected = transitions[i]
+        if isinstance(expected["observation"], dict):
+            for key, value in expected["observation"].items():
+                assert np.array_equal(batch["observations"][key][position], value)
+        else:
+            assert np.array_equal(batch["observations"][position], expected["observation"])
+        assert np.array_equal(batch["actions"][position], expected["action"])
+        assert np.array_equal(batch["masks"][position], expected["mask"])
+        assert batch["rewards"][position] == np.float32(expected["reward"])
+        assert batch["dones"][position] == expected["done"]
+
+# the batches have the observations that were written (dense, the zeros included) whatever shards their transitions are in
+@pytest.mark.parametrize("dict_observations", [False, True])
+def test_transitions_read_back(tmp_path, dict_observations):
+    transitions = record(str(tmp_path), 12, dict_observations)
+    dataset = TransitionDataset(str(tmp_path))
+    assert len(dataset) == len(transitions)
+    assert len(dataset.shards) > 1
+    assert dataset.episode_count == 12
+    check_batch(dataset, transitions, np.random.default_rng(1).permutation(len(transitions)))
+
+# a writer opened on an existing store adds its shards after the ones already there
+def test_append_to_store(tmp_path):
+    transitions = record(str(tmp_path), 5) + record(str(tmp_path), 4, seed=1)
+    dataset = TransitionDataset(str(tmp_path))
+    assert len(dataset) == len(transitions)
+    assert dataset.episode_count == 9
+    check_batch(dataset, transitions, np.arange(len(transitions)))
+
+def test_dropped_episode(tmp_path):
+    writer = TransitionStoreWriter(str(tmp_path))
+    for keep in (True, False, True):
+        writer.add(np.ones(4, dtype=np.float32), np.zeros(1, dtype=np.int64), np.ones(3, dtype=bool), 1.0, True)
+        writer.end_episode(keep)
+    writer.close()
+    assert len(writer) == 2
+    assert TransitionDataset(str(tmp_path)).episode_count == 2
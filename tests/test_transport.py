@@ -0,0 +1,90 @@
+import pytest
+import requests
+from conftest import start_server
+from gymnasium_env.envs.local_game import default_game_info
+from gymnasium_env.envs.transport import HttpTransport, msgpack, MSGPACK_CONTENT_TYPE
+from gymnasium_env.standin_server import StandInRequestHandler
+
+# stand-in closing the connection without answering the first server.drops requests (as a server restarting or a dropped
+# keep-alive connection), server.requests counts the requests received
+class DroppingRequestHandler(StandInRequestHandler):
+    def do_GET(self):
+        if not self.__dropped():
+            super().do_GET()
+
+    def do_POST(self):
+        if not self.__dropped():
+            super().do_POST()
+
+    def __dropped(self) -> bool:
+        self.server.requests += 1
+        if self.server.drops > 0:
+            self.server.drops -= 1
+            self.close_connection = True
+            return True
+        return False
+
+@pytest.fixture
+def dropping_server():
+    server = start_server(DroppingRequestHandler)
+    server.requests, server.drops = 0, 0
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def url_of(server) -> str:
+    return f"http://localhost:{server.server_address[1]}/"
+
+def test_json_requests(standin_url):
+    transport = HttpTransport(standin_url, encoding="json")
+    assert transport.decode(transport.get("info")) == default_game_info()
+    state = transport.decode(transport.post("step", {"type": "NOOP"}))
+    assert state["gameTime"] == pytest.approx(0.1)
+    assert not transport.send_msgpack
+    transport.close()
+
+@pytest.mark.skipif(msgpack is None, reason="msgpack not installed")
+def test_msgpack_negotiation(standin_url):
+    transport = HttpTransport(standin_url) # "auto"
+    assert not transport.send_msgpack
+    response = transport.get("info")
+    assert response.headers["Content-Type"] == MSGPACK_CONTENT_TYPE
+    assert transport.decode(response) == default_game_info()
+    assert transport.send_msgpack # the request bodies are msgpack from now on
+    assert transport.decode(transport.post("step", {"type": "NOOP"}))["gameTime"] == pytest.approx(0.1)
+    transport.close()
+
+def test_get_retried(dropping_server):
+    dropping_server.drops = 2
+    transport = HttpTransport(url_of(dropping_server), retries=2)
+    assert transport.decode(transport.get("info")) == default_game_info()
+    assert dropping_server.requests == 3
+    transport.close()
+
+def test_get_retries_exhausted(dropping_server):
+    dropping_server.drops = 3
+    transport = HttpTransport(url_of(dropping_server), retries=2)
+    with pytest.raises(requests.ConnectionError):
+        transport.get("info")
+    assert dropping_server.requests == 3
+    transport.close()
+
+# a POST may have changed the game before the connection dropped, it is never sent twice
+def test_post_not_retried(dropping_server):
+    dropping_server.drops = 1
+    transport = HttpTransport(url_of(dropping_server), retries=2)
+    with pytest.raises(requests.ConnectionError):
+        transport.post("step", {"type": "NOOP"})
+    assert dropping_server.requests == 1
+    assert transport.decode(transport.post("step", {"type": "NOOP"}))["gameTime"] == pytest.approx(0.1)
+    transport.close()
+
+def test_connection_refused():
+    server = start_server()
+    url = url_of(server)
+    server.shutdown()
+    server.server_close()
+    transport = HttpTransport(url, timeout=(0.5, 0.5), retries=1)
+    with pytest.raises(requests.ConnectionError):
+        transport.get("info")
+    transport.close()
@@ -3,89 +3,195 @@ import gymnasium_env.envs  # ensure the custom environment is registered
 import gymnasium as gym
 import logging
 import datetime
+import os
+import shlex
+import sys
 from stable_baselines3.common.callbacks import CheckpointCallback
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
 from sb3_contrib import MaskablePPO
+from gymnasium_env.envs.action_log import save_episode_actions
+from gymnasium_env.envs.info_cache import info_cache_options
+from gymnasium_env.transition_store import TransitionDataset
+from gymnasium_env.server_pool import ServerPool
 from gymnasium_env.wrappers.random_map_wrapper import RandomMapWrapper
+from gymnasium_env.wrappers.start_state_wrapper import StartStateWrapper
+from gymnasium_env.wrappers.transition_recorder import TransitionRecorder
 from gymnasium_env.wrappers.wrap import wrap_env
 from custom_callbacks.tensor_board_info import TensorboardInfoCallback
 from custom_callbacks.save_agent_actions import SaveAgentActionsCallback
+from custom_callbacks.perf_info import PerfInfoCallback
+from custom_callbacks.time_budget import TimeBudgetCallback
+from custom_policies.behavior_cloning import pretrain_policy
+from custom_policies.feature_extractors import EntitySetExtractor, GridExtractor
 import argparse
 
 hours_to_train = 8
 video_number = 10 # number of videos to record during training
 
-mean_time_fps = 330 # ~mean time/fps from tensor board, steps per second (obviously varies)
+mean_time_fps = 330 # ~mean time/fps from tensor board, steps per second per env (obviously varies, see benchmarks/env_throughput.py)
 mean_episode_steps = 2500 # ~mean steps per episode from tensor board (also varies and it depends on the hours_to_train: more hours, better agent, longer episodes)
 
-training_steps = round(mean_time_fps*hours_to_train*3600) # total number of training steps
-episode_recording_gap = (training_steps/mean_episode_steps) // video_number  # one episode = one game
-
 env_name = "gymnasium_env/TowerDefenseWorld-v0"
+local_env_name = "gymnasium_env/TowerDefenseWorldLocal-v0" # estimated game rules simulated in-process, no server needed
 seed = 87
 
-def main(load_model_path, random_maps_path):
+# policy and feature extractor of each observation mode
+policies = {
+    "flat": ("MlpPolicy", None),
+    "entities": ("MultiInputPolicy", EntitySetExtractor),
+    "grid": ("MultiInputPolicy", GridExtractor),
+}
+
+# returns a function building the rank-th env, only the first env records videos
+# record_dir: the transitions of the episodes are recorded in record_dir/env_<rank> (those reaching record_min_wave if given)
+def make_env(rank, url, local, episode_recording_gap, prefix, map_list, action_mode, frame_skip, observation_mode, profile, start_states, start_state_probability, backend_options=None, record_dir=None, record_min_wave=None):
+    def _init():
+        if local:
+            env = gym.make(local_env_name, action_mode=action_mode, frame_skip=frame_skip, observation_mode=observation_mode, profile=profile)
+        else:
+            env = gym.make(env_name, url=url, backend_options=backend_options, action_mode=action_mode, frame_skip=frame_skip, observation_mode=observation_mode, profile=profile)
+        env = wrap_env(env, episode_recording_gap, prefix, rank=rank, record_video=rank == 0)
+
+        if map_list:
+            env.reset(seed=seed + rank) # set seed for reproducibility (same seed -> same map sequence)
+            env = RandomMapWrapper(env, map_list=map_list)
+        if start_states:
+            env = StartStateWrapper(env, start_states, probability=start_state_probability)
+        if record_dir:
+            env = TransitionRecorder(env, os.path.join(record_dir, f"env_{rank}"), min_wave=record_min_wave)
+        return env
+    return _init
+
+def main(load_model_path, random_maps_path, local, num_envs, server_command, server_dir, base_port, action_mode, frame_skip, observation_mode, profile, hours, actions_format, top_k, start_states_path, start_state_probability, info_cache=None, record_dir=None, record_min_wave=None, pretrain_path=None, pretrain_epochs=5):
     prefix = datetime.datetime.now().strftime("%d.%m.%Y_%H.%M")
 
+    if hours is None:
+        training_steps = round(mean_time_fps*num_envs*hours_to_train*3600) # total number of training steps (over all envs)
+        episode_recording_gap = (training_steps*frame_skip/num_envs/mean_episode_steps) // video_number  # one episode = one game, only the first env records
+    else: # stopped at the deadline by TimeBudgetCallback, which also schedules the checkpoints and videos
+        training_steps = sys.maxsize
+        episode_recording_gap = None
+
     logging.basicConfig(
-        filename="training.log", 
-        level=logging.INFO, 
+        filename="training.log",
+        level=logging.INFO,
         format='%(asctime)s - %(levelname)s - %(message)s'
     )
-    env = gym.make(env_name)
-    env = wrap_env(env, episode_recording_gap, prefix)
 
+    map_list = None
     if random_maps_path:
         with open(random_maps_path, "r") as f:
-            data = json.load(f)
-        env.reset(seed=seed) # set seed for reproducibility (same seed -> same map sequence)
-        env = RandomMapWrapper(env, map_list=data)
-
-    # save 3 checkpoints
-    checkpoint_callback = CheckpointCallback(
-        save_freq=training_steps//3,
-        save_path=f"./models/{prefix}/checkpoints/",
-        name_prefix="maskable_ppo_tower_defense",
-    )
+            map_list = json.load(f)
+
+    start_states = None
+    if start_states_path:
+        with open(start_states_path, "r") as f:
+            start_states = json.load(f) # game snapshots (see capture_start_states.py)
+
+    # one game server per env, either started here or already listening on consecutive ports
+    server_pool = None
+    urls = [f"http://localhost:{base_port + i}/" for i in range(num_envs)]
+    if server_command and not local:
+        server_pool = ServerPool(shlex.split(server_command), num_envs, base_port=base_port, cwd=server_dir)
+        urls = server_pool.start()
+    # the envs read the game info of each map from the cache instead of asking their server
+    backend_options = info_cache_options(info_cache, urls[0]) if info_cache and not local else None
+
+    env_fns = [make_env(rank, urls[rank], local, episode_recording_gap, prefix, map_list, action_mode, frame_skip, observation_mode, profile, start_states, start_state_probability, backend_options, record_dir, record_min_wave) for rank in range(num_envs)]
+    env = SubprocVecEnv(env_fns) if num_envs > 1 else DummyVecEnv(env_fns)
+
+    if hours is None:
+        # save 3 checkpoints (the frequency is counted in vectorized steps)
+        checkpoint_callback = CheckpointCallback(
+            save_freq=max(training_steps//3//num_envs, 1),
+            save_path=f"./models/{prefix}/checkpoints/",
+            name_prefix="maskable_ppo_tower_defense",
+        )
+    else:
+        # stop after the given hours, 3 checkpoints and the videos at even times, from the measured steps per second and episode lengths
+        checkpoint_callback = TimeBudgetCallback(hours, save_path=f"./models/{prefix}/checkpoints/", name_prefix="maskable_ppo_tower_defense", checkpoints=3, videos=video_number, expected_episode_steps=mean_episode_steps)
     # custom tensorboard callback to log wave number and tower counts
     tensorboard_info_callback = TensorboardInfoCallback()
-    # custom callback to save best agent performance
-    save_actions_callback = SaveAgentActionsCallback()
+    # custom callback to save best agent performances (top_k per map)
+    save_actions_callback = SaveAgentActionsCallback(top_k=top_k)
+    callbacks = [checkpoint_callback, tensorboard_info_callback, save_actions_callback]
+    if profile:
+        callbacks.append(PerfInfoCallback()) # env timers and env/learner time split under perf/*
 
     try:
         logging.info(f"--- Starting New Training Run ---")
-        logging.info(f"Environment: {env_name} (reset seed = {seed})")
-        logging.info(f"Total Timesteps: {training_steps} (~{training_steps*0.1/3600:.2f} hours of playing)")
-        logging.info(f"Video Recording Period: {episode_recording_gap} games")
+        logging.info(f"Environment: {local_env_name if local else env_name} x {num_envs} (reset seed = {seed})")
+        if hours is None:
+            logging.info(f"Total Timesteps: {training_steps} (~{training_steps*frame_skip*0.1/3600:.2f} hours of playing)")
+            logging.info(f"Video Recording Period: {episode_recording_gap} games")
+        else:
+            logging.info(f"Time Budget: {hours} hours ({video_number} videos, steps per second measured during training)")
 
         if load_model_path:
             logging.info(f"Loading model from: {load_model_path}")
             model = MaskablePPO.load(load_model_path, env, tensorboard_log="./logs/")
         else:
-            model = MaskablePPO("MlpPolicy", env, verbose=1, tensorboard_log="./logs/")
+            policy, features_extractor_class = policies[observation_mode]
+            policy_kwargs = {"features_extractor_class": features_extractor_class} if features_extractor_class else None
+            model = MaskablePPO(policy, env, policy_kwargs=policy_kwargs, verbose=1, tensorboard_log="./logs/")
+        if pretrain_path:
+            # behavior cloning warm start from recorded episodes (--record-transitions), no game played
+            dataset = TransitionDataset(pretrain_path)
+            logging.info(f"Pretraining on {len(dataset)} transitions ({dataset.episode_count} episodes) from {pretrain_path}")
+            for epoch, (policy_loss, value_loss) in enumerate(pretrain_policy(model, dataset, epochs=pretrain_epochs)):
+                logging.info(f"Pretraining epoch {epoch + 1}/{pretrain_epochs}: policy loss {policy_loss:.4f}, value loss {value_loss:.4f}")
 
         logging.info("Starting model training...")
         start = datetime.datetime.now()
         # do not reset the timestep number if loading a model
-        model.learn(total_timesteps=training_steps, callback=[checkpoint_callback, tensorboard_info_callback, save_actions_callback], reset_num_timesteps=not load_model_path)
-        logging.info(f"Model training completed in {(datetime.datetime.now() - start).total_seconds()/3600:.2f} hours ({hours_to_train} planned).")
+        model.learn(total_timesteps=training_steps, callback=callbacks, reset_num_timesteps=not load_model_path)
+        logging.info(f"Model training completed in {(datetime.datetime.now() - start).total_seconds()/3600:.2f} hours ({hours_to_train if hours is None else hours} planned, {model.num_timesteps} steps).")
 
         model.save(f"./models/{prefix}/maskable_ppo_tower_defense.zip")
         logging.info("Model saved.")
 
         best_performance_data = save_actions_callback.get_best_agent_performance()
-        with open(f"./models/{prefix}/best_episode_actions.json", "w") as f:
-            json.dump(best_performance_data, f)
+        game_info = env.get_attr("game_info", [0])[0] # to decode the logged actions
+        save_episode_actions(f"./models/{prefix}/best_episode_actions.{actions_format}", best_performance_data["game_time"], best_performance_data["wave_number"], best_performance_data["actions"], game_info)
+        if map_list or top_k > 1:
+            os.makedirs(f"./models/{prefix}/best_episodes/", exist_ok=True)
+            for map_name, performances in save_actions_callback.get_top_agent_performances().items():
+                for rank, performance in enumerate(performances):
+                    save_episode_actions(f"./models/{prefix}/best_episodes/{map_name}_{rank}.{actions_format}", performance["game_time"], performance["wave_number"], performance["actions"], game_info)
         logging.info("Best episode actions saved.")
     except Exception as e:
         logging.error(f"An error occurred during training: {e}")
         raise e
+    finally:
+        env.close()
+        if server_pool:
+            server_pool.close()
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Train a MaskablePPO agent on the Tower Defense environment.")
     parser.add_argument("--load-model", help="Optional path to the model zip file.")
     parser.add_argument("--random-maps", help="Optional path to the custom maps JSON file for random map training.")
+    parser.add_argument("--local", action="store_true", help="Optional. Train on the in-process game simulator (estimated rules, not checked against the game server) instead of the game server.")
+    parser.add_argument("--num-envs", type=int, default=1, help="Optional. Number of environments run in parallel (one game server each).")
+    parser.add_argument("--server-command", help="Optional. Command starting one game server (port given by the PORT variable or '{port}'), started once per env.")
+    parser.add_argument("--server-dir", help="Optional. Working directory of the game server command.")
+    parser.add_argument("--base-port", type=int, default=3000, help="Optional. Port of the first game server, the others use the following ports.")
+    parser.add_argument("--action-mode", choices=["multi_discrete", "flat"], default="multi_discrete", help="Optional. 'flat' uses one action per (tower type, cell) build so that every illegal build is masked.")
+    parser.add_argument("--frame-skip", type=int, default=1, help="Optional. Game ticks advanced by each step (one request per step).")
+    parser.add_argument("--observation-mode", choices=["flat", "entities", "grid"], default="flat", help="Optional. 'entities' (capped tower/enemy sets) and 'grid' (uint8 cell channels) are smaller than the padded 'flat' vector.")
+    parser.add_argument("--profile", action="store_true", help="Optional. Time the env steps and their parts, logged in TensorBoard under perf/.")
+    parser.add_argument("--hours", type=float, help="Optional. Train for this wall-clock time instead of the steps estimated from hours_to_train and mean_time_fps (checkpoints and videos scheduled from the measured throughput).")
+    parser.add_argument("--actions-format", choices=["json", "npz"], default="json", help="Optional. Format of the best episode actions file ('npz' is smaller and faster to load).")
+    parser.add_argument("--top-k", type=int, default=1, help="Optional. Number of best episodes saved per map (in the best_episodes directory, with random maps or more than one).")
+    parser.add_argument("--start-states", help="Optional. Path to a JSON file of game snapshots (see capture_start_states.py) to start some episodes from.")
+    parser.add_argument("--start-state-probability", type=float, default=0.5, help="Optional. Share of the episodes started from a snapshot.")
+    parser.add_argument("--record-transitions", help="Optional. Directory where the transitions (observation, action, mask, reward, done) of the episodes are recorded, one store per env, for --pretrain.")
+    parser.add_argument("--record-min-wave", type=int, help="Optional. Only record the episodes reaching this wave.")
+    parser.add_argument("--pretrain", help="Optional. Directory of recorded transitions (see --record-transitions) the policy is trained to imitate before the training (behavior cloning).")
+    parser.add_argument("--pretrain-epochs", type=int, default=5, help="Optional. Passes over the recorded transitions of --pretrain.")
+    parser.add_argument("--info-cache", help="Optional. Directory where the game info of each server version and map is saved, the envs then start without asking their server (the servers must be on their default map at start).")
     return parser.parse_args()
 
 if __name__ == "__main__":
     args = parse_arguments()
-    main(args.load_model, args.random_maps)
\ No newline at end of file
+    main(args.load_model, args.random_maps, args.local, args.num_envs, args.server_command, args.server_dir, args.base_port, args.action_mode, args.frame_skip, args.observation_mode, args.profile, args.hours, args.actions_format, args.top_k, args.start_states, args.start_state_probability, args.info_cache, args.record_transitions, args.record_min_wave, args.pretrain, args.pretrain_epochs)